@@ -1,11 +1,35 @@
 from .main import (
     get_algolia_client,
     get_algolia_indexes_name,
-    get_categories_lvl0_name,
-    get_categories_lvl1_name,
-    get_categories_lvl2_name,
     get_product_by_id,
     get_products_by_category_lvl1,
     get_products_by_category_lvl2,
+    browse_products_pages,
+    iter_products_by_category,
+    attributs_projection,
+    ATTRIBUTS_AFFICHAGE
+)
+from .clients import (
+    get_shared_algolia_client,
+    get_shared_algolia_client_async,
+    register_algolia_client,
+    close_algolia_clients,
+    close_algolia_clients_async
+)
+from .cache import (
+    TTLCache,
+    cache_categories,
+    get_indexes_name_cached,
+    get_categories_cached,
+    get_category_tree_cached,
+    prefetch_category_tree,
+    invalidate_categories,
+    categories_cache_stats
+)
+from .categories import CategoryTree, complement_en_cours, fetch_category_facets, fetch_category_tree
+from .schema import (
+    SchemaIndex,
+    get_schema,
+    rafraichir_schema,
     get_algolia_fields
-)
\ No newline at end of file
+)
@@ -0,0 +1,98 @@
+"""Cache TTL/LRU des lectures de hiérarchie de catégories Algolia.
+
+Les entrées sont indexées par (index, niveau, parent). Le cache vit au niveau du
+processus : il survit donc aux reruns Streamlit et évite de refaire les requêtes
+de facettes à chaque interaction avec un widget.
+"""
+
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.cache_memoire import TTLCache
+from backend.GET.categories import NIVEAUX_CATEGORIES, fetch_category_tree
+from backend.GET.main import get_algolia_indexes_name
+
+
+cache_categories = TTLCache(
+    ttl=float(os.getenv("CATEGORIES_CACHE_TTL", "600")),
+    max_entries=int(os.getenv("CATEGORIES_CACHE_SIZE", "4096")),
+)
+
+
+def get_indexes_name_cached():
+    """Version mise en cache de `get_algolia_indexes_name`."""
+
+    return cache_categories.get_or_load((None, "indexes", None), get_algolia_indexes_name)
+
+
+def get_categories_cached(index_name, niveau, parent=None):
+    """
+    Retourne les catégories d'un niveau (filtrées par le parent pour les niveaux 1 et 2), via le cache.
+    En cas d'absence, toute la hiérarchie de l'index est préchargée (`prefetch_category_tree`) :
+    les listes ne sont pas tronquées et les autres niveaux sont servis par le cache ensuite.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        niveau (int): 0, 1 ou 2.
+        parent (str, optionnel): Chemin complet de la catégorie parente (niveaux 1 et 2).
+    Returns:
+        list: Chemins complets des catégories.
+    """
+    if niveau not in NIVEAUX_CATEGORIES:
+        raise ValueError(f"Niveau de catégorie inconnu : {niveau}")
+    parent = parent.strip() if parent else None
+    trouve, valeur = cache_categories.get((index_name, niveau, parent))
+    if trouve:
+        return valeur
+    arbre = get_category_tree_cached(index_name)
+    if niveau > 0 and arbre.level(parent) != niveau - 1:
+        return []
+    return arbre.children(parent)
+
+
+def prefetch_category_tree(index_name):
+    """
+    Précharge toute la hiérarchie de catégories d'un index dans le cache avec une seule requête.
+    Si les facettes sont tronquées, l'arbre est complété en arrière-plan (parcours browse)
+    puis remplace l'arbre partiel dans le cache.
+    Returns:
+        CategoryTree: Arbre des catégories, également mis en cache.
+    """
+    arbre = fetch_category_tree(index_name, apres_complement=lambda complet: _mettre_en_cache(index_name, complet))
+    # Un complément déjà terminé n'est pas écrasé par l'arbre partiel
+    trouve, actuel = cache_categories.get((index_name, "tree", None))
+    if trouve and len(actuel) > len(arbre):
+        return actuel
+    return _mettre_en_cache(index_name, arbre)
+
+
+def _mettre_en_cache(index_name, arbre):
+    cache_categories.set((index_name, "tree", None), arbre)
+    cache_categories.set((index_name, 0, None), arbre.children(None))
+    for niveau in NIVEAUX_CATEGORIES[1:]:
+        for parent in arbre.by_level(niveau - 1):
+            cache_categories.set((index_name, niveau, parent), arbre.children(parent))
+    return arbre
+
+
+def get_category_tree_cached(index_name):
+    """Retourne l'arbre des catégories d'un index, préchargé si absent du cache."""
+
+    trouve, arbre = cache_categories.get((index_name, "tree", None))
+    if trouve:
+        return arbre
+    return prefetch_category_tree(index_name)
+
+
+def invalidate_categories(index_name=None):
+    """Invalide les catégories d'un index (ou de tous les index et la liste des index si None)."""
+
+    if index_name is None:
+        return cache_categories.invalidate()
+    return cache_categories.invalidate(lambda cle: cle[0] == index_name)
+
+
+def categories_cache_stats():
+    """Compteurs hit/miss du cache des catégories."""
+
+    return cache_categories.stats()
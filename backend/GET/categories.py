@@ -0,0 +1,267 @@
+"""Arbre des catégories Algolia (lvl0 > lvl1 > lvl2) construit en une seule lecture.
+
+Quand les facettes sont tronquées, les listes complétées par un parcours browse sont
+enregistrées dans le dossier `categories/` du répertoire de données avec la date de
+mise à jour de l'index (`updatedAt`) : l'index n'est reparcouru que lorsque cette date change.
+Une date changée par les écritures de l'application hors des champs `categories` (`noter_ecriture`)
+est adoptée sans reparcours.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.GET.main import browse_products_pages, date_maj_index, get_algolia_client
+from backend.stockage import chemin_donnees
+
+NIVEAUX_CATEGORIES = (0, 1, 2)
+SEPARATEUR_CATEGORIES = " > "
+# Âge (secondes) au-delà duquel les catégories complétées sont reparcourues quand la date de l'index est inconnue
+AGE_MAX_SANS_DATE = float(os.getenv("CATEGORIES_AGE_MAX", str(24 * 3600)))
+
+# Compléments par browse en cours, par index
+_complements = {}
+# Index écrits par l'application (hors catégories) depuis la date enregistrée
+_ecritures = set()
+_verrou = threading.Lock()
+
+
+def _valeurs(valeur):
+    if valeur is None:
+        return []
+    return valeur if isinstance(valeur, list) else [valeur]
+
+
+def _chemin_categories(index_name):
+    return chemin_donnees("categories", re.sub(r"[^\w.-]", "_", index_name) + ".json")
+
+
+def sauvegarder_categories(index_name, categories, index_maj_le):
+    """Enregistre les catégories complétées d'un index avec la date de l'index au moment du parcours."""
+
+    _ecrire_fichier(_chemin_categories(index_name), {
+        "index_name": index_name,
+        "index_maj_le": index_maj_le,
+        "construit_le": time.time(),
+        "categories": {str(niveau): valeurs for niveau, valeurs in categories.items()},
+    })
+
+
+def _ecrire_fichier(chemin, donnees):
+    temporaire = f"{chemin}.{threading.get_ident()}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as sortie:
+        json.dump(donnees, sortie, ensure_ascii=False)
+    os.replace(temporaire, chemin)
+
+
+def charger_categories(index_name, index_maj_le):
+    """
+    Retourne les catégories complétées enregistrées si elles correspondent encore à l'index, sinon None.
+    Avec une date inconnue, elles restent valables `AGE_MAX_SANS_DATE` secondes.
+    """
+    chemin = _chemin_categories(index_name)
+    if not os.path.exists(chemin):
+        return None
+    try:
+        with open(chemin, encoding="utf-8") as entree:
+            donnees = json.load(entree)
+    except Exception as e:
+        print(f"Catégories illisibles pour {index_name} : {e}")
+        return None
+    if index_maj_le is not None and donnees.get("index_maj_le") != index_maj_le:
+        with _verrou:
+            ecrit = index_name in _ecritures
+            _ecritures.discard(index_name)
+        if not ecrit:
+            return None
+        # Date changée par les écritures de l'application, qui n'ont pas touché aux catégories
+        donnees["index_maj_le"] = index_maj_le
+        _ecrire_fichier(chemin, donnees)
+    if index_maj_le is None and time.time() - donnees.get("construit_le", 0) >= AGE_MAX_SANS_DATE:
+        return None
+    return {int(niveau): valeurs for niveau, valeurs in donnees["categories"].items()}
+
+
+def noter_ecriture(index_name, champ, object_ids):
+    """
+    Prend en compte une écriture de l'application (`champ` renseigné pour `object_ids`).
+    Une écriture dans `categories` invalide les catégories complétées ; les autres laissent
+    adopter la nouvelle date de l'index à la lecture suivante.
+    """
+    if not object_ids:
+        return
+    if champ.split(".")[0] == "categories":
+        with _verrou:
+            _ecritures.discard(index_name)
+        try:
+            os.remove(_chemin_categories(index_name))
+        except FileNotFoundError:
+            pass
+        return
+    with _verrou:
+        _ecritures.add(index_name)
+
+
+def fetch_category_facets(index_name, max_values_per_facet=1000, apres_complement=None):
+    """
+    Récupère les catégories de tous les niveaux en une seule requête de facettes.
+
+    Si un niveau atteint `max_values_per_facet` valeurs (facette potentiellement
+    tronquée), la liste est complétée par un parcours browse de l'attribut `categories`,
+    enregistré sur disque : tant que la date de mise à jour de l'index ne change pas,
+    les catégories complétées sont relues sans nouveau parcours.
+    Avec `apres_complement`, ce parcours de tout l'index a lieu en arrière-plan : les
+    catégories des facettes sont retournées aussitôt et la liste complète est passée
+    au rappel une fois le parcours terminé.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        max_values_per_facet (int): Nombre de valeurs demandées par facette (1000 maximum).
+        apres_complement (callable, optionnel): Reçoit `{niveau: [chemins complets]}` complété.
+    Returns:
+        dict: `{niveau: [chemins complets]}` (partiel si le complément est en arrière-plan).
+    """
+    client = get_algolia_client()
+    results = client.search_single_index(index_name, {
+        'query': '',
+        'hitsPerPage': 0,
+        'facets': [f'categories.lvl{niveau}' for niveau in NIVEAUX_CATEGORIES],
+        'maxValuesPerFacet': max_values_per_facet
+    })
+    facets = getattr(results, 'facets', {}) or {}
+    categories = {niveau: list(facets.get(f'categories.lvl{niveau}', {}).keys()) for niveau in NIVEAUX_CATEGORIES}
+    if any(len(valeurs) >= max_values_per_facet for valeurs in categories.values()):
+        index_maj_le = date_maj_index(index_name)
+        completes = charger_categories(index_name, index_maj_le)
+        if completes is not None:
+            return {niveau: list(dict.fromkeys(valeurs + completes.get(niveau, []))) for niveau, valeurs in categories.items()}
+        if apres_complement is None:
+            categories = _browse_categories(index_name, categories, index_maj_le)
+        else:
+            completer_en_arriere_plan(index_name, categories, apres_complement, index_maj_le)
+    return categories
+
+
+def completer_en_arriere_plan(index_name, categories, apres_complement, index_maj_le=None):
+    """
+    Lance `_browse_categories` dans un thread (un seul par index) et passe le résultat à `apres_complement`.
+    Returns:
+        bool: True si un complément est en cours pour cet index.
+    """
+    def completer():
+        try:
+            apres_complement(_browse_categories(index_name, categories, index_maj_le))
+        except Exception as e:
+            print(f"Erreur lors du parcours des catégories de {index_name} : {e}")
+        finally:
+            with _verrou:
+                _complements.pop(index_name, None)
+
+    with _verrou:
+        if index_name in _complements:
+            return True
+        fil = threading.Thread(target=completer, name=f"categories-{index_name}", daemon=True)
+        _complements[index_name] = fil
+    fil.start()
+    return True
+
+
+def complement_en_cours(index_name):
+    with _verrou:
+        return index_name in _complements
+
+
+def _browse_categories(index_name, categories, index_maj_le=None):
+    """
+    Complète les catégories en parcourant l'attribut `categories` de tous les produits,
+    puis les enregistre avec la date de l'index lue avant le parcours.
+    """
+
+    vues = {niveau: dict.fromkeys(valeurs) for niveau, valeurs in categories.items()}
+    for page in browse_products_pages(index_name, attributes_to_retrieve=['categories']):
+        for hit in page:
+            hit_dict = hit.model_dump() if hasattr(hit, 'model_dump') else hit
+            hierarchie = hit_dict.get('categories') or {}
+            for niveau in NIVEAUX_CATEGORIES:
+                for valeur in _valeurs(hierarchie.get(f'lvl{niveau}')):
+                    vues[niveau].setdefault(valeur)
+    completes = {niveau: list(valeurs) for niveau, valeurs in vues.items()}
+    try:
+        sauvegarder_categories(index_name, completes, index_maj_le)
+    except OSError as e:
+        print(f"Erreur lors de l'enregistrement des catégories de {index_name} : {e}")
+    return completes
+
+
+class CategoryTree:
+    """
+    Index en mémoire de la hiérarchie de catégories.
+
+    `children` et `full_path` sont des lectures de dictionnaire (O(1)), là où le
+    frontend parcourait auparavant les listes de catégories à chaque rerun.
+    Args:
+        categories (dict): `{niveau: [chemins complets]}` tel que retourné par `fetch_category_facets`.
+    """
+
+    def __init__(self, categories):
+        self._enfants = {None: []}
+        self._par_nom = {}
+        self._niveaux = {}
+        for niveau in sorted(categories):
+            for chemin in categories[niveau]:
+                self._ajouter(chemin.strip(), niveau)
+
+    def _ajouter(self, chemin, niveau):
+        if chemin in self._niveaux:
+            return
+        parent = chemin.rsplit(SEPARATEUR_CATEGORIES, 1)[0] if niveau > 0 else None
+        self._niveaux[chemin] = niveau
+        self._enfants.setdefault(parent, []).append(chemin)
+        self._enfants.setdefault(chemin, [])
+        self._par_nom[(parent, self.short_name(chemin))] = chemin
+
+    @staticmethod
+    def short_name(chemin):
+        """Dernier segment d'un chemin de catégorie ("A > B > C" -> "C")."""
+
+        return chemin.rsplit(SEPARATEUR_CATEGORIES, 1)[-1]
+
+    def children(self, parent=None):
+        """Chemins complets des catégories enfants (catégories de niveau 0 si `parent` est None)."""
+
+        return self._enfants.get(parent.strip() if parent else None, [])
+
+    def full_path(self, nom, parent=None):
+        """Chemin complet d'une catégorie à partir de son nom court et du chemin de son parent."""
+
+        if not nom:
+            return None
+        return self._par_nom.get((parent.strip() if parent else None, nom))
+
+    def level(self, chemin):
+        return self._niveaux.get(chemin)
+
+    def by_level(self, niveau):
+        """Toutes les catégories d'un niveau donné."""
+
+        return [chemin for chemin, n in self._niveaux.items() if n == niveau]
+
+    def __contains__(self, chemin):
+        return chemin in self._niveaux
+
+    def __len__(self):
+        return len(self._niveaux)
+
+
+def fetch_category_tree(index_name, max_values_per_facet=1000, apres_complement=None):
+    """
+    Construit l'arbre des catégories d'un index à partir d'une seule requête de facettes.
+    `apres_complement` reçoit l'arbre complet si les facettes tronquées sont complétées en arrière-plan.
+    """
+    rappel = None
+    if apres_complement is not None:
+        rappel = lambda categories: apres_complement(CategoryTree(categories))
+    return CategoryTree(fetch_category_facets(index_name, max_values_per_facet, rappel))
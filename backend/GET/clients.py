@@ -0,0 +1,155 @@
+"""Registre des clients Algolia du processus et de leur session HTTP partagée.
+
+Une session HTTP (pool de connexions keep-alive et sessions TLS) est créée une
+seule fois par couple (app_id, api_key) et partagée par tous les helpers GET/POST.
+Le transporteur du SDK n'est pas thread-safe : à chaque requête il réaffecte ses
+hôtes (lecture ou écriture) et son timeout. Chaque thread reçoit donc son propre
+client, dont le transporteur utilise la session partagée. Le SDK Algolia n'est
+importé qu'à la création du premier client.
+"""
+
+import asyncio
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TAILLE_POOL_CONNEXIONS = int(os.getenv("ALGOLIA_POOL_SIZE", "32"))
+# Version du SDK épinglée dans requirements.txt : la session partagée est passée au
+# transporteur par un attribut interne, vérifié uniquement pour cette version.
+VERSION_SDK_ALGOLIA = "4.21.0"
+
+_sessions = {}
+_clients_enregistres = {}
+_clients_async = {}
+_locaux = threading.local()
+_generation = 0
+_verrou = threading.Lock()
+
+
+def _identifiants(app_id=None, api_key=None):
+    return (app_id or os.getenv("ALGOLIA_APP_ID"), api_key or os.getenv("ALGOLIA_API_KEY"))
+
+
+def _session_pool(taille_pool):
+    """Session HTTP keep-alive dimensionnée pour des appels concurrents."""
+
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
+
+    session = Session()
+    # Même politique de retry que le transporteur Algolia (il gère lui-même le
+    # basculement d'hôte), mais avec un pool assez grand pour plusieurs threads.
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=taille_pool, max_retries=Retry(connect=0))
+    session.mount("https://", adapter)
+    return session
+
+
+def _creer_client(cle, session):
+    """Client synchrone dont le transporteur envoie ses requêtes par `session` (None = session propre)."""
+
+    import algoliasearch
+    from algoliasearch.http.transporter_sync import TransporterSync
+    from algoliasearch.search.client import SearchClientSync
+    from algoliasearch.search.config import SearchConfig
+
+    class TransporteurSessionPartagee(TransporterSync):
+        def __init__(self, config):
+            super().__init__(config)
+            self._session = session
+
+        def close(self):
+            # La session appartient au registre (`close_algolia_clients`), pas à ce client
+            self._session = None
+
+    config = SearchConfig(*cle)
+    if session is None or algoliasearch.__version__ != VERSION_SDK_ALGOLIA:
+        return SearchClientSync.create_with_config(config=config)
+    return SearchClientSync.create_with_config(config=config, transporter=TransporteurSessionPartagee(config))
+
+
+def get_shared_algolia_client(app_id=None, api_key=None):
+    """
+    Retourne le client Algolia synchrone de ce thread pour ces identifiants.
+    Les clients des différents threads partagent une même session HTTP (pool de connexions).
+    Args:
+        app_id (str, optionnel): Application Algolia. Par défaut ALGOLIA_APP_ID.
+        api_key (str, optionnel): Clé d'API. Par défaut ALGOLIA_API_KEY.
+    Returns:
+        SearchClientSync: Client réservé au thread appelant (ou client enregistré par `register_algolia_client`).
+    """
+    cle = _identifiants(app_id, api_key)
+    client = _clients_enregistres.get(cle)
+    if client is not None:
+        return client
+    clients = getattr(_locaux, "clients", None)
+    if clients is None or getattr(_locaux, "generation", None) != _generation:
+        clients = _locaux.clients = {}
+        _locaux.generation = _generation
+    client = clients.get(cle)
+    if client is None:
+        with _verrou:
+            session = _sessions.get(cle)
+            if session is None:
+                session = _sessions[cle] = _session_pool(TAILLE_POOL_CONNEXIONS)
+        client = clients[cle] = _creer_client(cle, session)
+    return client
+
+
+def get_shared_algolia_client_async(app_id=None, api_key=None):
+    """
+    Retourne le client Algolia asynchrone partagé pour ces identifiants et la boucle courante.
+
+    Une session aiohttp est liée à sa boucle d'événements : le registre asynchrone est
+    donc indexé par boucle. Doit être appelé depuis une coroutine.
+    Returns:
+        SearchClient: Client asynchrone réutilisable.
+    """
+    boucle = asyncio.get_running_loop()
+    cle = (*_identifiants(app_id, api_key), id(boucle))
+    with _verrou:
+        entree = _clients_async.get(cle)
+        if entree is None or entree[0] is not boucle:
+            from algoliasearch.search.client import SearchClient
+
+            entree = (boucle, SearchClient(*cle[:2]))
+            _clients_async[cle] = entree
+    return entree[1]
+
+
+def register_algolia_client(client, app_id=None, api_key=None):
+    """Enregistre un client (ex. `FakeAlgoliaClient`) à la place du client réel pour ces identifiants."""
+
+    with _verrou:
+        _clients_enregistres[_identifiants(app_id, api_key)] = client
+
+
+def close_algolia_clients():
+    """Ferme les sessions partagées et vide le registre (les threads recréent leurs clients au besoin)."""
+
+    global _generation
+    with _verrou:
+        sessions = list(_sessions.values())
+        clients = list(_clients_enregistres.values())
+        _sessions.clear()
+        _clients_enregistres.clear()
+        _generation += 1
+    for session in sessions:
+        session.close()
+    for client in clients:
+        if hasattr(client, "close"):
+            client.close()
+
+
+async def close_algolia_clients_async():
+    """Ferme les clients asynchrones associés à la boucle courante."""
+
+    boucle = asyncio.get_running_loop()
+    with _verrou:
+        cles = [cle for cle, (b, _) in _clients_async.items() if b is boucle]
+        clients = [_clients_async.pop(cle)[1] for cle in cles]
+    for client in clients:
+        await client.close()
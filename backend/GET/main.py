@@ -1,17 +1,42 @@
 """Fonctions utilitaires pour la récupération de données dans Algolia."""
 
-from algoliasearch.search.client import SearchClientSync
+import sys
 import os
 from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 load_dotenv()
 
+from backend.GET.clients import get_shared_algolia_client
+from backend.metriques import etape
+
+ATTRIBUTS_PRODUIT = ['name', 'objectID', 'MotsCles', 'shortDescription', 'longDescription', 'ProductImageLink']
+# Attributs nécessaires à la carte produit de l'interface
+ATTRIBUTS_AFFICHAGE = ['objectID', 'name', 'shortDescription', 'ProductImageLink']
+
+
+def attributs_projection(champs=(), champ_cible=None, affichage=False):
+    """
+    Construit la liste `attributesToRetrieve` d'une lecture de produits.
+    Args:
+        champs (iterable): Champs utilisés (ex. @champs du prompt, `PromptTemplate.champs`).
+        champ_cible (str, optionnel): Champ enrichi, récupéré pour connaître sa valeur actuelle.
+        affichage (bool): Ajoute les attributs de la carte produit (ATTRIBUTS_AFFICHAGE).
+    Returns:
+        list: objectID puis les attributs demandés, sans doublon.
+    """
+    attributs = ['objectID', *champs]
+    if champ_cible:
+        attributs.append(champ_cible)
+    if affichage:
+        attributs.extend(ATTRIBUTS_AFFICHAGE)
+    return list(dict.fromkeys(attributs))
+
+
 def get_algolia_client():
-    """Crée un client Algolia à partir des variables d'environnement."""
+    """Retourne le client Algolia partagé (pool de connexions) défini par les variables d'environnement."""
 
-    app_id = os.getenv("ALGOLIA_APP_ID")
-    api_key = os.getenv("ALGOLIA_API_KEY")
-    return SearchClientSync(app_id, api_key)
+    return get_shared_algolia_client(os.getenv("ALGOLIA_APP_ID"), os.getenv("ALGOLIA_API_KEY"))
 
 
 def get_algolia_indexes_name():
@@ -23,108 +48,94 @@ def get_algolia_indexes_name():
     return [item.name for item in items]
 
 
-def get_categories_lvl0_name(index_name):
-    """Renvoie les catégories de niveau 0 pour un index donné."""
-
-    client = get_algolia_client()
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'facets': ['categories.lvl0'],
-        'maxValuesPerFacet': 100
-    })
-    facets = getattr(results, 'facets', {}) or {}
-    categories_lvl0 = facets.get('categories.lvl0', {})
-    return list(categories_lvl0.keys())
+def date_maj_index(index_name):
+    """Date de dernière mise à jour de l'index selon Algolia (None si inconnue)."""
 
-
-def get_categories_lvl1_name(index_name, category_lvl0):
-    """Renvoie les catégories de niveau 1 pour une catégorie de niveau 0."""
-
-    client = get_algolia_client()
-    category_lvl0 = category_lvl0.strip()
-    escaped_category = category_lvl0.replace('"', '\"')
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'facets': ['categories.lvl1'],
-        'filters': f'categories.lvl0:"{escaped_category}"',
-        'maxValuesPerFacet': 100
-    })
-    facets = getattr(results, 'facets', {}) or {}
-    categories_lvl1 = facets.get('categories.lvl1', {})
-    return list(categories_lvl1.keys())
-
-
-def get_categories_lvl2_name(index_name, category_lvl1):
-    """Renvoie les catégories de niveau 2 pour une catégorie de niveau 1."""
-
-    client = get_algolia_client()
-    category_lvl1 = category_lvl1.strip()
-    escaped_category = category_lvl1.replace('"', '\"')
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'facets': ['categories.lvl2'],
-        'filters': f'categories.lvl1:"{escaped_category}"',
-        'maxValuesPerFacet': 100
-    })
-    facets = getattr(results, 'facets', {}) or {}
-    categories_lvl2 = facets.get('categories.lvl2', {})
-    return list(categories_lvl2.keys())
+    try:
+        response = get_algolia_client().list_indices()
+    except Exception as e:
+        print(f"Erreur lors de la lecture des index Algolia : {e}")
+        return None
+    for item in getattr(response, "items", None) or []:
+        if item.name == index_name:
+            return str(getattr(item, "updated_at", "") or "") or None
+    return None
 
 
-def get_product_by_id(index_name, product_id):
-    """Récupère un produit par son identifiant."""
+def get_product_by_id(index_name, product_id, attributes_to_retrieve=None):
+    """Récupère un produit par son identifiant (attributs : `attributes_to_retrieve`, ATTRIBUTS_PRODUIT par défaut)."""
 
     client = get_algolia_client()
     results = client.search_single_index(index_name, {
         'query': '',
         'filters': f'objectID:{product_id}',
-        'attributesToRetrieve': ['name', 'objectID', 'MotsCles', 'shortDescription', 'longDescription', 'ProductImageLink']
+        'attributesToRetrieve': attributes_to_retrieve or ATTRIBUTS_PRODUIT
     })
     hits = getattr(results, 'hits', []) or []
     return hits[0] if hits else None
 
-def get_products_by_category_lvl1(index_name, category_lvl1):
-    """Récupère les produits associés à une catégorie de niveau 1."""
+def _filtre_categorie(niveau, categorie):
+    """Construit le filtre Algolia `categories.lvlN:"..."` en échappant les guillemets."""
 
-    client = get_algolia_client()
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'filters': f'categories.lvl1:"{category_lvl1}"',
-        'hitsPerPage': 100,
-        'attributesToRetrieve': ['name', 'objectID', 'MotsCles', 'shortDescription', 'longDescription', 'ProductImageLink']
-    })
-    hits = getattr(results, 'hits', []) or []
-    return hits
+    categorie = categorie.strip().replace('"', '\\"')
+    return f'categories.lvl{niveau}:"{categorie}"'
 
-def get_products_by_category_lvl2(index_name, category_lvl2):
-    """Récupère les produits associés à une catégorie de niveau 2."""
 
-    client = get_algolia_client()
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'filters': f'categories.lvl2:"{category_lvl2}"',
-        'hitsPerPage': 100,
-        'attributesToRetrieve': ['name', 'objectID', 'MotsCles', 'shortDescription', 'longDescription', 'ProductImageLink']
-    })
-    hits = getattr(results, 'hits', []) or []
-    return hits
-
-def get_algolia_fields(index_name):
+def browse_products_pages(index_name, filters=None, attributes_to_retrieve=None, hits_per_page=1000):
     """
-    Récupère tous les champs disponibles dans un index Algolia en parcourant plusieurs produits.
+    Parcourt un index avec l'API browse et renvoie les produits page par page.
+
+    Le curseur retourné par Algolia est suivi jusqu'à épuisement : aucune limite de
+    pagination n'est appliquée et une seule page est gardée en mémoire à la fois.
     Args:
         index_name (str): Nom de l'index Algolia.
-    Returns:
-        list: Liste des noms de champs disponibles.
+        filters (str, optionnel): Filtre Algolia à appliquer.
+        attributes_to_retrieve (list, optionnel): Attributs à récupérer. Par défaut ATTRIBUTS_PRODUIT.
+        hits_per_page (int): Taille des pages (1000 maximum côté Algolia).
+    Yields:
+        list: Produits d'une page.
     """
     client = get_algolia_client()
-    results = client.search_single_index(index_name, {
-        'query': '',
-        'hitsPerPage': 20,  # Prend les 20 premiers produits
-        'attributesToRetrieve': ['*']
-    })
-    hits = getattr(results, 'hits', []) or []
-    champs = set()
-    for prod in hits:
-        champs.update(prod.model_dump().keys())
-    return list(champs)
+    params = {
+        'hitsPerPage': hits_per_page,
+        'attributesToRetrieve': attributes_to_retrieve or ATTRIBUTS_PRODUIT
+    }
+    if filters:
+        params['filters'] = filters
+    while True:
+        with etape("lecture"):
+            response = client.browse(index_name, params)
+        hits = getattr(response, 'hits', []) or []
+        if hits:
+            yield hits
+        cursor = getattr(response, 'cursor', None)
+        if not cursor:
+            break
+        params = {'cursor': cursor}
+
+
+def iter_products_by_category(index_name, category, niveau=2, attributes_to_retrieve=None, hits_per_page=1000):
+    """
+    Générateur de tous les produits d'une catégorie (niveau 0, 1 ou 2), sans troncature.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        category (str): Chemin complet de la catégorie (ex. "A > B > C").
+        niveau (int): Niveau de la catégorie dans la hiérarchie.
+        attributes_to_retrieve (list, optionnel): Attributs à récupérer (voir `attributs_projection`).
+    Yields:
+        Produits un par un.
+    """
+    filters = _filtre_categorie(niveau, category)
+    for page in browse_products_pages(index_name, filters, attributes_to_retrieve, hits_per_page):
+        yield from page
+
+
+def get_products_by_category_lvl1(index_name, category_lvl1, attributes_to_retrieve=None):
+    """Récupère tous les produits associés à une catégorie de niveau 1."""
+
+    return list(iter_products_by_category(index_name, category_lvl1, niveau=1, attributes_to_retrieve=attributes_to_retrieve))
+
+def get_products_by_category_lvl2(index_name, category_lvl2, attributes_to_retrieve=None):
+    """Récupère tous les produits associés à une catégorie de niveau 2."""
+
+    return list(iter_products_by_category(index_name, category_lvl2, niveau=2, attributes_to_retrieve=attributes_to_retrieve))
@@ -0,0 +1,347 @@
+"""Index des champs (schéma) de chaque index Algolia.
+
+Le schéma d'un index est construit par un parcours browse en arrière-plan : pour
+chaque champ sont relevés ses types, son taux de remplissage et quelques valeurs
+d'exemple. Il est enregistré dans le dossier `schemas/` du répertoire de données
+et n'est reconstruit que lorsque la date de mise à jour de l'index (`updatedAt`
+de `list_indices`) change ; en attendant, le schéma précédent reste servi.
+Pendant la construction, le schéma partiel est disponible et enregistré page par page.
+Les écritures de l'application (`noter_ecriture`, appelé après chaque lot écrit) sont
+reportées directement dans le schéma : la date qu'elles changent est adoptée sans reparcours.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.GET.main import browse_products_pages, date_maj_index
+from backend.stockage import chemin_donnees
+
+NB_EXEMPLES = 3
+LONGUEUR_MAX_EXEMPLE = 80
+PAGES_ENTRE_SAUVEGARDES = 10
+# Délai minimal entre deux vérifications de la date de mise à jour d'un index (secondes)
+DELAI_VERIFICATION = float(os.getenv("SCHEMA_DELAI_VERIFICATION", "300"))
+# Âge (secondes) au-delà duquel un schéma complet est reconstruit quand la date de l'index est inconnue
+AGE_MAX_SANS_DATE = float(os.getenv("SCHEMA_AGE_MAX", str(24 * 3600)))
+# Métadonnées ajoutées par Algolia aux résultats, qui ne sont pas des champs produits
+CHAMPS_RESERVES = {"_highlightResult", "_snippetResult", "_rankingInfo", "_distinctSeqID"}
+
+_schemas = {}
+_constructions = {}
+_verifications = {}
+# Index écrits par l'application depuis la dernière date de mise à jour connue
+_ecritures = set()
+_verrou = threading.Lock()
+
+
+def _type_valeur(valeur):
+    if valeur is None:
+        return "null"
+    if isinstance(valeur, bool):
+        return "boolean"
+    if isinstance(valeur, (int, float)):
+        return "number"
+    if isinstance(valeur, str):
+        return "string"
+    if isinstance(valeur, (list, tuple)):
+        return "array"
+    return "object"
+
+
+def _est_rempli(valeur):
+    return valeur not in (None, "") and not (isinstance(valeur, (list, tuple, dict)) and not valeur)
+
+
+def _en_dict(produit):
+    if isinstance(produit, dict):
+        return produit
+    if hasattr(produit, "model_dump"):
+        return produit.model_dump()
+    return dict(produit)
+
+
+def _exemple(valeur):
+    texte = valeur if isinstance(valeur, str) else json.dumps(valeur, ensure_ascii=False, default=str)
+    return texte if len(texte) <= LONGUEUR_MAX_EXEMPLE else texte[:LONGUEUR_MAX_EXEMPLE - 1] + "…"
+
+
+class SchemaIndex:
+    """
+    Champs d'un index Algolia avec leurs types, taux de remplissage et exemples.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        index_maj_le (str, optionnel): Date de mise à jour de l'index au moment du parcours.
+    """
+
+    def __init__(self, index_name, index_maj_le=None):
+        self.index_name = index_name
+        self.index_maj_le = index_maj_le
+        self.nb_produits = 0
+        self.complet = False
+        self.construit_le = None
+        self._champs = {}
+        # Le schéma partiel est lu par l'interface pendant que le parcours l'alimente
+        self._verrou = threading.Lock()
+
+    def observer(self, produits):
+        """Ajoute les produits d'une page browse aux statistiques."""
+
+        produits = [_en_dict(produit) for produit in produits]
+        with self._verrou:
+            for produit in produits:
+                self.nb_produits += 1
+                for champ, valeur in produit.items():
+                    if champ in CHAMPS_RESERVES:
+                        continue
+                    stats = self._champs.setdefault(champ, {"types": Counter(), "remplis": 0, "exemples": []})
+                    stats["types"][_type_valeur(valeur)] += 1
+                    if _est_rempli(valeur):
+                        stats["remplis"] += 1
+                        exemple = _exemple(valeur)
+                        if len(stats["exemples"]) < NB_EXEMPLES and exemple not in stats["exemples"]:
+                            stats["exemples"].append(exemple)
+
+    def noter_ecriture(self, champ, nb_objets):
+        """Reporte `nb_objets` valeurs texte écrites par l'application dans `champ`."""
+
+        with self._verrou:
+            stats = self._champs.setdefault(champ, {"types": Counter(), "remplis": 0, "exemples": []})
+            stats["types"]["string"] += nb_objets
+            # Les produits déjà renseignés ne sont pas connus : le remplissage est plafonné au nombre de produits
+            stats["remplis"] = min(self.nb_produits, stats["remplis"] + nb_objets)
+
+    def __contains__(self, champ):
+        with self._verrou:
+            return champ in self._champs
+
+    def champs(self):
+        """Noms des champs, par ordre alphabétique."""
+
+        with self._verrou:
+            return sorted(self._champs)
+
+    def taux_remplissage(self, champ):
+        """Part des produits parcourus où le champ est renseigné (0.0 si inconnu)."""
+
+        with self._verrou:
+            stats = self._champs.get(champ)
+            if stats is None or not self.nb_produits:
+                return 0.0
+            return stats["remplis"] / self.nb_produits
+
+    def couverture(self):
+        """
+        Retourne une ligne par champ, du plus au moins renseigné.
+        Returns:
+            list: dicts `{"champ", "types", "taux_remplissage", "exemples"}`.
+        """
+        with self._verrou:
+            lignes = [
+                {
+                    "champ": champ,
+                    "types": ", ".join(t for t, _ in stats["types"].most_common() if t != "null") or "null",
+                    "taux_remplissage": stats["remplis"] / self.nb_produits if self.nb_produits else 0.0,
+                    "exemples": list(stats["exemples"]),
+                }
+                for champ, stats in self._champs.items()
+            ]
+        return sorted(lignes, key=lambda ligne: (-ligne["taux_remplissage"], ligne["champ"]))
+
+    def as_dict(self):
+        with self._verrou:
+            return {
+                "index_name": self.index_name,
+                "index_maj_le": self.index_maj_le,
+                "nb_produits": self.nb_produits,
+                "complet": self.complet,
+                "construit_le": self.construit_le,
+                "champs": {
+                    champ: {"types": dict(stats["types"]), "remplis": stats["remplis"], "exemples": list(stats["exemples"])}
+                    for champ, stats in self._champs.items()
+                },
+            }
+
+    @classmethod
+    def from_dict(cls, donnees):
+        schema = cls(donnees["index_name"], donnees.get("index_maj_le"))
+        schema.nb_produits = donnees.get("nb_produits", 0)
+        schema.complet = donnees.get("complet", False)
+        schema.construit_le = donnees.get("construit_le")
+        schema._champs = {
+            champ: {"types": Counter(stats["types"]), "remplis": stats["remplis"], "exemples": list(stats["exemples"])}
+            for champ, stats in donnees.get("champs", {}).items()
+        }
+        return schema
+
+
+def _chemin_schema(index_name):
+    return chemin_donnees("schemas", re.sub(r"[^\w.-]", "_", index_name) + ".json")
+
+
+def sauvegarder_schema(schema):
+    """Enregistre le schéma sur disque (écriture dans un fichier temporaire puis remplacement)."""
+
+    chemin = _chemin_schema(schema.index_name)
+    # Fichier temporaire propre au thread : le parcours et les écritures notées peuvent sauvegarder en même temps
+    temporaire = f"{chemin}.{threading.get_ident()}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as sortie:
+        json.dump(schema.as_dict(), sortie, ensure_ascii=False)
+    os.replace(temporaire, chemin)
+
+
+def charger_schema(index_name):
+    """Retourne le schéma enregistré pour l'index, ou None."""
+
+    chemin = _chemin_schema(index_name)
+    if not os.path.exists(chemin):
+        return None
+    try:
+        with open(chemin, encoding="utf-8") as entree:
+            return SchemaIndex.from_dict(json.load(entree))
+    except Exception as e:
+        print(f"Schéma illisible pour {index_name} : {e}")
+        return None
+
+
+def construire_schema(index_name, index_maj_le=None, hits_per_page=1000):
+    """
+    Parcourt tout l'index et construit son schéma. Le schéma partiel est publié pendant le parcours.
+    Returns:
+        SchemaIndex: Schéma complet, enregistré sur disque.
+    """
+    schema = SchemaIndex(index_name, index_maj_le)
+    with _verrou:
+        # Premier parcours : le schéma partiel est servi en attendant la fin
+        if index_name not in _schemas or not _schemas[index_name].complet:
+            _schemas[index_name] = schema
+    for numero, page in enumerate(browse_products_pages(index_name, attributes_to_retrieve=['*'], hits_per_page=hits_per_page), 1):
+        schema.observer(page)
+        if numero % PAGES_ENTRE_SAUVEGARDES == 0 and _schemas.get(index_name) is schema:
+            sauvegarder_schema(schema)
+    with schema._verrou:
+        schema.complet = True
+        schema.construit_le = time.time()
+    sauvegarder_schema(schema)
+    with _verrou:
+        _schemas[index_name] = schema
+    return schema
+
+
+def _construire_en_arriere_plan(index_name, index_maj_le):
+    try:
+        construire_schema(index_name, index_maj_le)
+    except Exception as e:
+        print(f"Erreur lors de la construction du schéma de {index_name} : {e}")
+    finally:
+        with _verrou:
+            _constructions.pop(index_name, None)
+
+
+def rafraichir_schema(index_name, force=False):
+    """
+    Lance la (re)construction du schéma en arrière-plan si l'index a changé depuis le dernier parcours.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        force (bool): Reconstruit même si l'index n'a pas changé.
+    Returns:
+        bool: True si une construction est en cours.
+    La date de l'index n'est relue qu'une fois par `DELAI_VERIFICATION` secondes.
+    """
+    with _verrou:
+        if index_name in _constructions:
+            return True
+        if not force and time.monotonic() - _verifications.get(index_name, float("-inf")) < DELAI_VERIFICATION:
+            return False
+        _verifications[index_name] = time.monotonic()
+    schema = get_schema(index_name, rafraichir=False)
+    index_maj_le = date_maj_index(index_name)
+    if not force and schema is not None and schema.complet:
+        if index_maj_le is not None and schema.index_maj_le == index_maj_le:
+            return False
+        with _verrou:
+            ecrit = index_maj_le is not None and index_name in _ecritures
+            _ecritures.discard(index_name)
+        if ecrit:
+            # Date changée par les écritures de l'application, déjà reportées dans le schéma
+            with schema._verrou:
+                schema.index_maj_le = index_maj_le
+            sauvegarder_schema(schema)
+            return False
+        # Date inconnue (listIndexes en erreur, ACL absente, index non listé) : le schéma complet
+        # reste servi jusqu'à `AGE_MAX_SANS_DATE`, sans reparcourir tout l'index à chaque vérification
+        if index_maj_le is None and time.time() - (schema.construit_le or 0) < AGE_MAX_SANS_DATE:
+            return False
+    with _verrou:
+        if index_name in _constructions:
+            return True
+        fil = threading.Thread(
+            target=_construire_en_arriere_plan, args=(index_name, index_maj_le), name=f"schema-{index_name}", daemon=True
+        )
+        _constructions[index_name] = fil
+        # Le parcours lit les écritures déjà faites ; seules les suivantes seront à adopter
+        _ecritures.discard(index_name)
+    fil.start()
+    return True
+
+
+def noter_ecriture(index_name, champ, object_ids):
+    """
+    Reporte dans le schéma de l'index une écriture de l'application (`champ` renseigné pour `object_ids`).
+    La date de mise à jour changée par cette écriture est adoptée à la vérification suivante, sans
+    reparcourir l'index ; un changement venu d'ailleurs dans le même intervalle attend la date suivante.
+    """
+    if not object_ids:
+        return
+    with _verrou:
+        _ecritures.add(index_name)
+    schema = get_schema(index_name, rafraichir=False)
+    if schema is not None:
+        schema.noter_ecriture(champ, len(object_ids))
+        if schema.complet:
+            sauvegarder_schema(schema)
+
+
+def construction_en_cours(index_name):
+    with _verrou:
+        return index_name in _constructions
+
+
+def get_schema(index_name, rafraichir=True):
+    """
+    Retourne le schéma connu de l'index (mémoire, puis disque), éventuellement partiel.
+    Args:
+        rafraichir (bool): Vérifie aussi (en arrière-plan) si le schéma doit être reconstruit.
+    Returns:
+        SchemaIndex | None: None tant qu'aucune page n'a été parcourue.
+    """
+    with _verrou:
+        schema = _schemas.get(index_name)
+    if schema is None:
+        schema = charger_schema(index_name)
+        if schema is not None:
+            with _verrou:
+                schema = _schemas.setdefault(index_name, schema)
+    if rafraichir:
+        rafraichir_schema(index_name)
+        if schema is None:
+            with _verrou:
+                schema = _schemas.get(index_name)
+    return schema
+
+
+def get_algolia_fields(index_name):
+    """
+    Récupère les champs d'un index Algolia depuis son schéma (construit en arrière-plan si besoin).
+    Args:
+        index_name (str): Nom de l'index Algolia.
+    Returns:
+        list: Liste des noms de champs connus (vide tant que le premier parcours n'a rien lu).
+    """
+    schema = get_schema(index_name)
+    return schema.champs() if schema is not None else []
@@ -1 +1,3 @@
-from .main import post_new_attribute_for_product,post_new_value_for_product, post_new_field_to_products
\ No newline at end of file
+from .main import post_new_attribute_for_product,post_new_value_for_product, post_new_field_to_products
+from .buffer import WriteBackBuffer
+from .staging import StagingStore
@@ -0,0 +1,151 @@
+"""Tampon d'écriture regroupant les mises à jour partielles envoyées à Algolia."""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.GET import categories, schema
+from backend.GET.cache import invalidate_categories
+from backend.GET.main import get_algolia_client
+from backend.metriques import metriques_courantes
+
+
+def noter_ecriture_index(index_name, champ, object_ids):
+    """
+    Reporte une écriture de l'application (`champ` renseigné pour `object_ids`) dans le schéma
+    et les catégories connus de l'index, pour que la date de mise à jour qu'elle change ne
+    déclenche pas de reparcours complet. S'appelle depuis un rappel `apres_ecriture`.
+    """
+    schema.noter_ecriture(index_name, champ, object_ids)
+    categories.noter_ecriture(index_name, champ, object_ids)
+    if object_ids and champ.split(".")[0] == "categories":
+        invalidate_categories(index_name)
+
+
+class WriteBackBuffer:
+    """
+    Accumule des valeurs enrichies et les envoie par lots via `partial_update_objects`.
+
+    Le tampon est vidé lorsqu'il atteint `taille_lot` objets, lorsque la plus ancienne
+    valeur en attente dépasse `delai_max` secondes, ou explicitement via `flush()` /
+    `close()`. Plusieurs champs d'un même objet sont fusionnés en une seule mise à jour.
+
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        taille_lot (int): Nombre d'objets déclenchant un envoi.
+        delai_max (float, optionnel): Âge maximal (s) d'une valeur en attente. None = pas de vidage temporel.
+        attendre_taches (bool): Si True, attend la publication de chaque lot (`wait_for_task`).
+            Si False, mode "fire-and-forget" : les lots sont envoyés sans attente.
+        client (optionnel): Client Algolia à utiliser. Par défaut `get_algolia_client()`.
+        apres_ecriture (callable, optionnel): Appelé avec la liste des objectIDs de chaque lot envoyé
+            avec succès (par exemple `JobJournal.marquer_ecrits`).
+    """
+
+    def __init__(self, index_name, taille_lot=1000, delai_max=5.0, attendre_taches=True, client=None, apres_ecriture=None):
+        self.index_name = index_name
+        self.taille_lot = max(1, taille_lot)
+        self.delai_max = delai_max
+        self.attendre_taches = attendre_taches
+        self._client = client
+        self.apres_ecriture = apres_ecriture
+        # Run instrumenté au moment de l'ouverture (les vidages du minuteur ont lieu dans un autre thread)
+        self._metriques = metriques_courantes()
+        self._en_attente = {}
+        self._verrou = threading.RLock()
+        self._minuteur = None
+        self.nb_ecrits = 0
+        self.nb_requetes = 0
+        self.echecs = []
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_algolia_client()
+        return self._client
+
+    def __len__(self):
+        return len(self._en_attente)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, object_id, field_name, new_value):
+        """
+        Ajoute une valeur à écrire pour un produit.
+        Returns:
+            bool: True (la valeur est mise en attente ; les erreurs d'envoi sont dans `echecs`).
+        """
+        with self._verrou:
+            self._en_attente.setdefault(object_id, {"objectID": object_id})[field_name] = new_value
+            if len(self._en_attente) >= self.taille_lot:
+                self._flush_locked()
+            elif self.delai_max is not None and self._minuteur is None:
+                self._minuteur = threading.Timer(self.delai_max, self.flush)
+                self._minuteur.daemon = True
+                self._minuteur.start()
+        return True
+
+    def post_new_value_for_product(self, index_name, product_id, field_name, new_value):
+        """Même signature que `POST.main.post_new_value_for_product`, mais mise en tampon."""
+
+        if index_name != self.index_name:
+            raise ValueError(f"Tampon ouvert sur l'index '{self.index_name}', pas '{index_name}'.")
+        return self.add(product_id, field_name, new_value)
+
+    def flush(self):
+        """
+        Envoie immédiatement les valeurs en attente.
+        Returns:
+            int: Nombre d'objets envoyés avec succès lors de ce vidage.
+        """
+        with self._verrou:
+            return self._flush_locked()
+
+    def _flush_locked(self):
+        if self._minuteur is not None:
+            self._minuteur.cancel()
+            self._minuteur = None
+        if not self._en_attente:
+            return 0
+        objets = list(self._en_attente.values())
+        self._en_attente = {}
+        debut = time.perf_counter()
+        try:
+            responses = self.client.partial_update_objects(
+                index_name=self.index_name,
+                objects=objets,
+                create_if_not_exists=True,
+                batch_size=self.taille_lot,
+            )
+            self.nb_requetes += len(responses)
+            if self.attendre_taches:
+                for response in responses:
+                    self.client.wait_for_task(self.index_name, response.task_id)
+        except Exception as e:
+            print(f"Erreur lors de l'écriture par lot ({len(objets)} objets) : {e}")
+            self.echecs.extend(obj["objectID"] for obj in objets)
+            if self._metriques is not None:
+                self._metriques.observer("ecriture", time.perf_counter() - debut)
+                self._metriques.erreur("ecriture", len(objets))
+            return 0
+        if self._metriques is not None:
+            self._metriques.observer("ecriture", time.perf_counter() - debut)
+            self._metriques.compter("produits_ecrits", len(objets))
+        self.nb_ecrits += len(objets)
+        if self.apres_ecriture is not None:
+            try:
+                self.apres_ecriture([obj["objectID"] for obj in objets])
+            except Exception as e:
+                print(f"Erreur après l'écriture par lot : {e}")
+        return len(objets)
+
+    def close(self):
+        """Vide le tampon et arrête le minuteur. Retourne le nombre total d'objets écrits."""
+
+        self.flush()
+        return self.nb_ecrits
@@ -4,11 +4,11 @@ import sys
 import os
 from dotenv import load_dotenv
 import json
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
 load_dotenv()
 
-from GET.main import get_algolia_client
+from backend.GET.main import get_algolia_client
 
 
 def post_new_attribute_for_product(index_name, object_id, attribute_name, value):
@@ -91,7 +91,6 @@ def post_new_field_to_products(index_name, products, field_name, default_value="
             'objectID': product['objectID'],
             field_name: default_value
         })
-    print(f"[DEBUG] Updates envoyés à Algolia : {updates}")
     try:
         response = client.partial_update_objects(index_name, updates, {'createIfNotExists': True})
         # En v4, il faut utiliser wait_for_task
@@ -0,0 +1,309 @@
+"""Zone de préparation (staging) des valeurs enrichies, pour les simulations.
+
+En simulation, les moteurs d'enrichissement écrivent dans un `StagingStore` au lieu
+du `WriteBackBuffer` : génération et jugement ont lieu normalement, mais les valeurs
+sont conservées dans une base SQLite locale avec la valeur actuelle du champ dans
+Algolia. Le rapport de différences (ancienne / nouvelle valeur, nombre de valeurs
+modifiées et inchangées) se lit ensuite dans le store, et `valider()` n'envoie à
+Algolia, par lots, que les valeurs réellement modifiées.
+
+Avec « Ignorer les produits inchangés », les produits ignorés figurent dans le
+rapport (statut `ignore`) et l'empreinte des entrées de chaque valeur générée est
+conservée avec elle : elle n'est enregistrée dans `IndexEmpreintes` qu'à la
+validation, une fois la valeur écrite (ou identique à celle d'Algolia).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.GET.main import get_algolia_client
+from backend.POST.buffer import WriteBackBuffer, noter_ecriture_index
+from backend.stockage import chemin_donnees
+
+STATUTS_STAGING = ("en_attente", "ecrit", "inchange", "ignore")
+TAILLE_LOT_LECTURE = 1000
+
+
+def _encoder(valeur):
+    return json.dumps(valeur, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _decoder(valeur):
+    return None if valeur is None else json.loads(valeur)
+
+
+class StagingStore:
+    """
+    Valeurs enrichies d'une simulation, en attente de validation.
+
+    S'utilise à la place d'un `WriteBackBuffer` (`tampon=`) dans les moteurs
+    d'enrichissement : mêmes méthodes `post_new_value_for_product`, `flush` et
+    attribut `echecs`. Rien n'est écrit dans Algolia avant `valider()` ; le rappel
+    `apres_ecriture` n'est donc jamais appelé pendant la simulation.
+    Args:
+        run_id (str): Identifiant de la simulation. Une simulation existante est reprise.
+        index_name (str): Index Algolia visé.
+        chemin (str, optionnel): Fichier SQLite. Par défaut `staging.sqlite3` dans le répertoire de données.
+        client (optionnel): Client Algolia (lecture des valeurs actuelles, validation). Par défaut `get_algolia_client()`.
+        empreintes (IndexEmpreintes, optionnel): Empreintes du run : celles des valeurs générées sont
+            conservées en staging et les produits inchangés ignorés sont notés (statut `ignore`).
+    """
+
+    def __init__(self, run_id, index_name, chemin=None, client=None, empreintes=None):
+        self.run_id = run_id
+        self.index_name = index_name
+        self.chemin = chemin or chemin_donnees("staging.sqlite3")
+        self._client = client
+        self.empreintes = empreintes
+        if empreintes is not None:
+            empreintes.apres_inchanges = lambda object_ids: self.noter_inchanges(object_ids, empreintes.champ_cible)
+        self.apres_ecriture = None
+        self.echecs = []
+        self._anciennes = {}
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._connexion.execute("PRAGMA journal_mode=WAL")
+        self._connexion.execute(
+            "CREATE TABLE IF NOT EXISTS staging ("
+            "run_id TEXT, index_name TEXT, object_id TEXT, champ TEXT, "
+            "ancienne TEXT, ancienne_connue INTEGER, nouvelle TEXT, statut TEXT, maj_le REAL, empreinte TEXT, "
+            "PRIMARY KEY (run_id, object_id, champ))"
+        )
+        colonnes = {ligne[1] for ligne in self._connexion.execute("PRAGMA table_info(staging)")}
+        if "empreinte" not in colonnes:
+            self._connexion.execute("ALTER TABLE staging ADD COLUMN empreinte TEXT")
+        self._connexion.commit()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_algolia_client()
+        return self._client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def noter_valeur_actuelle(self, object_id, champ, valeur):
+        """Mémorise la valeur actuelle d'un champ dans Algolia (lue avec le produit)."""
+
+        with self._verrou:
+            self._anciennes[(str(object_id), champ)] = valeur
+
+    def suivre_produits(self, produits, champ):
+        """
+        Parcourt `produits` en notant au passage la valeur actuelle de `champ`.
+        Un produit sans l'attribut (non récupéré) sera relu dans Algolia par `completer_valeurs_actuelles`.
+        Yields:
+            Les produits, inchangés.
+        """
+        for produit in produits:
+            donnees = produit.model_dump() if hasattr(produit, "model_dump") else produit
+            object_id = donnees.get("objectID") or donnees.get("objectId")
+            if object_id and champ in donnees:
+                self.noter_valeur_actuelle(object_id, champ, donnees[champ])
+            yield produit
+
+    def post_new_value_for_product(self, index_name, product_id, field_name, new_value):
+        """Même signature que `POST.main.post_new_value_for_product`, mais la valeur reste en staging."""
+
+        if index_name != self.index_name:
+            raise ValueError(f"Staging ouvert sur l'index '{self.index_name}', pas '{index_name}'.")
+        object_id = str(product_id)
+        empreinte = None
+        if self.empreintes is not None and field_name == self.empreintes.champ_cible:
+            empreinte = self.empreintes.en_attente(object_id)
+        with self._verrou:
+            connue = (object_id, field_name) in self._anciennes
+            ancienne = self._anciennes.get((object_id, field_name))
+            self._connexion.execute(
+                "INSERT INTO staging (run_id, index_name, object_id, champ, ancienne, ancienne_connue, nouvelle, statut, maj_le, empreinte) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'en_attente', ?, ?) "
+                "ON CONFLICT (run_id, object_id, champ) DO UPDATE SET "
+                "nouvelle = excluded.nouvelle, statut = 'en_attente', maj_le = excluded.maj_le, "
+                "empreinte = excluded.empreinte, "
+                "ancienne = CASE WHEN excluded.ancienne_connue THEN excluded.ancienne ELSE staging.ancienne END, "
+                "ancienne_connue = MAX(staging.ancienne_connue, excluded.ancienne_connue)",
+                (self.run_id, self.index_name, object_id, field_name,
+                 _encoder(ancienne) if connue else None, int(connue), _encoder(new_value), time.time(), empreinte),
+            )
+        return True
+
+    def noter_inchanges(self, object_ids, champ):
+        """Note les produits ignorés car inchangés (statut `ignore`) : ils comptent parmi les valeurs inchangées."""
+
+        maintenant = time.time()
+        with self._verrou:
+            lignes = []
+            for object_id in object_ids:
+                object_id = str(object_id)
+                connue = (object_id, champ) in self._anciennes
+                ancienne = _encoder(self._anciennes.get((object_id, champ))) if connue else None
+                lignes.append((self.run_id, self.index_name, object_id, champ, ancienne, int(connue), ancienne, maintenant))
+            self._connexion.executemany(
+                "INSERT INTO staging (run_id, index_name, object_id, champ, ancienne, ancienne_connue, nouvelle, statut, maj_le) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'ignore', ?) ON CONFLICT (run_id, object_id, champ) DO NOTHING",
+                lignes,
+            )
+
+    def flush(self):
+        """Enregistre les valeurs en staging sur disque. Retourne 0 (rien n'est envoyé à Algolia)."""
+
+        with self._verrou:
+            self._connexion.commit()
+        return 0
+
+    def completer_valeurs_actuelles(self):
+        """
+        Lit dans Algolia (par lots, `get_objects`) la valeur actuelle des champs qui n'ont pas été notés.
+        Returns:
+            int: Nombre de valeurs lues.
+        """
+        with self._verrou:
+            manquantes = self._connexion.execute(
+                "SELECT object_id, champ FROM staging WHERE run_id = ? AND ancienne_connue = 0 AND statut != 'ignore'",
+                (self.run_id,)
+            ).fetchall()
+        for debut in range(0, len(manquantes), TAILLE_LOT_LECTURE):
+            tranche = manquantes[debut:debut + TAILLE_LOT_LECTURE]
+            response = self.client.get_objects({
+                "requests": [
+                    {"objectID": object_id, "indexName": self.index_name, "attributesToRetrieve": [champ]}
+                    for object_id, champ in tranche
+                ]
+            })
+            resultats = getattr(response, "results", None) or []
+            lignes = []
+            for (object_id, champ), objet in zip(tranche, resultats):
+                if objet is not None and hasattr(objet, "model_dump"):
+                    objet = objet.model_dump()
+                lignes.append((_encoder((objet or {}).get(champ)), self.run_id, object_id, champ))
+            with self._verrou:
+                self._connexion.executemany(
+                    "UPDATE staging SET ancienne = ?, ancienne_connue = 1 WHERE run_id = ? AND object_id = ? AND champ = ?",
+                    lignes,
+                )
+                self._connexion.commit()
+        return len(manquantes)
+
+    def _lignes(self, statut=None):
+        requete = "SELECT object_id, champ, ancienne, nouvelle, statut, empreinte FROM staging WHERE run_id = ?"
+        parametres = [self.run_id]
+        if statut is not None:
+            requete += " AND statut = ?"
+            parametres.append(statut)
+        with self._verrou:
+            return self._connexion.execute(requete + " ORDER BY object_id, champ", parametres).fetchall()
+
+    def rapport(self, limite=None):
+        """
+        Rapport de différences de la simulation (valeurs actuelles lues dans Algolia si besoin).
+        Args:
+            limite (int, optionnel): Nombre maximal de lignes détaillées (les compteurs portent sur tout).
+        Returns:
+            dict: `total`, `modifies`, `inchanges` (dont les produits ignorés), `ecrits` et `lignes`
+                (objectID, champ, ancienne, nouvelle, modifie, statut), valeurs modifiées en premier.
+        """
+        self.completer_valeurs_actuelles()
+        lignes = []
+        compteurs = {"total": 0, "modifies": 0, "inchanges": 0, "ecrits": 0}
+        for object_id, champ, ancienne, nouvelle, statut, _ in self._lignes():
+            modifie = statut != "ignore" and ancienne != nouvelle
+            compteurs["total"] += 1
+            compteurs["modifies" if modifie else "inchanges"] += 1
+            compteurs["ecrits"] += statut == "ecrit"
+            lignes.append({
+                "objectID": object_id,
+                "champ": champ,
+                "ancienne": _decoder(ancienne),
+                "nouvelle": _decoder(nouvelle),
+                "modifie": modifie,
+                "statut": statut,
+            })
+        lignes.sort(key=lambda ligne: not ligne["modifie"])
+        return {**compteurs, "lignes": lignes[:limite] if limite is not None else lignes}
+
+    def valider(self, taille_lot=1000, attendre_taches=True):
+        """
+        Envoie à Algolia, par lots, les seules valeurs modifiées de la simulation.
+        Les valeurs identiques à la valeur actuelle passent à l'état `inchange` sans écriture.
+        Les empreintes conservées des valeurs écrites ou identiques sont enregistrées dans `IndexEmpreintes`.
+        Returns:
+            int: Nombre de produits écrits.
+        """
+        self.completer_valeurs_actuelles()
+        a_ecrire = []
+        inchanges = []
+        empreintes = {}
+        for object_id, champ, ancienne, nouvelle, _, empreinte in self._lignes("en_attente"):
+            if ancienne == nouvelle:
+                inchanges.append((object_id, champ))
+            else:
+                a_ecrire.append((object_id, champ, _decoder(nouvelle)))
+            if empreinte is not None:
+                empreintes[(object_id, champ)] = empreinte
+        self._marquer("inchange", inchanges)
+        self._enregistrer_empreintes({cle: empreintes[cle] for cle in inchanges if cle in empreintes})
+
+        def apres_ecriture(object_ids):
+            ecrits = set(object_ids)
+            cles = [(object_id, champ) for object_id, champ, _ in a_ecrire if object_id in ecrits]
+            self._marquer("ecrit", cles)
+            self._enregistrer_empreintes({cle: empreintes[cle] for cle in cles if cle in empreintes})
+            par_champ = {}
+            for object_id, champ in cles:
+                par_champ.setdefault(champ, []).append(object_id)
+            for champ, ids in par_champ.items():
+                noter_ecriture_index(self.index_name, champ, ids)
+
+        tampon = WriteBackBuffer(
+            self.index_name, taille_lot=taille_lot, delai_max=None, attendre_taches=attendre_taches,
+            client=self.client, apres_ecriture=apres_ecriture,
+        )
+        for object_id, champ, valeur in a_ecrire:
+            tampon.add(object_id, champ, valeur)
+        tampon.close()
+        if tampon.echecs:
+            print(f"{len(tampon.echecs)} produit(s) non écrit(s) lors de la validation du staging {self.run_id}")
+        return tampon.nb_ecrits
+
+    def _enregistrer_empreintes(self, empreintes):
+        """Enregistre `{(object_id, champ): empreinte}` dans l'index des empreintes de chaque champ."""
+
+        # Import local : backend.agent importe ce module (runner)
+        from backend.agent.empreintes import IndexEmpreintes
+
+        par_champ = {}
+        for (object_id, champ), empreinte in empreintes.items():
+            par_champ.setdefault(champ, {})[object_id] = empreinte
+        for champ, valeurs in par_champ.items():
+            index = IndexEmpreintes(self.index_name, champ)
+            try:
+                index.enregistrer(valeurs)
+            finally:
+                index.close()
+
+    def _marquer(self, statut, cles):
+        with self._verrou:
+            self._connexion.executemany(
+                "UPDATE staging SET statut = ?, maj_le = ? WHERE run_id = ? AND object_id = ? AND champ = ?",
+                [(statut, time.time(), self.run_id, object_id, champ) for object_id, champ in cles],
+            )
+            self._connexion.commit()
+
+    def supprimer(self):
+        """Efface les valeurs de la simulation."""
+
+        with self._verrou:
+            self._connexion.execute("DELETE FROM staging WHERE run_id = ?", (self.run_id,))
+            self._connexion.commit()
+
+    def close(self):
+        with self._verrou:
+            self._connexion.close()
@@ -1,9 +1,14 @@
 from .main import (
+    get_supabase_client,
     get_all_instructions_categories_lvl0, 
     get_instructions_categories_lvl0, 
     get_nom_instructions_categories_lvl0, 
     update_instruction_category_lvl0,
     get_instructions_juge_categories_lvl0,
     get_instruction_juge_by_nom,
+    get_instruction_by_nom,
+    get_instruction_complete_by_nom,
+    depot_instructions,
     post_instruction_category_lvl0
-)
\ No newline at end of file
+)
+from .depot import DepotInstructions
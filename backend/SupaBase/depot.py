@@ -0,0 +1,109 @@
+"""Dépôt des instructions niveau 0, avec cache en mémoire du processus.
+
+La table des instructions est petite et lue à chaque rerun du formulaire : elle est
+chargée en entier (toutes les colonnes, une seule requête) puis servie depuis le
+cache. À l'expiration du TTL, si la table possède une colonne `updated_at`, seule
+la date de dernière modification est relue : la table n'est rechargée que si elle
+a changé. Les écritures passant par le dépôt invalident le cache.
+"""
+
+import os
+import threading
+import time
+
+TABLE_INSTRUCTIONS = 'Instruction_categories_lvl0'
+TTL_DEFAUT = float(os.getenv("INSTRUCTIONS_CACHE_TTL", "300"))
+
+
+class DepotInstructions:
+    """
+    Accès aux instructions niveau 0 (nom, instruction, instruction juge) via un cache TTL.
+    Args:
+        client: Client Supabase, ou fonction qui le retourne (client créé au premier accès).
+        ttl (float): Durée (s) pendant laquelle le cache est servi sans interroger Supabase.
+        table (str): Table des instructions.
+    """
+
+    def __init__(self, client, ttl=TTL_DEFAUT, table=TABLE_INSTRUCTIONS):
+        self._client = client
+        self.ttl = ttl
+        self.table = table
+        self._lignes = None
+        self._version = None
+        self._expire_le = 0.0
+        self._verrou = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client() if callable(self._client) else self._client
+
+    def _version_table(self):
+        """Date de dernière modification de la table (None si la colonne `updated_at` n'existe pas)."""
+
+        try:
+            response = self.client.table(self.table).select('updated_at').order('updated_at', desc=True).limit(1).execute()
+        except Exception:
+            return None
+        return response.data[0].get('updated_at') if response.data else None
+
+    def lignes(self):
+        """Retourne toutes les lignes de la table (toutes les colonnes), depuis le cache si possible."""
+
+        with self._verrou:
+            maintenant = time.monotonic()
+            if self._lignes is not None and maintenant < self._expire_le:
+                return self._lignes
+            # Une seule lecture de la version : elle sert à la comparaison puis à la table rechargée
+            version = self._version_table()
+            if self._lignes is not None and self._version is not None and version == self._version:
+                self._expire_le = maintenant + self.ttl
+                return self._lignes
+            response = self.client.table(self.table).select('*').execute()
+            self._lignes = response.data or []
+            self._version = version
+            self._expire_le = time.monotonic() + self.ttl
+            return self._lignes
+
+    def noms(self):
+        """Noms des instructions."""
+
+        return [ligne['Nom'] for ligne in self.lignes() if 'Nom' in ligne]
+
+    def par_nom(self, nom):
+        """
+        Retourne la ligne complète d'une instruction.
+        Hors cache, seule cette ligne est lue (une requête, toutes les colonnes).
+        Returns:
+            dict | None: Colonnes de la ligne (Nom, Instruction, Instruction_juge...), None si inconnue.
+        """
+        with self._verrou:
+            if self._lignes is not None and time.monotonic() < self._expire_le:
+                return next((ligne for ligne in self._lignes if ligne.get('Nom') == nom), None)
+        response = self.client.table(self.table).select('*').eq('Nom', nom).limit(1).execute()
+        return response.data[0] if response.data else None
+
+    def invalider(self):
+        """Vide le cache : la prochaine lecture recharge la table."""
+
+        with self._verrou:
+            self._lignes = None
+            self._version = None
+            self._expire_le = 0.0
+
+    def modifier(self, nom, valeurs):
+        """Met à jour l'instruction `nom` avec `valeurs` (colonnes) et invalide le cache."""
+
+        try:
+            response = self.client.table(self.table).update(valeurs).eq('Nom', nom).execute()
+        finally:
+            self.invalider()
+        return response.data
+
+    def ajouter(self, valeurs):
+        """Insère une instruction et invalide le cache."""
+
+        try:
+            response = self.client.table(self.table).insert(valeurs).execute()
+        finally:
+            self.invalider()
+        return response.data
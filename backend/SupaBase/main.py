@@ -1,61 +1,87 @@
-"""Fonctions de lecture et d'écriture des instructions stockées dans Supabase."""
+"""Fonctions de lecture et d'écriture des instructions stockées dans Supabase.
+
+Le client Supabase n'est créé (et le SDK importé) qu'au premier accès à la base :
+importer ce module ne coûte rien et ne requiert pas SUPABASE_URL / SUPABASE_KEY.
+"""
 
 import os
 import sys
+import threading
 from dotenv import load_dotenv
-from supabase import create_client, Client
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.SupaBase.depot import DepotInstructions
 
 load_dotenv()
 
+_client = None
+_verrou_client = threading.Lock()
+
+
+def get_supabase_client():
+    """Retourne le client Supabase partagé, créé à la première utilisation (SUPABASE_URL / SUPABASE_KEY)."""
+
+    global _client
+    if _client is None:
+        with _verrou_client:
+            if _client is None:
+                from supabase import create_client
+
+                _client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+    return _client
 
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+def __getattr__(nom):
+    # Compatibilité : `supabase` était le client créé à l'import du module
+    if nom == "supabase":
+        return get_supabase_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {nom!r}")
+
+
+# Lectures servies depuis un cache en mémoire, invalidé par les écritures ci-dessous
+depot_instructions = DepotInstructions(get_supabase_client)
+
 
 
 def get_all_instructions_categories_lvl0():
     """Récupère toutes les colonnes de la table des instructions niveau 0."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('*').execute()
-    return response.data
+    return depot_instructions.lignes()
 
 def get_instructions_categories_lvl0():
     """Liste uniquement la colonne "Instruction" de la table."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('Instruction').execute()
-    return [item['Instruction'] for item in response.data if 'Instruction' in item]
+    return [item['Instruction'] for item in depot_instructions.lignes() if 'Instruction' in item]
 
 def get_nom_instructions_categories_lvl0():
     """Récupère la liste des noms d'instructions niveau 0."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('Nom').execute()
-    return [item['Nom'] for item in response.data if 'Nom' in item]
+    return depot_instructions.noms()
+
+def get_instruction_complete_by_nom(nom):
+    """Retourne toutes les colonnes (Instruction, Instruction_juge...) d'une instruction, ou None."""
+
+    return depot_instructions.par_nom(nom)
 
 def get_instruction_by_nom(nom):
     """Retourne l'instruction associée à un nom de catégorie."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('Instruction').eq('Nom', nom).execute()
-    if response.data and 'Instruction' in response.data[0]:
-        return response.data[0]['Instruction']
-    return None
+    ligne = depot_instructions.par_nom(nom)
+    return ligne.get('Instruction') if ligne else None
 
 def get_instructions_juge_categories_lvl0():
     """Liste la colonne "Instruction_juge" de la table."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('Instruction_juge').execute()
-    return [item['Instruction_juge'] for item in response.data if 'Instruction_juge' in item]
+    return [item['Instruction_juge'] for item in depot_instructions.lignes() if 'Instruction_juge' in item]
 
 def get_instruction_juge_by_nom(nom):
     """Récupère l'instruction juge à partir du nom de catégorie."""
 
-    response = supabase.table('Instruction_categories_lvl0').select('Instruction_juge').eq('Nom', nom).execute()
-    if response.data and 'Instruction_juge' in response.data[0]:
-        return response.data[0]['Instruction_juge']
-    return None
+    ligne = depot_instructions.par_nom(nom)
+    return ligne.get('Instruction_juge') if ligne else None
 
 def update_instruction_category_lvl0(nom_original, nouveau_nom=None, nouvelle_instruction=None, nouvelle_instruction_juge=None):
-    """Met à jour une instruction existante identifiée par son nom."""
+    """Met à jour une instruction existante identifiée par son nom (le cache des instructions est invalidé)."""
 
     update_data = {}
     if nouveau_nom is not None:
@@ -66,11 +92,9 @@ def update_instruction_category_lvl0(nom_original, nouveau_nom=None, nouvelle_in
         update_data['Instruction_juge'] = nouvelle_instruction_juge
     if not update_data:
         return None  # Rien à mettre à jour
-    response = supabase.table('Instruction_categories_lvl0').update(update_data).eq('Nom', nom_original).execute()
-    return response.data
+    return depot_instructions.modifier(nom_original, update_data)
 
 def post_instruction_category_lvl0(nom, instruction, instruction_juge):
-    """Insère une nouvelle instruction niveau 0 dans la base."""
+    """Insère une nouvelle instruction niveau 0 dans la base (le cache des instructions est invalidé)."""
 
-    response = supabase.table('Instruction_categories_lvl0').insert({'Nom': nom, 'Instruction': instruction, 'Instruction_juge': instruction_juge}).execute()
-    return response.data
+    return depot_instructions.ajouter({'Nom': nom, 'Instruction': instruction, 'Instruction_juge': instruction_juge})
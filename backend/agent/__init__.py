@@ -1 +1,10 @@
-from .main import enrichir_champ_batch, enrichir_champ_batch_excel
\ No newline at end of file
+from .main import enrichir_champ_batch, enrichir_champ_batch_excel, enrichir_champ_batch_excel_parallele
+from .moteur_async import enrichir_champ_batch_async, enrichir_champ_batch_concurrent, enrichir_categorie
+from .cache import PromptCache
+from .batch_api import enrichir_champ_batch_api
+from .juge import JudgePolicy
+from .scheduler import OpenAIScheduler
+from .journal import JobJournal, lister_jobs, ouvrir_journal
+from .runner import JobRunner, executer_enrichissement
+from .template import PromptTemplate, compiler_prompt
+from .empreintes import IndexEmpreintes
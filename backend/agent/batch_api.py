@@ -0,0 +1,190 @@
+"""Mode d'exécution hors ligne via l'API Batch d'OpenAI.
+
+Les prompts de génération (puis ceux du juge) sont écrits dans un fichier JSONL,
+soumis en un seul batch, puis les résultats sont appliqués par le chemin
+d'écriture habituel une fois le batch terminé. Le coût par token est réduit
+de moitié et aucun appel synchrone n'est fait produit par produit.
+"""
+
+import json
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.agent.main import PipelineProduits
+from backend.metriques import REMISE_API_BATCH, compter_erreurs, enregistrer_appel_llm, etape
+from backend.stockage import chemin_donnees
+
+ENDPOINT_CHAT = "/v1/chat/completions"
+STATUTS_FINAUX = ("completed", "failed", "expired", "cancelled")
+
+
+def ecrire_fichier_batch(requetes, chemin):
+    """
+    Écrit les requêtes au format JSONL attendu par l'API Batch.
+    Args:
+        requetes (list): Tuples `(custom_id, model, prompt_systeme, prompt)`.
+        chemin (str): Fichier de destination.
+    Returns:
+        str: Chemin du fichier écrit.
+    """
+    with open(chemin, "w", encoding="utf-8") as fichier:
+        for custom_id, model, prompt_systeme, prompt in requetes:
+            ligne = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": ENDPOINT_CHAT,
+                "body": {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": prompt_systeme},
+                        {"role": "user", "content": prompt}
+                    ]
+                }
+            }
+            fichier.write(json.dumps(ligne, ensure_ascii=False) + "\n")
+    return chemin
+
+
+def soumettre_batch(openai_client, chemin, completion_window="24h"):
+    """Téléverse le fichier JSONL et crée le batch. Retourne l'objet batch."""
+
+    with open(chemin, "rb") as fichier:
+        fichier_batch = openai_client.files.create(file=fichier, purpose="batch")
+    return openai_client.batches.create(
+        input_file_id=fichier_batch.id,
+        endpoint=ENDPOINT_CHAT,
+        completion_window=completion_window
+    )
+
+
+def attendre_batch(openai_client, batch_id, intervalle=30, timeout=24 * 3600, progress_callback=None):
+    """
+    Interroge le batch jusqu'à un statut final.
+    Args:
+        intervalle (float): Délai entre deux interrogations, en secondes.
+        timeout (float): Durée maximale d'attente, en secondes.
+        progress_callback (callable, optionnel): Reçoit l'objet batch à chaque interrogation.
+    Returns:
+        Batch: Dernier état du batch.
+    """
+    debut = time.monotonic()
+    while True:
+        batch = openai_client.batches.retrieve(batch_id)
+        if progress_callback is not None:
+            progress_callback(batch)
+        if batch.status in STATUTS_FINAUX:
+            return batch
+        if time.monotonic() - debut > timeout:
+            raise TimeoutError(f"Batch {batch_id} toujours '{batch.status}' après {timeout} s.")
+        time.sleep(intervalle)
+
+
+def lire_resultats_batch(openai_client, batch):
+    """
+    Télécharge le fichier de sortie d'un batch terminé.
+    Returns:
+        dict: `{custom_id: contenu}` pour les requêtes réussies.
+    """
+    resultats = {}
+    if not batch.output_file_id:
+        return resultats
+    contenu = openai_client.files.content(batch.output_file_id).text
+    for ligne in contenu.splitlines():
+        if not ligne.strip():
+            continue
+        resultat = json.loads(ligne)
+        response = resultat.get("response") or {}
+        if resultat.get("error") or response.get("status_code") != 200:
+            print(f"Erreur batch pour {resultat.get('custom_id')} : {resultat.get('error') or response.get('status_code')}")
+            continue
+        corps = response["body"]
+        enregistrer_appel_llm(corps.get("model"), corps.get("usage"), remise=REMISE_API_BATCH)
+        resultats[resultat["custom_id"]] = corps["choices"][0]["message"]["content"].strip()
+    return resultats
+
+
+def executer_batch(openai_client, requetes, nom, intervalle=30, timeout=24 * 3600, progress_callback=None):
+    """
+    Écrit, soumet et attend un batch, puis retourne ses résultats.
+    Args:
+        requetes (list): Tuples `(custom_id, model, prompt_systeme, prompt)`.
+        nom (str): Nom du fichier JSONL (conservé dans le répertoire de données `batches/`).
+    Returns:
+        dict: `{custom_id: contenu}`.
+    """
+    if not requetes:
+        return {}
+    chemin = ecrire_fichier_batch(requetes, chemin_donnees("batches", f"{nom}.jsonl"))
+    batch = soumettre_batch(openai_client, chemin)
+    print(f"Batch {batch.id} soumis ({len(requetes)} requêtes, fichier {chemin})")
+    batch = attendre_batch(openai_client, batch.id, intervalle, timeout, progress_callback)
+    if batch.status != "completed":
+        print(f"Batch {batch.id} terminé avec le statut '{batch.status}'")
+    return lire_resultats_batch(openai_client, batch)
+
+
+def enrichir_champ_batch_api(index_name, produits, champ_cible, prompt_user, openai_client, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, tampon=None, cache=None, juger=True, politique_juge=None, intervalle=30, timeout=24 * 3600, progress_callback=None, journal=None, empreintes=None):
+    """
+    Variante de `enrichir_champ_batch` qui passe par l'API Batch d'OpenAI.
+
+    Deux batchs sont soumis successivement : génération, puis jugement des valeurs
+    générées (si `juger`). Les valeurs finales sont écrites via `tampon` ou
+    `post_new_value_for_product`. Les prompts présents dans `cache` ne sont pas soumis.
+    Args:
+        intervalle (float): Délai entre deux interrogations du batch, en secondes.
+        timeout (float): Durée maximale d'attente de chaque batch, en secondes.
+        progress_callback (callable, optionnel): Reçoit l'objet batch à chaque interrogation.
+        politique_juge (JudgePolicy, optionnel): Sélection des générations soumises au juge (par défaut : toutes).
+        journal (JobJournal, optionnel): Journal du job ; les produits déjà traités ne sont pas soumis.
+        empreintes (IndexEmpreintes, optionnel): Empreintes des entrées déjà écrites ; les produits inchangés ne sont pas soumis.
+        Les autres arguments sont ceux de `enrichir_champ_batch`.
+    Returns:
+        int: Nombre de produits enrichis.
+    """
+    pipeline = PipelineProduits(
+        index_name, champ_cible, prompt_user, model, system_instruction, judge_instruction, excel_knowledge,
+        tampon=tampon, politique_juge=politique_juge, journal=journal, empreintes=empreintes
+    )
+    horodatage = time.strftime("%Y%m%d-%H%M%S")
+
+    def passe(nom, nom_etape, prompts_par_id, prompt_sys):
+        """
+        Résout les prompts depuis le cache puis soumet le reste dans un batch (durée mesurée dans `nom_etape`).
+        Returns:
+            tuple: `(reponses, erreurs)` par identifiant de produit ; les requêtes absentes de la sortie
+                du batch sont en erreur.
+        """
+        if not prompts_par_id:
+            return {}, {}
+        identifiants = {f"{nom}-{ident}": ident for ident in prompts_par_id}
+        resultats = {}
+        requetes = []
+        for custom_id, ident in identifiants.items():
+            prompt = prompts_par_id[ident]
+            reponse = cache.get(model, prompt_sys, prompt) if cache is not None else None
+            if reponse is not None:
+                resultats[custom_id] = reponse
+            else:
+                requetes.append((custom_id, model, prompt_sys, prompt))
+        with etape(nom_etape):
+            nouveaux = executer_batch(openai_client, requetes, f"{horodatage}-{nom}", intervalle, timeout, progress_callback)
+        # Requêtes absentes de la sortie du batch (en erreur)
+        compter_erreurs(nom_etape, sum(1 for custom_id, *_ in requetes if custom_id not in nouveaux))
+        if cache is not None:
+            for custom_id, _, _, prompt in requetes:
+                if nouveaux.get(custom_id):
+                    cache.set(model, prompt_sys, prompt, nouveaux[custom_id])
+        resultats.update(nouveaux)
+        reponses = {identifiants[custom_id]: reponse for custom_id, reponse in resultats.items()}
+        erreurs = {
+            ident: "absent de la sortie du batch"
+            for custom_id, ident in identifiants.items() if custom_id not in resultats
+        }
+        return reponses, erreurs
+
+    # Tous les produits forment un seul lot : une passe de génération puis une passe de jugement
+    lot = pipeline.preparer(list(produits))
+    prompts_jugement = pipeline.generes(lot, *passe("generation", "generation", lot.prompts, pipeline.prompt_systeme), juger=juger)
+    pipeline.juges(lot, *passe("jugement", "juge", prompts_jugement, pipeline.prompt_systeme_juge))
+    return pipeline.terminer(pipeline.ecrire(lot))
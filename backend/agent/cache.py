@@ -0,0 +1,156 @@
+"""Cache persistant (SQLite) des réponses LLM, indexé sur le prompt rendu.
+
+Deux appels avec le même modèle, le même prompt système et le même prompt
+utilisateur rendu (variantes taille/couleur d'un même produit, relance d'un
+enrichissement) ne coûtent ainsi qu'un seul appel OpenAI.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.metriques import enregistrer_appel_llm
+from backend.stockage import chemin_donnees
+
+TAILLE_LOT_LECTURES = 100
+
+
+def cle_prompt(model, prompt_systeme, prompt):
+    """Empreinte SHA-256 du triplet (modèle, prompt système, prompt utilisateur)."""
+
+    contenu = json.dumps([model, prompt_systeme, prompt], ensure_ascii=False)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    Cache SQLite des réponses LLM avec expiration et taille maximale.
+    Args:
+        chemin (str, optionnel): Fichier SQLite. Par défaut `prompt_cache.sqlite3` dans le répertoire de données.
+        ttl (float, optionnel): Durée de vie d'une réponse, en secondes. None = pas d'expiration.
+        max_entries (int, optionnel): Nombre maximal de réponses conservées (éviction des moins récemment lues).
+        bypass (bool): Si True, le cache n'est pas lu (les nouvelles réponses sont tout de même enregistrées).
+    """
+
+    def __init__(self, chemin=None, ttl=30 * 24 * 3600, max_entries=100_000, bypass=False):
+        self.chemin = chemin or chemin_donnees("prompt_cache.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._verrou = threading.Lock()
+        self._nb_ecritures = 0
+        # Dates de lecture en attente, enregistrées par lots plutôt qu'à chaque hit
+        self._lectures = {}
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._connexion.execute("PRAGMA journal_mode=WAL")
+        self._connexion.execute(
+            "CREATE TABLE IF NOT EXISTS reponses ("
+            "cle TEXT PRIMARY KEY, model TEXT, reponse TEXT, cree_le REAL, lu_le REAL)"
+        )
+        self._connexion.execute("CREATE INDEX IF NOT EXISTS reponses_lu_le ON reponses(lu_le)")
+        self._connexion.commit()
+
+    def get(self, model, prompt_systeme, prompt):
+        """Retourne la réponse en cache, ou None si absente, expirée ou si le cache est contourné."""
+
+        if self.bypass:
+            return None
+        cle = cle_prompt(model, prompt_systeme, prompt)
+        maintenant = time.time()
+        with self._verrou:
+            ligne = self._connexion.execute("SELECT reponse, cree_le FROM reponses WHERE cle = ?", (cle,)).fetchone()
+            if ligne is None or (self.ttl is not None and ligne[1] + self.ttl < maintenant):
+                self.misses += 1
+                return None
+            self._lectures[cle] = maintenant
+            if len(self._lectures) >= TAILLE_LOT_LECTURES:
+                self._enregistrer_lectures()
+                self._connexion.commit()
+            self.hits += 1
+            return ligne[0]
+
+    def set(self, model, prompt_systeme, prompt, reponse):
+        cle = cle_prompt(model, prompt_systeme, prompt)
+        maintenant = time.time()
+        with self._verrou:
+            self._connexion.execute(
+                "INSERT OR REPLACE INTO reponses (cle, model, reponse, cree_le, lu_le) VALUES (?, ?, ?, ?, ?)",
+                (cle, model, reponse, maintenant, maintenant),
+            )
+            self._nb_ecritures += 1
+            self._enregistrer_lectures()
+            # L'éviction n'est vérifiée que périodiquement pour ne pas compter à chaque écriture.
+            if self._nb_ecritures % 100 == 0:
+                self._evincer()
+            self._connexion.commit()
+
+    def _enregistrer_lectures(self):
+        if self._lectures:
+            self._connexion.executemany(
+                "UPDATE reponses SET lu_le = ? WHERE cle = ?", [(lu_le, cle) for cle, lu_le in self._lectures.items()]
+            )
+            self._lectures = {}
+
+    def _evincer(self):
+        # L'éviction des moins récemment lues s'appuie sur des dates de lecture à jour
+        self._enregistrer_lectures()
+        if self.ttl is not None:
+            self._connexion.execute("DELETE FROM reponses WHERE cree_le < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            self._connexion.execute(
+                "DELETE FROM reponses WHERE cle IN ("
+                "SELECT cle FROM reponses ORDER BY lu_le DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def purge(self):
+        """Applique immédiatement l'expiration et la limite de taille."""
+
+        with self._verrou:
+            self._evincer()
+            self._connexion.commit()
+
+    def clear(self):
+        with self._verrou:
+            self._connexion.execute("DELETE FROM reponses")
+            self._connexion.commit()
+
+    def __len__(self):
+        with self._verrou:
+            return self._connexion.execute("SELECT COUNT(*) FROM reponses").fetchone()[0]
+
+    def close(self):
+        with self._verrou:
+            self._enregistrer_lectures()
+            self._connexion.commit()
+            self._connexion.close()
+
+
+def completion_cachee(openai_client, model, prompt_systeme, prompt, cache=None):
+    """
+    Appelle `chat.completions.create` (client synchrone) en passant par le cache si fourni.
+    Returns:
+        str: Contenu de la réponse, sans espaces superflus.
+    """
+    if cache is not None:
+        reponse = cache.get(model, prompt_systeme, prompt)
+        if reponse is not None:
+            return reponse
+    response = openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": prompt_systeme},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    enregistrer_appel_llm(model, getattr(response, "usage", None))
+    reponse = response.choices[0].message.content.strip()
+    if cache is not None and reponse:
+        cache.set(model, prompt_systeme, prompt, reponse)
+    return reponse
@@ -0,0 +1,162 @@
+"""Index de recherche (BM25) sur le fichier de connaissance.
+
+Plutôt que d'injecter tout le fichier de connaissance dans chaque prompt système,
+le fichier est indexé une fois (index inversé BM25, mis en cache par empreinte du
+fichier et enregistré en JSON) et seules les `k` lignes les plus pertinentes pour chaque produit sont
+ajoutées à son prompt.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.cache_memoire import TTLCache
+from backend.fichiers.main import empreinte_fichier
+from backend.stockage import chemin_donnees
+
+NB_LIGNES_DEFAUT = 5
+LONGUEUR_MAX_LIGNE = 500
+NOTE_PROMPT_SYSTEME = (
+    "Les lignes du fichier de connaissance les plus pertinentes pour chaque produit "
+    "sont fournies avec le produit."
+)
+
+cache_index = TTLCache(ttl=3600, max_entries=8)
+
+
+def _tokeniser(texte):
+    """Mots en minuscules, sans accents, d'au moins deux caractères."""
+
+    texte = unicodedata.normalize("NFKD", str(texte).lower())
+    texte = "".join(c for c in texte if not unicodedata.combining(c))
+    return [mot for mot in re.findall(r"\w+", texte) if len(mot) > 1]
+
+
+class IndexConnaissance:
+    """
+    Index inversé BM25 sur les lignes d'un fichier de connaissance.
+    Args:
+        df (DataFrame): Contenu du fichier de connaissance.
+        k (int): Nombre de lignes retournées par défaut.
+        k1 (float), b (float): Paramètres BM25.
+    """
+
+    def __init__(self, df, k=NB_LIGNES_DEFAUT, k1=1.5, b=0.75):
+        self.k = k
+        self.k1 = k1
+        self.b = b
+        self.colonnes = [str(c) for c in df.columns]
+        self.lignes = []
+        self._postings = defaultdict(list)
+        self._longueurs = []
+        for valeurs in df.astype(object).where(df.notna(), "").itertuples(index=False, name=None):
+            texte = " | ".join(f"{colonne}: {valeur}" for colonne, valeur in zip(self.colonnes, valeurs) if str(valeur).strip())
+            numero = len(self.lignes)
+            self.lignes.append(texte[:LONGUEUR_MAX_LIGNE])
+            mots = _tokeniser(" ".join(str(v) for v in valeurs))
+            self._longueurs.append(len(mots))
+            for mot, frequence in Counter(mots).items():
+                self._postings[mot].append((numero, frequence))
+        self._postings = dict(self._postings)
+        self._calculer_statistiques()
+
+    def _calculer_statistiques(self):
+        nb = len(self.lignes)
+        self._longueur_moyenne = (sum(self._longueurs) / nb) if nb else 0.0
+        self._idf = {
+            mot: math.log(1 + (nb - len(postings) + 0.5) / (len(postings) + 0.5))
+            for mot, postings in self._postings.items()
+        }
+
+    def as_dict(self):
+        return {
+            "k": self.k,
+            "k1": self.k1,
+            "b": self.b,
+            "colonnes": self.colonnes,
+            "lignes": self.lignes,
+            "longueurs": self._longueurs,
+            "postings": self._postings,
+        }
+
+    @classmethod
+    def from_dict(cls, donnees):
+        index = cls.__new__(cls)
+        index.k = donnees["k"]
+        index.k1 = donnees["k1"]
+        index.b = donnees["b"]
+        index.colonnes = donnees["colonnes"]
+        index.lignes = donnees["lignes"]
+        index._longueurs = donnees["longueurs"]
+        index._postings = {mot: [tuple(posting) for posting in postings] for mot, postings in donnees["postings"].items()}
+        index._calculer_statistiques()
+        return index
+
+    def __len__(self):
+        return len(self.lignes)
+
+    def rechercher(self, requete, k=None):
+        """Retourne les numéros des `k` lignes les plus pertinentes pour `requete` (score BM25 > 0)."""
+
+        k = self.k if k is None else k
+        scores = defaultdict(float)
+        for mot in set(_tokeniser(requete)):
+            idf = self._idf.get(mot)
+            if idf is None:
+                continue
+            for numero, frequence in self._postings[mot]:
+                normalisation = 1 - self.b + self.b * self._longueurs[numero] / (self._longueur_moyenne or 1)
+                scores[numero] += idf * frequence * (self.k1 + 1) / (frequence + self.k1 * normalisation)
+        return [numero for numero, _ in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+
+    def extrait(self, requete, k=None):
+        """Retourne les lignes pertinentes pour `requete`, une par ligne de texte (vide si aucune)."""
+
+        return "\n".join(self.lignes[numero] for numero in self.rechercher(requete, k))
+
+
+def _lire_fichier(fichier, nom):
+    import pandas as pd
+
+    if nom.lower().endswith(".csv"):
+        return pd.read_csv(fichier, dtype=str, keep_default_na=False)
+    return pd.read_excel(fichier, dtype=str)
+
+
+def charger_index_connaissance(fichier, nom=None):
+    """
+    Retourne l'index BM25 d'un fichier de connaissance (xlsx, xls ou csv).
+
+    L'index est construit une seule fois par contenu de fichier : il est gardé en
+    mémoire et sur disque (dossier `connaissance/` du répertoire de données).
+    Args:
+        fichier: Fichier ouvert en binaire (ex. `UploadedFile` Streamlit).
+        nom (str, optionnel): Nom d'origine, pour déterminer le format. Par défaut `fichier.name`.
+    Returns:
+        IndexConnaissance: Index du fichier.
+    """
+    nom = nom or getattr(fichier, "name", "")
+    empreinte = empreinte_fichier(fichier)
+
+    def charger():
+        # Données seules (JSON) : un fichier du répertoire partagé ne peut pas exécuter de code au chargement
+        chemin = chemin_donnees("connaissance", f"{empreinte}.json")
+        if os.path.exists(chemin):
+            try:
+                with open(chemin, encoding="utf-8") as entree:
+                    return IndexConnaissance.from_dict(json.load(entree))
+            except Exception as e:
+                print(f"Index de connaissance illisible, reconstruction : {e}")
+        index = IndexConnaissance(_lire_fichier(fichier, nom))
+        with open(f"{chemin}.tmp", "w", encoding="utf-8") as sortie:
+            json.dump(index.as_dict(), sortie, ensure_ascii=False)
+        os.replace(f"{chemin}.tmp", chemin)
+        return index
+
+    return cache_index.get_or_load(empreinte, charger)
@@ -0,0 +1,185 @@
+"""Empreintes des entrées d'enrichissement, pour ne pas régénérer un produit inchangé.
+
+Pour chaque produit écrit, l'empreinte de ses entrées est conservée dans un index
+SQLite local : prompt utilisateur rendu (valeurs des @champs, lignes du fichier de
+connaissance) et version des instructions (prompts système et juge, modèle). À
+l'enrichissement suivant du même champ sur le même index, un produit dont
+l'empreinte n'a pas changé est ignoré : la ré-exécution nocturne d'une catégorie
+ne traite plus que les produits modifiés.
+
+L'empreinte n'est enregistrée qu'une fois la valeur écrite dans Algolia.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.stockage import chemin_donnees
+
+
+def _sha256(*parties):
+    empreinte = hashlib.sha256()
+    for partie in parties:
+        empreinte.update(str(partie).encode("utf-8"))
+        empreinte.update(b"\x00")
+    return empreinte.hexdigest()
+
+
+def version_instructions(model, prompt_systeme, prompt_systeme_juge):
+    """Version des instructions d'un enrichissement (modèle, prompt système, prompt du juge)."""
+
+    return _sha256(model, prompt_systeme, prompt_systeme_juge)[:16]
+
+
+def empreinte_entrees(version, prompt_utilisateur):
+    """Empreinte des entrées d'un produit : version des instructions et prompt utilisateur rendu."""
+
+    return _sha256(version, prompt_utilisateur)
+
+
+class IndexEmpreintes:
+    """
+    Empreintes des entrées des produits écrits pour un champ d'un index Algolia.
+    Args:
+        index_name (str): Index Algolia enrichi.
+        champ_cible (str): Champ enrichi.
+        chemin (str, optionnel): Fichier SQLite. Par défaut `empreintes.sqlite3` dans le répertoire de données.
+    """
+
+    def __init__(self, index_name, champ_cible, chemin=None):
+        self.index_name = index_name
+        self.champ_cible = champ_cible
+        self.chemin = chemin or chemin_donnees("empreintes.sqlite3")
+        self.nb_ignores = 0
+        # Rappel optionnel recevant les objectIDs des produits inchangés (ex. `StagingStore.noter_inchanges`)
+        self.apres_inchanges = None
+        # Empreintes des produits envoyés, enregistrées une fois l'écriture confirmée
+        self._en_attente = {}
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._connexion.execute("PRAGMA journal_mode=WAL")
+        self._connexion.execute(
+            "CREATE TABLE IF NOT EXISTS empreintes ("
+            "index_name TEXT, champ TEXT, object_id TEXT, empreinte TEXT, maj_le REAL, "
+            "PRIMARY KEY (index_name, champ, object_id))"
+        )
+        self._connexion.commit()
+
+    def inchanges(self, empreintes):
+        """
+        Compare des empreintes à celles enregistrées.
+        Args:
+            empreintes (dict): `{object_id: empreinte}`.
+        Returns:
+            set: objectIDs dont l'empreinte enregistrée est identique.
+        """
+        empreintes = {str(object_id): e for object_id, e in empreintes.items() if object_id not in (None, "")}
+        identiques = set()
+        object_ids = list(empreintes)
+        with self._verrou:
+            for debut in range(0, len(object_ids), 500):
+                tranche = object_ids[debut:debut + 500]
+                lignes = self._connexion.execute(
+                    "SELECT object_id, empreinte FROM empreintes WHERE index_name = ? AND champ = ? "
+                    f"AND object_id IN ({','.join('?' * len(tranche))})",
+                    (self.index_name, self.champ_cible, *tranche),
+                ).fetchall()
+                identiques.update(object_id for object_id, empreinte in lignes if empreintes[object_id] == empreinte)
+            self.nb_ignores += len(identiques)
+        if identiques and self.apres_inchanges is not None:
+            self.apres_inchanges(identiques)
+        return identiques
+
+    def retenir(self, empreintes):
+        """Garde `{object_id: empreinte}` en attente de la confirmation d'écriture (`valider`)."""
+
+        with self._verrou:
+            self._en_attente.update({str(object_id): e for object_id, e in empreintes.items() if object_id not in (None, "")})
+
+    def en_attente(self, object_id):
+        """Empreinte retenue d'un produit pas encore écrit, None s'il n'y en a pas."""
+
+        with self._verrou:
+            return self._en_attente.get(str(object_id))
+
+    def valider(self, object_ids):
+        """Enregistre les empreintes en attente des produits écrits (utilisable comme `apres_ecriture`)."""
+
+        with self._verrou:
+            empreintes = {
+                str(object_id): self._en_attente.pop(str(object_id))
+                for object_id in object_ids if str(object_id) in self._en_attente
+            }
+        self.enregistrer(empreintes)
+
+    def enregistrer(self, empreintes):
+        """Enregistre directement `{object_id: empreinte}` pour des produits dont la valeur est écrite."""
+
+        maintenant = time.time()
+        with self._verrou:
+            self._connexion.executemany(
+                "INSERT INTO empreintes (index_name, champ, object_id, empreinte, maj_le) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (index_name, champ, object_id) DO UPDATE SET "
+                "empreinte = excluded.empreinte, maj_le = excluded.maj_le",
+                [(self.index_name, self.champ_cible, str(object_id), e, maintenant) for object_id, e in empreintes.items()],
+            )
+            self._connexion.commit()
+
+    def oublier(self, object_ids=None):
+        """Supprime les empreintes (de ces produits, ou de tout le champ) : ils seront de nouveau enrichis."""
+
+        with self._verrou:
+            if object_ids is None:
+                self._connexion.execute(
+                    "DELETE FROM empreintes WHERE index_name = ? AND champ = ?", (self.index_name, self.champ_cible)
+                )
+            else:
+                self._connexion.executemany(
+                    "DELETE FROM empreintes WHERE index_name = ? AND champ = ? AND object_id = ?",
+                    [(self.index_name, self.champ_cible, str(object_id)) for object_id in object_ids],
+                )
+            self._connexion.commit()
+
+    def close(self):
+        with self._verrou:
+            self._connexion.close()
+
+
+def produits_inchanges(empreintes, version, object_ids, prompts):
+    """
+    Sépare les produits d'un groupe dont les entrées n'ont pas changé depuis leur dernière écriture.
+    Les empreintes des autres produits sont retenues jusqu'à leur écriture.
+    Args:
+        empreintes (IndexEmpreintes | None): Index des empreintes (None = aucun produit ignoré).
+        version (str): Version des instructions (`version_instructions`).
+        object_ids (dict): `{identifiant: objectID}` des produits du groupe.
+        prompts (dict): `{identifiant: prompt utilisateur rendu}`.
+    Returns:
+        set: Identifiants des produits inchangés, à ignorer.
+    """
+    if empreintes is None or not prompts:
+        return set()
+    calculees = {object_ids[ident]: empreinte_entrees(version, prompt) for ident, prompt in prompts.items()}
+    identiques = empreintes.inchanges(calculees)
+    inchanges = {ident for ident in prompts if str(object_ids[ident]) in identiques}
+    empreintes.retenir({object_id: e for object_id, e in calculees.items() if str(object_id) not in identiques})
+    return inchanges
+
+
+def suivre_ecritures(empreintes, tampon):
+    """Enregistre les empreintes à chaque lot écrit par `tampon`, après son rappel `apres_ecriture` existant."""
+
+    if empreintes is None or tampon is None or getattr(tampon.apres_ecriture, "empreintes", None) is empreintes:
+        return
+    precedent = tampon.apres_ecriture
+
+    def apres_ecriture(object_ids):
+        if precedent is not None:
+            precedent(object_ids)
+        empreintes.valider(object_ids)
+
+    apres_ecriture.empreintes = empreintes
+    tampon.apres_ecriture = apres_ecriture
@@ -0,0 +1,240 @@
+"""Journal SQLite des jobs d'enrichissement, pour les reprendre après interruption.
+
+Chaque produit d'un job passe par les états `pending` → `generated` → `judged` →
+`written`. La valeur générée (puis jugée) est conservée avec l'état : à la reprise,
+les produits déjà écrits sont ignorés et ceux déjà générés ou jugés ne repassent
+pas par le LLM. Seul un job interrompu (en cours ou en erreur) est repris : un job
+terminé relancé avec les mêmes paramètres repart d'un nouveau journal.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.stockage import chemin_donnees
+
+ETATS_PRODUIT = ("pending", "generated", "judged", "written")
+# Statuts d'un job qui peut être repris (un job terminé est relancé à neuf)
+STATUTS_REPRENABLES = ("en_cours", "erreur")
+
+
+def identifiant_job(**parametres):
+    """Identifiant stable d'un job, dérivé de ses paramètres (index, champ, prompts, modèle...)."""
+
+    contenu = json.dumps(parametres, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()[:16]
+
+
+def _encoder_parametres(parametres):
+    return json.dumps(parametres or {}, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def dernier_job(parametres, chemin=None):
+    """
+    Dernier job enregistré avec exactement ces paramètres.
+    Returns:
+        tuple | None: `(job_id, statut)`, None si aucun job n'a ces paramètres.
+    """
+    connexion = sqlite3.connect(chemin or chemin_donnees("jobs.sqlite3"))
+    try:
+        _creer_tables(connexion)
+        return connexion.execute(
+            "SELECT job_id, statut FROM jobs WHERE parametres = ? ORDER BY maj_le DESC LIMIT 1",
+            (_encoder_parametres(parametres),),
+        ).fetchone()
+    finally:
+        connexion.close()
+
+
+def ouvrir_journal(parametres, reprendre=True, chemin=None):
+    """
+    Ouvre le journal d'un job d'enrichissement.
+    Le job de mêmes paramètres est repris s'il a été interrompu (statut "en_cours" ou "erreur") ;
+    sinon — job terminé, inconnu ou reprise refusée — un nouveau job est créé.
+    Args:
+        parametres (dict): Paramètres identifiant le job (index, champ, prompts, modèle, sélection...).
+        reprendre (bool): Reprend le job interrompu de mêmes paramètres s'il existe.
+        chemin (str, optionnel): Fichier SQLite du journal.
+    Returns:
+        JobJournal: Journal du job.
+    """
+    precedent = dernier_job(parametres, chemin)
+    if precedent is None:
+        job_id = identifiant_job(**parametres)
+    elif reprendre and precedent[1] in STATUTS_REPRENABLES:
+        job_id = precedent[0]
+    else:
+        job_id = identifiant_job(**parametres, lance_le=time.time())
+    return JobJournal(job_id, chemin=chemin, parametres=parametres)
+
+
+def _creer_tables(connexion):
+    connexion.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "job_id TEXT PRIMARY KEY, parametres TEXT, statut TEXT, cree_le REAL, maj_le REAL)"
+    )
+    connexion.execute(
+        "CREATE TABLE IF NOT EXISTS produits ("
+        "job_id TEXT, object_id TEXT, etat TEXT, valeur TEXT, maj_le REAL, "
+        "PRIMARY KEY (job_id, object_id))"
+    )
+
+
+class JobJournal:
+    """
+    État persistant, produit par produit, d'un job d'enrichissement.
+    Args:
+        job_id (str): Identifiant du job. Un job existant est repris tel quel.
+        chemin (str, optionnel): Fichier SQLite. Par défaut `jobs.sqlite3` dans le répertoire de données.
+        parametres (dict, optionnel): Paramètres du job, enregistrés à sa création (pour affichage).
+    """
+
+    def __init__(self, job_id, chemin=None, parametres=None):
+        self.job_id = job_id
+        self.chemin = chemin or chemin_donnees("jobs.sqlite3")
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        self._connexion.execute("PRAGMA journal_mode=WAL")
+        _creer_tables(self._connexion)
+        maintenant = time.time()
+        # Un job existant est rouvert pour être exécuté : il repasse "en_cours"
+        self._connexion.execute(
+            "INSERT INTO jobs (job_id, parametres, statut, cree_le, maj_le) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET statut = excluded.statut, maj_le = excluded.maj_le",
+            (job_id, _encoder_parametres(parametres), "en_cours", maintenant, maintenant),
+        )
+        self._connexion.commit()
+
+    def reprendre(self, object_ids):
+        """
+        Prépare un groupe de produits pour ce job : les objectIDs inconnus sont enregistrés à l'état `pending`.
+        Returns:
+            dict: `{object_id: (etat, valeur)}` pour les produits déjà générés, jugés ou écrits.
+        """
+        object_ids = [str(object_id) for object_id in object_ids if object_id not in (None, "")]
+        etats = {}
+        with self._verrou:
+            for debut in range(0, len(object_ids), 500):
+                tranche = object_ids[debut:debut + 500]
+                lignes = self._connexion.execute(
+                    f"SELECT object_id, etat, valeur FROM produits WHERE job_id = ? AND object_id IN ({','.join('?' * len(tranche))})",
+                    (self.job_id, *tranche),
+                ).fetchall()
+                etats.update({object_id: (etat, valeur) for object_id, etat, valeur in lignes})
+            maintenant = time.time()
+            self._connexion.executemany(
+                "INSERT OR IGNORE INTO produits (job_id, object_id, etat, valeur, maj_le) VALUES (?, ?, 'pending', NULL, ?)",
+                [(self.job_id, object_id, maintenant) for object_id in object_ids if object_id not in etats],
+            )
+            self._connexion.commit()
+        return {object_id: etat for object_id, etat in etats.items() if etat[0] != "pending"}
+
+    def marquer(self, etat, valeurs):
+        """
+        Passe des produits dans l'état `etat`.
+        Args:
+            etat (str): Un des `ETATS_PRODUIT`.
+            valeurs (dict): `{object_id: valeur}`. Une valeur None conserve la valeur enregistrée.
+        """
+        if etat not in ETATS_PRODUIT:
+            raise ValueError(f"État inconnu : {etat}")
+        maintenant = time.time()
+        with self._verrou:
+            self._connexion.executemany(
+                "INSERT INTO produits (job_id, object_id, etat, valeur, maj_le) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (job_id, object_id) DO UPDATE SET "
+                "etat = excluded.etat, valeur = COALESCE(excluded.valeur, produits.valeur), maj_le = excluded.maj_le",
+                [(self.job_id, str(object_id), etat, valeur, maintenant) for object_id, valeur in valeurs.items() if object_id not in (None, "")],
+            )
+            self._connexion.execute("UPDATE jobs SET maj_le = ? WHERE job_id = ?", (maintenant, self.job_id))
+            self._connexion.commit()
+
+    def marquer_ecrits(self, object_ids):
+        """Passe des produits à l'état `written` (utilisable comme `apres_ecriture` d'un `WriteBackBuffer`)."""
+
+        self.marquer("written", {object_id: None for object_id in object_ids})
+
+    def progression(self):
+        """Retourne le nombre de produits du job dans chaque état."""
+
+        with self._verrou:
+            lignes = self._connexion.execute(
+                "SELECT etat, COUNT(*) FROM produits WHERE job_id = ? GROUP BY etat", (self.job_id,)
+            ).fetchall()
+        comptes = dict.fromkeys(ETATS_PRODUIT, 0)
+        comptes.update(dict(lignes))
+        return comptes
+
+    def terminer(self, statut="termine"):
+        with self._verrou:
+            self._connexion.execute(
+                "UPDATE jobs SET statut = ?, maj_le = ? WHERE job_id = ?", (statut, time.time(), self.job_id)
+            )
+            self._connexion.commit()
+
+    def close(self):
+        with self._verrou:
+            self._connexion.close()
+
+
+def etats_reprise(journal, object_ids):
+    """
+    Lit dans le journal l'état des produits d'un groupe.
+    Args:
+        journal (JobJournal | None): Journal du job (None = pas de reprise).
+        object_ids (dict): `{identifiant: objectID}` des produits du groupe.
+    Returns:
+        tuple: `(ecrits, valeurs, jugees)` — identifiants déjà écrits, `{identifiant: valeur}`
+            déjà générées ou jugées, et identifiants dont la valeur est déjà jugée.
+    """
+    ecrits, valeurs, jugees = set(), {}, set()
+    if journal is None:
+        return ecrits, valeurs, jugees
+    etats = journal.reprendre(object_ids.values())
+    for identifiant, object_id in object_ids.items():
+        etat, valeur = etats.get(str(object_id), ("pending", None))
+        if etat == "written":
+            ecrits.add(identifiant)
+        elif valeur is not None:
+            valeurs[identifiant] = valeur
+            if etat == "judged":
+                jugees.add(identifiant)
+    return ecrits, valeurs, jugees
+
+
+def journaliser(journal, etat, object_ids, valeurs):
+    """Enregistre `{identifiant: valeur}` à l'état `etat` si un journal est fourni."""
+
+    if journal is not None and valeurs:
+        journal.marquer(etat, {object_ids[identifiant]: valeur for identifiant, valeur in valeurs.items()})
+
+
+def lister_jobs(chemin=None):
+    """Retourne les jobs du journal (le plus récent en premier) avec leur progression."""
+
+    connexion = sqlite3.connect(chemin or chemin_donnees("jobs.sqlite3"))
+    try:
+        _creer_tables(connexion)
+        jobs = []
+        for job_id, parametres, statut, cree_le, maj_le in connexion.execute(
+            "SELECT job_id, parametres, statut, cree_le, maj_le FROM jobs ORDER BY maj_le DESC"
+        ):
+            comptes = dict.fromkeys(ETATS_PRODUIT, 0)
+            comptes.update(dict(connexion.execute(
+                "SELECT etat, COUNT(*) FROM produits WHERE job_id = ? GROUP BY etat", (job_id,)
+            ).fetchall()))
+            jobs.append({
+                "job_id": job_id,
+                "parametres": json.loads(parametres or "{}"),
+                "statut": statut,
+                "cree_le": cree_le,
+                "maj_le": maj_le,
+                "progression": comptes,
+            })
+        return jobs
+    finally:
+        connexion.close()
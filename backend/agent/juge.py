@@ -0,0 +1,118 @@
+"""Politique de déclenchement du juge LLM.
+
+Le juge double le trafic LLM. Une politique permet de ne l'appeler que sur un
+échantillon des générations, ou seulement quand des contrôles locaux peu coûteux
+(longueur, valeur vide, format attendu, expressions interdites) signalent une
+génération douteuse.
+"""
+
+import hashlib
+import re
+import threading
+
+MODES_JUGE = ("toujours", "echantillon", "heuristique")
+
+EXPRESSIONS_INTERDITES_DEFAUT = (
+    "en tant qu'ia",
+    "en tant qu'assistant",
+    "je ne peux pas",
+    "désolé",
+    "information insuffisante",
+)
+
+
+class JudgeStats:
+    """Compteurs d'un enrichissement : générations évaluées, jugées, ignorées et motifs de signalement."""
+
+    def __init__(self):
+        self.evaluees = 0
+        self.jugees = 0
+        self.ignorees = 0
+        self.motifs = {}
+        self._verrou = threading.Lock()
+
+    def enregistrer(self, juger, motifs):
+        with self._verrou:
+            self.evaluees += 1
+            if juger:
+                self.jugees += 1
+            else:
+                self.ignorees += 1
+            for motif in motifs:
+                self.motifs[motif] = self.motifs.get(motif, 0) + 1
+
+    def as_dict(self):
+        with self._verrou:
+            return {
+                "evaluees": self.evaluees,
+                "jugees": self.jugees,
+                "ignorees": self.ignorees,
+                "motifs": dict(self.motifs),
+            }
+
+
+class JudgePolicy:
+    """
+    Décide, génération par génération, si le juge doit être appelé.
+
+    - "toujours" : toutes les générations sont jugées (comportement historique) ;
+    - "echantillon" : les générations signalées par les heuristiques, plus `taux_echantillon`
+      des autres (tirage déterministe par objectID) ;
+    - "heuristique" : uniquement les générations signalées.
+
+    Args:
+        mode (str): "toujours", "echantillon" ou "heuristique".
+        taux_echantillon (float): Part (0 à 1) des générations non signalées jugées en mode "echantillon".
+        longueur_min (int): Longueur minimale (caractères) d'une génération acceptable.
+        longueur_max (int, optionnel): Longueur maximale.
+        format_attendu (str, optionnel): Expression régulière que la génération doit respecter entièrement.
+        expressions_interdites (iterable): Expressions (insensibles à la casse) qui signalent la génération.
+    """
+
+    def __init__(self, mode="toujours", taux_echantillon=0.1, longueur_min=1, longueur_max=None, format_attendu=None, expressions_interdites=EXPRESSIONS_INTERDITES_DEFAUT):
+        if mode not in MODES_JUGE:
+            raise ValueError(f"Mode de juge inconnu : {mode} (attendu : {', '.join(MODES_JUGE)})")
+        self.mode = mode
+        self.taux_echantillon = taux_echantillon
+        self.longueur_min = longueur_min
+        self.longueur_max = longueur_max
+        self.format_attendu = re.compile(format_attendu, re.S) if format_attendu else None
+        self.expressions_interdites = tuple(e.lower() for e in expressions_interdites)
+        self.stats = JudgeStats()
+
+    def signaler(self, valeur):
+        """Retourne la liste des motifs pour lesquels la génération est douteuse (vide si aucun)."""
+
+        valeur = (valeur or "").strip()
+        if not valeur:
+            return ["vide"]
+        motifs = []
+        if len(valeur) < self.longueur_min:
+            motifs.append("trop_courte")
+        if self.longueur_max is not None and len(valeur) > self.longueur_max:
+            motifs.append("trop_longue")
+        if self.format_attendu is not None and not self.format_attendu.fullmatch(valeur):
+            motifs.append("format")
+        valeur_min = valeur.lower()
+        if any(expression in valeur_min for expression in self.expressions_interdites):
+            motifs.append("expression_interdite")
+        return motifs
+
+    def _echantillonne(self, cle):
+        empreinte = hashlib.sha256(str(cle).encode("utf-8")).digest()
+        return int.from_bytes(empreinte[:8], "big") / 2 ** 64 < self.taux_echantillon
+
+    def doit_juger(self, valeur, cle=""):
+        """
+        Indique si la génération `valeur` (produit identifié par `cle`) doit passer par le juge.
+        La décision est comptabilisée dans `stats`.
+        """
+        motifs = [] if self.mode == "toujours" else self.signaler(valeur)
+        if self.mode == "toujours" or motifs:
+            juger = True
+        elif self.mode == "echantillon":
+            juger = self._echantillonne(cle)
+        else:
+            juger = False
+        self.stats.enregistrer(juger, motifs)
+        return juger
@@ -3,13 +3,264 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 import os
-from openai import OpenAI
 from typing import Dict, Any
+import contextvars
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from backend.POST.main import post_new_value_for_product
-import re
+from backend.agent.empreintes import produits_inchanges, suivre_ecritures, version_instructions
+from backend.agent.connaissance import NOTE_PROMPT_SYSTEME, IndexConnaissance
+from backend.agent.juge import JudgePolicy
+from backend.agent.journal import etats_reprise, journaliser
+from backend.agent.packing import completions_groupees, identifiants_groupe, par_groupes
+from backend.agent.template import PromptTemplate, compiler_prompt
+from backend.metriques import compter_erreurs, etape
 
-def enrichir_champ_batch(index_name, produits, champ_cible, prompt_user, openai_client, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None):
+
+PROMPT_SYSTEME_JUGE_DEFAUT = "Tu es un expert en data quality et enrichissement de données produit."
+
+
+def extraire_champs_sources(prompt_user):
+    """Retourne l'ensemble des @champs référencés dans le prompt utilisateur."""
+
+    return set(compiler_prompt(str(prompt_user)).champs)
+
+
+def extraire_object_id(prod_dict):
+    """Retourne l'identifiant Algolia d'un produit (objectID ou object_id)."""
+
+    return prod_dict.get("objectID", prod_dict.get("object_id", ""))
+
+
+def construire_prompt_systeme(champ_cible, champs_sources, system_instruction=None, excel_knowledge=None, post_new_value="post_new_value_for_product"):
+    """
+    Construit le prompt système à partir de l'instruction Supabase ou du prompt par défaut.
+    Args:
+        champ_cible (str): Champ à enrichir.
+        champs_sources (set): Champs sources détectés dans le prompt utilisateur.
+        system_instruction (str, optionnel): Instruction système avec des {placeholders}.
+        excel_knowledge (optionnel): Données de connaissance injectées dans {excel_file}. Avec un
+            `IndexConnaissance`, seule une note y est injectée : les lignes utiles accompagnent chaque produit.
+        post_new_value (str): Valeur injectée dans {post_new_value_for_product}.
+    Returns:
+        str: Prompt système prêt à l'envoi.
+    """
+    champs_sources_str = ', '.join(champs_sources)
+    if isinstance(excel_knowledge, IndexConnaissance):
+        excel_knowledge = NOTE_PROMPT_SYSTEME
+    if system_instruction is not None:
+        return system_instruction.format(
+            champ_a_enrichir=champ_cible,
+            champs_sources=champs_sources_str,
+            post_new_value_for_product=post_new_value,
+            excel_file=excel_knowledge
+        )
+    return f"Tu es un assistant d'enrichissement de données produit. Tu dois générer une valeur pertinente pour le champ '{champ_cible}' à partir des champs sources : {champs_sources_str}. Un excel peut être donné pour aider à la génération de la valeur."
+
+
+def construire_prompt_utilisateur(prompt_user, champs_sources, prod_dict, excel_knowledge=None):
+    """
+    Remplace chaque @champ du prompt par la valeur correspondante du produit, en une passe.
+    `prompt_user` peut être le texte du prompt ou un `PromptTemplate` déjà compilé.
+    Si `excel_knowledge` est un `IndexConnaissance`, les lignes du fichier de connaissance
+    les plus proches des valeurs du produit sont ajoutées au prompt.
+    """
+    template = prompt_user if isinstance(prompt_user, PromptTemplate) else compiler_prompt(prompt_user)
+    prompt = template.rendre(prod_dict)
+    if isinstance(excel_knowledge, IndexConnaissance):
+        extrait = excel_knowledge.extrait(" ".join(str(prod_dict.get(champ, "")) for champ in champs_sources))
+        if extrait:
+            prompt += f"\n\nLignes pertinentes du fichier de connaissance :\n{extrait}"
+    return prompt
+
+
+def construire_prompt_jugement(prod_dict, champ_cible, prompt_user, valeur_enrichie, champs_sources=None):
+    """
+    Construit le prompt envoyé au juge pour valider une valeur générée.
+    Si `champs_sources` est fourni et non vide, seuls ces champs du produit sont inclus (et non
+    l'enregistrement complet) ; un prompt sans @champ laisse au juge le produit entier.
+    """
+    if champs_sources:
+        prod_dict = {champ: prod_dict.get(champ, "") for champ in sorted(champs_sources)}
+    return (
+        f"Voici un produit : {json.dumps(prod_dict, ensure_ascii=False, default=str)}.\n"
+        f"Le champ à enrichir est : '{champ_cible}'.\n"
+        f"Le prompt utilisateur était : '{prompt_user}'.\n"
+        f"La valeur générée est : '{valeur_enrichie}'.\n"
+        "En tant qu'expert, si la valeur générée est cohérente, pertinente et utile pour ce champ, réponds uniquement par «OK». Sinon, réécris la valeur de façon correcte et pertinente pour ce champ."
+    )
+
+
+def appliquer_jugement(jugement, valeur_enrichie):
+    """Retourne la valeur finale : la valeur générée si le juge répond OK, sa réécriture sinon."""
+
+    if jugement.strip().upper() == "OK":
+        return valeur_enrichie
+    return jugement
+
+
+class LotProduits:
+    """État d'un groupe de produits dans `PipelineProduits` : identifiants, prompts et valeurs de chaque étape."""
+
+    def __init__(self, prod_dicts, identifiants, object_ids):
+        self.prod_dicts = prod_dicts
+        self.identifiants = identifiants
+        self.object_ids = object_ids
+        self.prompts = {}
+        self.valeurs = {}
+        self.jugees = set()
+        self.prompts_jugement = {}
+        self.valeurs_finales = {}
+
+
+class PipelineProduits:
+    """
+    Étapes d'un enrichissement d'index communes à tous les moteurs, groupe de produits par groupe :
+    reprise depuis le journal, produits inchangés ignorés, sélection des valeurs à juger,
+    écriture (tampon, staging ou appel direct) et report des erreurs. Le moteur se charge
+    seulement d'obtenir les réponses LLM (appels synchrones, asyncio ou API Batch) :
+
+        lot = pipeline.preparer(groupe)
+        prompts_jugement = pipeline.generes(lot, *generer(lot.prompts))
+        pipeline.juges(lot, *juger(prompts_jugement))
+        nb_success += pipeline.ecrire(lot)
+        ...
+        return pipeline.terminer(nb_success)
+
+    Args:
+        post_value (callable, optionnel): Fonction d'écriture synchrone `(index, object_id, champ, valeur)`
+            utilisée sans tampon. Par défaut `post_new_value_for_product`.
+        Les autres arguments sont ceux de `enrichir_champ_batch`.
+    """
+
+    def __init__(self, index_name, champ_cible, prompt_user, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, tampon=None, post_value=None, politique_juge=None, journal=None, empreintes=None):
+        self.index_name = index_name
+        self.champ_cible = champ_cible
+        self.prompt_user = prompt_user
+        self.excel_knowledge = excel_knowledge
+        # Prompt utilisateur compilé une fois pour tout le job (champs sources = ses @champs)
+        self.template = compiler_prompt(prompt_user)
+        self.champs_sources = set(self.template.champs)
+        self.prompt_systeme = construire_prompt_systeme(champ_cible, self.champs_sources, system_instruction, excel_knowledge)
+        self.prompt_systeme_juge = judge_instruction if judge_instruction is not None else PROMPT_SYSTEME_JUGE_DEFAUT
+        self.politique_juge = politique_juge if politique_juge is not None else JudgePolicy()
+        self.tampon = tampon
+        if tampon is not None:
+            self.post_value = tampon.post_new_value_for_product
+        else:
+            self.post_value = post_value or post_new_value_for_product
+        self.journal = journal
+        self.empreintes = empreintes
+        self._echecs_avant = len(tampon.echecs) if tampon is not None else 0
+        if journal is not None and tampon is not None and tampon.apres_ecriture is None:
+            tampon.apres_ecriture = journal.marquer_ecrits
+        suivre_ecritures(empreintes, tampon)
+        self.version = version_instructions(model, self.prompt_systeme, self.prompt_systeme_juge)
+
+    def preparer(self, groupe):
+        """
+        Ouvre un lot : produits déjà écrits ou inchangés écartés, valeurs déjà générées ou jugées reprises.
+        Returns:
+            LotProduits: Lot dont `prompts` contient les prompts de génération restant à envoyer.
+        """
+        prod_dicts = [p.model_dump() if hasattr(p, 'model_dump') else p for p in groupe]
+        identifiants = identifiants_groupe([extraire_object_id(d) for d in prod_dicts])
+        lot = LotProduits(prod_dicts, identifiants, {ident: extraire_object_id(d) for ident, d in zip(identifiants, prod_dicts)})
+        ecrits, valeurs_reprises, lot.jugees = etats_reprise(self.journal, lot.object_ids)
+        prompts = {
+            ident: construire_prompt_utilisateur(self.template, self.champs_sources, d, self.excel_knowledge)
+            for ident, d in zip(identifiants, prod_dicts)
+            if ident not in ecrits and (self.empreintes is not None or ident not in valeurs_reprises)
+        }
+        # Produits dont les entrées n'ont pas changé depuis leur dernière écriture : rien à refaire
+        inchanges = produits_inchanges(self.empreintes, self.version, lot.object_ids, prompts)
+        journaliser(self.journal, "written", lot.object_ids, dict.fromkeys(inchanges))
+        lot.prompts = {ident: p for ident, p in prompts.items() if ident not in inchanges and ident not in valeurs_reprises}
+        lot.valeurs = {ident: v for ident, v in valeurs_reprises.items() if ident not in inchanges}
+        return lot
+
+    def generes(self, lot, valeurs, erreurs, juger=True):
+        """
+        Enregistre les générations du lot et sélectionne celles à juger selon la politique de juge.
+        Un produit dont la génération a échoué n'est pas écrit (pas de valeur vide en base).
+        Args:
+            valeurs (dict): `{identifiant: valeur générée}`.
+            erreurs (dict): `{identifiant: exception}` des générations en échec.
+            juger (bool): Si False, aucune valeur n'est soumise au juge.
+        Returns:
+            dict: `{identifiant: prompt de jugement}` à envoyer au juge.
+        """
+        journaliser(self.journal, "generated", lot.object_ids, valeurs)
+        for ident, e in erreurs.items():
+            print(f"Erreur OpenAI pour le produit {ident}, non mis à jour : {e}")
+        lot.valeurs.update(valeurs)
+        lot.valeurs = {ident: lot.valeurs[ident] for ident in lot.identifiants if ident in lot.valeurs}
+        if juger:
+            lot.prompts_jugement = {
+                ident: construire_prompt_jugement(d, self.champ_cible, self.prompt_user, lot.valeurs[ident], self.champs_sources)
+                for ident, d in zip(lot.identifiants, lot.prod_dicts)
+                if ident in lot.valeurs and ident not in lot.jugees and self.politique_juge.doit_juger(lot.valeurs[ident], ident)
+            }
+        return lot.prompts_jugement
+
+    def juges(self, lot, jugements, erreurs):
+        """
+        Applique les réponses du juge. Une valeur dont le jugement a échoué est écrite telle quelle.
+        Args:
+            jugements (dict): `{identifiant: réponse du juge}`.
+            erreurs (dict): `{identifiant: exception}` des jugements en échec.
+        """
+        for ident, valeur in lot.valeurs.items():
+            if ident in jugements:
+                lot.valeurs_finales[ident] = appliquer_jugement(jugements[ident], valeur)
+            else:
+                if ident in lot.prompts_jugement:
+                    print(f"Erreur lors du jugement de la valeur enrichie : {erreurs.get(ident)}")
+                lot.valeurs_finales[ident] = valeur
+        journaliser(self.journal, "judged", lot.object_ids, lot.valeurs_finales)
+
+    def ecrire(self, lot):
+        """
+        Écrit les valeurs finales du lot.
+        Returns:
+            int: Nombre de valeurs écrites (ou ajoutées au tampon).
+        """
+        nb_success = 0
+        for ident, valeur_finale in lot.valeurs_finales.items():
+            object_id = lot.object_ids[ident]
+            try:
+                if self.tampon is not None:
+                    success = self.post_value(self.index_name, object_id, self.champ_cible, valeur_finale)
+                else:
+                    # Sans tampon, chaque écriture est un appel Algolia (avec un tampon, mesurée au vidage des lots)
+                    with etape("ecriture"):
+                        success = self.post_value(self.index_name, object_id, self.champ_cible, valeur_finale)
+            except Exception as e:
+                print(f"Erreur lors de l'écriture du produit {object_id} : {e}")
+                success = None
+            if not success:
+                if self.tampon is None:
+                    compter_erreurs("ecriture")
+                continue
+            nb_success += 1
+            # Avec un tampon, l'état "written" et l'empreinte sont enregistrés après l'envoi effectif du lot
+            if self.tampon is None:
+                journaliser(self.journal, "written", lot.object_ids, {ident: None})
+                if self.empreintes is not None:
+                    self.empreintes.valider([object_id])
+        return nb_success
+
+    def terminer(self, nb_success):
+        """Vide le tampon et retourne le nombre de produits enrichis, lots en échec déduits."""
+
+        if self.tampon is not None:
+            self.tampon.flush()
+            nb_success -= len(self.tampon.echecs) - self._echecs_avant
+        return nb_success
+
+
+def enrichir_champ_batch(index_name, produits, champ_cible, prompt_user, openai_client, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, tampon=None, cache=None, taille_groupe=1, politique_juge=None, journal=None, empreintes=None):
     """
     Enrichit un champ pour une liste de produits en utilisant un prompt utilisateur libre et l'API OpenAI.
     Args:
@@ -22,118 +273,126 @@ def enrichir_champ_batch(index_name, produits, champ_cible, prompt_user, openai_
         system_instruction (str, optionnel): Prompt système à utiliser. Si None, on utilise le prompt par défaut.
         judge_instruction (str, optionnel): Prompt système pour le juge. Si None, on utilise le prompt juge par défaut.
         excel_file (str, optionnel): Fichier Excel à utiliser pour l'enrichissement.
+        tampon (WriteBackBuffer, optionnel): Tampon d'écriture par lots. Si None, chaque valeur
+            est écrite immédiatement avec `post_new_value_for_product`.
+        cache (PromptCache, optionnel): Cache des réponses LLM indexé sur le prompt rendu.
+        taille_groupe (int): Nombre de produits envoyés par requête LLM (réponse JSON par objectID,
+            repli produit par produit en cas de réponse invalide). 1 = une requête par produit.
+        politique_juge (JudgePolicy, optionnel): Politique de déclenchement du juge. Par défaut, toutes
+            les générations sont jugées. Les compteurs sont disponibles dans `politique_juge.stats`.
+        journal (JobJournal, optionnel): Journal du job. Les produits déjà écrits sont ignorés et
+            les valeurs déjà générées ou jugées sont reprises sans nouvel appel LLM.
+        empreintes (IndexEmpreintes, optionnel): Empreintes des entrées déjà écrites. Un produit dont
+            le prompt rendu et les instructions n'ont pas changé depuis sa dernière écriture est ignoré.
     Returns:
         int: Nombre de produits enrichis.
     """
+    pipeline = PipelineProduits(
+        index_name, champ_cible, prompt_user, model, system_instruction, judge_instruction, excel_knowledge,
+        tampon=tampon, politique_juge=politique_juge, journal=journal, empreintes=empreintes
+    )
+
+    def generer(nom_etape, prompt_sys, prompts):
+        # Une requête pour tout le groupe (repli produit par produit si la réponse groupée est invalide)
+        if not prompts:
+            return {}, {}
+        with etape(nom_etape):
+            valeurs, erreurs = completions_groupees(openai_client, model, prompt_sys, prompts, cache)
+        compter_erreurs(nom_etape, len(erreurs))
+        return valeurs, erreurs
+
     nb_success = 0
-    # Détection des champs sources dans le prompt utilisateur (tous les @champs)
-    champs_sources = set(re.findall(r"@([a-zA-Z0-9_]+)", prompt_user))
-    champs_sources_str = ', '.join(champs_sources)
-    if system_instruction is not None:
-        prompt_systeme = system_instruction.format(
-            champ_a_enrichir=champ_cible,
-            champs_sources=champs_sources_str,
-            post_new_value_for_product="post_new_value_for_product",
-            excel_file=excel_knowledge
-        )
-    else:
-        prompt_systeme = f"Tu es un assistant d'enrichissement de données produit. Tu dois générer une valeur pertinente pour le champ '{champ_cible}' à partir des champs sources : {champs_sources_str}. Un excel peut être donner pour aider à la génération de la valeur."
-    for produit in produits:
-        prod_dict = produit.model_dump() if hasattr(produit, 'model_dump') else produit
-        prompt = prompt_user
-        for champ in champs_sources:
-            valeur = str(prod_dict.get(champ, ""))
-            prompt = prompt.replace(f"@{champ}", valeur)
-        # Appel OpenAI avec prompt système + prompt utilisateur
-        try:
-            response = openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt_systeme},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            valeur_enrichie = response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"Erreur OpenAI pour le produit {prod_dict.get('objectID', prod_dict.get('object_id', ''))}: {e}")
-            valeur_enrichie = ""
-        # Jugement de la valeur enrichie
-        try:
-            prompt_jugement = (
-                f"Voici un produit : {json.dumps(prod_dict, ensure_ascii=False)}.\n"
-                f"Le champ à enrichir est : '{champ_cible}'.\n"
-                f"Le prompt utilisateur était : '{prompt_user}'.\n"
-                f"La valeur générée est : '{valeur_enrichie}'.\n"
-                "En tant qu'expert, si la valeur générée est cohérente, pertinente et utile pour ce champ, réponds uniquement par «OK». Sinon, réécris la valeur de façon correcte et pertinente pour ce champ."
-            )
-            if judge_instruction is not None:
-                prompt_systeme_juge = judge_instruction
-            else:
-                prompt_systeme_juge = "Tu es un expert en data quality et enrichissement de données produit."
-            response_jugement = openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt_systeme_juge},
-                    {"role": "user", "content": prompt_jugement}
-                ]
-            )
-            jugement = response_jugement.choices[0].message.content.strip()
-            print(f"[DEBUG JUGEMENT] Prompt envoyé :\n{prompt_jugement}\nRéponse du juge : {jugement}")
-            if jugement.strip().upper() == "OK":
-                valeur_finale = valeur_enrichie
-            else:
-                valeur_finale = jugement
-        except Exception as e:
-            print(f"Erreur lors du jugement de la valeur enrichie : {e}")
-            valeur_finale = valeur_enrichie
-        success = post_new_value_for_product(index_name, prod_dict.get("objectID", prod_dict.get("object_id", "")), champ_cible, valeur_finale)
-        if success:
-            nb_success += 1
-    return nb_success
+    for groupe in par_groupes(produits, taille_groupe):
+        lot = pipeline.preparer(groupe)
+        prompts_jugement = pipeline.generes(lot, *generer("generation", pipeline.prompt_systeme, lot.prompts))
+        pipeline.juges(lot, *generer("juge", pipeline.prompt_systeme_juge, prompts_jugement))
+        nb_success += pipeline.ecrire(lot)
+    return pipeline.terminer(nb_success)
 
 
 
-def enrichir_champ_batch_excel(produits, champ_cible, prompt_user, openai_client,model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, progress_callback=None):
+def enrichir_champ_batch_excel(produits, champ_cible, prompt_user, openai_client,model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, progress_callback=None, cache=None, taille_groupe=1):
     """
     Enrichit un champ pour une liste de produits (issus d'un fichier Excel/CSV importé).
     Modifie la liste en place et retourne la liste enrichie.
+    Un `cache` (PromptCache) optionnel évite de renvoyer un prompt déjà traité ;
+    `taille_groupe` > 1 envoie plusieurs lignes par requête LLM.
     """
     produits_enrichis = []
-    champs_sources = set(re.findall(r"@([a-zA-Z0-9_]+)", prompt_user))
-    champs_sources_str = ', '.join(champs_sources)
-    if system_instruction is not None:
-        prompt_systeme = system_instruction.format(
-            champ_a_enrichir=champ_cible,
-            champs_sources=champs_sources_str,
-            post_new_value_for_product="",
-            excel_file=excel_knowledge
-        )
-    else:
-        prompt_systeme = f"Tu es un assistant d'enrichissement de données produit. Tu dois générer une valeur pertinente pour le champ '{champ_cible}' à partir des champs sources : {champs_sources_str}. Un excel peut être donné pour aider à la génération de la valeur."
+    template = compiler_prompt(prompt_user)
+    champs_sources = set(template.champs)
+    prompt_systeme = construire_prompt_systeme(champ_cible, champs_sources, system_instruction, excel_knowledge, post_new_value="")
     total = len(produits)
-    for i, prod in enumerate(produits):
-        prompt = prompt_user
-        for champ in champs_sources:
-            valeur = str(prod.get(champ, ""))
-            prompt = prompt.replace(f"@{champ}", valeur)
-        print(f"[DEBUG PROMPT] Produit: {prod.get('objectID', prod.get('object_id', ''))}\nPrompt envoyé: {prompt}")
-        try:
-            completion = openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": prompt_systeme},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            valeur_enrichie = completion.choices[0].message.content.strip()
-            print(f"[DEBUG REPONSE] Réponse API: {valeur_enrichie}")
-            if not valeur_enrichie:
-                valeur_enrichie = "Information insuffisante pour enrichir ce champ."
-            prod[champ_cible] = valeur_enrichie
-        except Exception as e:
-            print(f"Erreur OpenAI pour le produit {prod.get('objectID', prod.get('object_id', ''))}: {e}")
-            prod[champ_cible] = f"Erreur enrichissement: {e}"
-        produits_enrichis.append(prod)
-        if progress_callback is not None:
-            progress_callback((i + 1) / total)
+    for groupe in par_groupes(produits, taille_groupe):
+        identifiants = identifiants_groupe([extraire_object_id(prod) for prod in groupe])
+        prompts = {}
+        for ident, prod in zip(identifiants, groupe):
+            prompts[ident] = construire_prompt_utilisateur(template, champs_sources, prod, excel_knowledge)
+        with etape("generation"):
+            valeurs, erreurs = completions_groupees(openai_client, model, prompt_systeme, prompts, cache)
+        compter_erreurs("generation", len(erreurs))
+        for ident, prod in zip(identifiants, groupe):
+            if ident in erreurs:
+                # La cellule garde sa valeur d'origine plutôt qu'un message d'erreur
+                print(f"Erreur OpenAI pour le produit {extraire_object_id(prod)}, ligne non enrichie : {erreurs[ident]}")
+            else:
+                valeur_enrichie = valeurs[ident]
+                if not valeur_enrichie:
+                    valeur_enrichie = "Information insuffisante pour enrichir ce champ."
+                prod[champ_cible] = valeur_enrichie
+            produits_enrichis.append(prod)
+            if progress_callback is not None:
+                progress_callback(len(produits_enrichis) / total)
     return produits_enrichis
+
+
+def enrichir_champ_batch_excel_parallele(produits, champ_cible, prompt_user, openai_client, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, progress_callback=None, cache=None, taille_groupe=1, nb_workers=8, taille_shard=None):
+    """
+    Variante parallèle de `enrichir_champ_batch_excel` pour les gros fichiers.
+
+    Les lignes sont découpées en shards enrichis simultanément par `nb_workers` threads
+    (les appels OpenAI sont des entrées/sorties), puis réassemblées dans l'ordre d'origine.
+    La progression est remontée depuis le thread appelant, ce qui permet d'y mettre à jour
+    l'interface Streamlit.
+    Args:
+        nb_workers (int): Nombre de shards traités simultanément.
+        taille_shard (int, optionnel): Nombre de lignes par shard. Par défaut, environ quatre shards par worker.
+        progress_callback (callable, optionnel): Reçoit `(avancement, lignes_par_seconde)`, avancement entre 0 et 1.
+        Les autres arguments sont ceux de `enrichir_champ_batch_excel`.
+    Returns:
+        list: Les produits enrichis, dans l'ordre d'origine.
+    """
+    produits = list(produits)
+    total = len(produits)
+    if total == 0:
+        return []
+    if taille_shard is None:
+        taille_shard = -(-total // (max(1, nb_workers) * 4))
+    # Un shard contient un nombre entier de groupes LLM
+    taille_shard = max(taille_groupe, -(-taille_shard // taille_groupe) * taille_groupe)
+    shards = [produits[debut:debut + taille_shard] for debut in range(0, total, taille_shard)]
+    faites = [0] * len(shards)
+
+    def enrichir_shard(numero):
+        def avancer(avancement):
+            faites[numero] = round(avancement * len(shards[numero]))
+        return enrichir_champ_batch_excel(
+            shards[numero], champ_cible, prompt_user, openai_client, model=model,
+            system_instruction=system_instruction, judge_instruction=judge_instruction,
+            excel_knowledge=excel_knowledge, progress_callback=avancer, cache=cache,
+            taille_groupe=taille_groupe
+        )
+
+    debut = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, nb_workers)) as executor:
+        # Chaque shard s'exécute dans une copie du contexte, pour que ses appels restent attribués au run en cours
+        futures = [executor.submit(contextvars.copy_context().run, enrichir_shard, numero) for numero in range(len(shards))]
+        en_cours = set(futures)
+        while en_cours:
+            _, en_cours = wait(en_cours, timeout=0.5)
+            if progress_callback is not None:
+                lignes = sum(faites)
+                duree = time.monotonic() - debut
+                progress_callback(lignes / total, lignes / duree if duree > 0 else 0.0)
+        resultats = [future.result() for future in futures]
+    return [prod for shard in resultats for prod in shard]
@@ -0,0 +1,163 @@
+"""Moteur d'enrichissement concurrent basé sur asyncio.
+
+Les étapes génération, jugement et écriture Algolia de plusieurs produits sont
+exécutées en parallèle, dans la limite d'un nombre de produits en vol.
+"""
+
+import asyncio
+import inspect
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.GET.clients import close_algolia_clients_async
+from backend.GET.main import attributs_projection, iter_products_by_category
+from backend.agent.main import PipelineProduits
+from backend.agent.template import compiler_prompt
+from backend.metriques import compter_erreurs, enregistrer_appel_llm, etape
+from backend.agent.packing import completions_groupees, par_groupes
+
+
+async def _appeler(fonction, *args, **kwargs):
+    """Appelle une fonction synchrone (dans un thread) ou asynchrone de façon uniforme."""
+
+    if inspect.iscoroutinefunction(fonction):
+        return await fonction(*args, **kwargs)
+    resultat = await asyncio.to_thread(fonction, *args, **kwargs)
+    if inspect.isawaitable(resultat):
+        return await resultat
+    return resultat
+
+
+async def _completion(openai_client, model, prompt_systeme, prompt, cache=None):
+    """Envoie un couple prompt système / prompt utilisateur (via le cache si fourni) et retourne le texte de la réponse."""
+
+    # Les accès SQLite du cache sont faits dans un thread, hors de la boucle d'événements
+    if cache is not None:
+        reponse = await asyncio.to_thread(cache.get, model, prompt_systeme, prompt)
+        if reponse is not None:
+            return reponse
+    response = await _appeler(
+        openai_client.chat.completions.create,
+        model=model,
+        messages=[
+            {"role": "system", "content": prompt_systeme},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    enregistrer_appel_llm(model, getattr(response, "usage", None))
+    reponse = response.choices[0].message.content.strip()
+    if cache is not None and reponse:
+        await asyncio.to_thread(cache.set, model, prompt_systeme, prompt, reponse)
+    return reponse
+
+
+async def enrichir_champ_batch_async(index_name, produits, champ_cible, prompt_user, openai_client, model="gpt-4o-mini", system_instruction=None, judge_instruction=None, excel_knowledge=None, concurrence=8, post_value=None, tampon=None, cache=None, taille_groupe=1, politique_juge=None, journal=None, empreintes=None):
+    """
+    Version asynchrone de `enrichir_champ_batch` : les produits sont traités en parallèle.
+    Args:
+        index_name (str): Nom de l'index Algolia.
+        produits (iterable): Produits (dicts ou modèles Algolia) à enrichir.
+        champ_cible (str): Champ à enrichir.
+        prompt_user (str): Prompt utilisateur avec des @champs.
+        openai_client (OpenAI | AsyncOpenAI): Client OpenAI synchrone ou asynchrone.
+        model (str): Modèle OpenAI à utiliser.
+        system_instruction (str, optionnel): Prompt système (instruction Supabase).
+        judge_instruction (str, optionnel): Prompt système du juge.
+        excel_knowledge (optionnel): Données de connaissance pour le prompt système.
+        concurrence (int): Nombre maximum de produits (ou de groupes) traités simultanément.
+        post_value (callable, optionnel): Fonction d'écriture synchrone `(index, object_id, champ, valeur)`,
+            exécutée dans un thread. Par défaut `post_new_value_for_product`.
+        tampon (WriteBackBuffer, optionnel): Tampon d'écriture par lots, prioritaire sur `post_value`.
+        cache (PromptCache, optionnel): Cache des réponses LLM indexé sur le prompt rendu.
+        taille_groupe (int): Nombre de produits par requête LLM (client synchrone requis si > 1).
+        politique_juge (JudgePolicy, optionnel): Politique de déclenchement du juge (par défaut : toujours).
+        journal (JobJournal, optionnel): Journal du job, pour reprendre un enrichissement interrompu.
+        empreintes (IndexEmpreintes, optionnel): Empreintes des entrées déjà écrites (produits inchangés ignorés).
+    Returns:
+        int: Nombre de produits enrichis.
+    """
+    pipeline = PipelineProduits(
+        index_name, champ_cible, prompt_user, model, system_instruction, judge_instruction, excel_knowledge,
+        tampon=tampon, post_value=post_value, politique_juge=politique_juge, journal=journal, empreintes=empreintes
+    )
+
+    if taille_groupe > 1 and inspect.iscoroutinefunction(openai_client.chat.completions.create):
+        raise ValueError("Le regroupement de produits (taille_groupe > 1) nécessite un client OpenAI synchrone.")
+
+    async def generer(nom_etape, prompt_sys, prompts):
+        """Retourne `(valeurs, erreurs)` pour un groupe de prompts, en une requête si le groupe en compte plusieurs."""
+
+        with etape(nom_etape):
+            if len(prompts) > 1:
+                valeurs, erreurs = await asyncio.to_thread(completions_groupees, openai_client, model, prompt_sys, prompts, cache)
+            else:
+                (ident, prompt), = prompts.items()
+                try:
+                    valeurs, erreurs = {ident: await _completion(openai_client, model, prompt_sys, prompt, cache)}, {}
+                except Exception as e:
+                    valeurs, erreurs = {}, {ident: e}
+        compter_erreurs(nom_etape, len(erreurs))
+        return valeurs, erreurs
+
+    async def traiter(groupe):
+        lot = pipeline.preparer(groupe)
+        valeurs, erreurs = await generer("generation", pipeline.prompt_systeme, lot.prompts) if lot.prompts else ({}, {})
+        prompts_jugement = pipeline.generes(lot, valeurs, erreurs)
+        jugements, erreurs = await generer("juge", pipeline.prompt_systeme_juge, prompts_jugement) if prompts_jugement else ({}, {})
+        pipeline.juges(lot, jugements, erreurs)
+        # Les écritures (tampon ou appels Algolia) sont bloquantes : elles sont faites dans un thread
+        return await asyncio.to_thread(pipeline.ecrire, lot)
+
+    # Chaque worker tire le groupe suivant de l'itérateur partagé : au plus
+    # `concurrence` groupes sont en vol et `produits` peut être un générateur.
+    # Un générateur (flux browse Algolia) fait des appels HTTP bloquants : il est
+    # avancé dans un thread, un worker à la fois, pour ne pas bloquer la boucle.
+    en_memoire = isinstance(produits, (list, tuple))
+    groupes = par_groupes(produits, taille_groupe)
+    verrou_lecture = asyncio.Lock()
+
+    async def groupe_suivant():
+        if en_memoire:
+            return next(groupes, None)
+        async with verrou_lecture:
+            return await asyncio.to_thread(next, groupes, None)
+
+    async def worker():
+        nb = 0
+        while (groupe := await groupe_suivant()) is not None:
+            nb += await traiter(groupe)
+        return nb
+
+    resultats = await asyncio.gather(*(worker() for _ in range(max(1, concurrence))))
+    return await asyncio.to_thread(pipeline.terminer, sum(resultats))
+
+
+def enrichir_champ_batch_concurrent(*args, **kwargs):
+    """
+    Point d'entrée synchrone du moteur concurrent (mêmes arguments que `enrichir_champ_batch_async`).
+    Returns:
+        int: Nombre de produits enrichis.
+    """
+    async def executer():
+        try:
+            return await enrichir_champ_batch_async(*args, **kwargs)
+        finally:
+            # Les clients asynchrones sont liés à cette boucle, qui se termine avec `asyncio.run`
+            await close_algolia_clients_async()
+
+    return asyncio.run(executer())
+
+
+def enrichir_categorie(index_name, category, champ_cible, prompt_user, openai_client, niveau=2, **kwargs):
+    """
+    Enrichit tous les produits d'une catégorie en consommant directement le flux browse Algolia.
+
+    Les produits ne sont jamais matérialisés en liste : la mémoire reste bornée quelle
+    que soit la taille de la catégorie. Seuls les @champs du prompt et le champ cible
+    sont récupérés. Les autres arguments sont ceux de `enrichir_champ_batch_async`.
+    Returns:
+        int: Nombre de produits enrichis.
+    """
+    projection = attributs_projection(compiler_prompt(str(prompt_user)).champs, champ_cible)
+    produits = iter_products_by_category(index_name, category, niveau=niveau, attributes_to_retrieve=projection)
+    return enrichir_champ_batch_concurrent(index_name, produits, champ_cible, prompt_user, openai_client, **kwargs)
@@ -0,0 +1,128 @@
+"""Regroupement de plusieurs produits dans une même requête LLM.
+
+Le prompt système (souvent une longue instruction Supabase) n'est envoyé qu'une
+fois pour N produits. Le modèle répond par un objet JSON indexé par objectID ;
+les produits absents ou invalides dans la réponse sont retraités un par un.
+"""
+
+import json
+from itertools import islice
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.agent.cache import completion_cachee
+from backend.metriques import enregistrer_appel_llm
+
+CONSIGNE_GROUPE = (
+    "Tu vas recevoir plusieurs produits, chacun précédé de son identifiant. "
+    "Traite chaque produit indépendamment en suivant la demande qui le concerne. "
+    "Réponds uniquement avec un objet JSON dont les clés sont les identifiants et les valeurs "
+    "la réponse (texte) pour chaque produit, sans aucun autre texte."
+)
+
+
+def par_groupes(iterable, taille):
+    """Découpe un itérable (liste ou générateur) en listes de `taille` éléments au plus."""
+
+    iterateur = iter(iterable)
+    while True:
+        groupe = list(islice(iterateur, max(1, taille)))
+        if not groupe:
+            return
+        yield groupe
+
+
+def identifiants_groupe(object_ids):
+    """Retourne des identifiants uniques dans le groupe (objectID, suffixé ou remplacé si besoin)."""
+
+    identifiants = []
+    vus = set()
+    for i, object_id in enumerate(object_ids):
+        identifiant = str(object_id) if object_id not in (None, "") else f"ligne_{i}"
+        if identifiant in vus:
+            identifiant = f"{identifiant}#{i}"
+        vus.add(identifiant)
+        identifiants.append(identifiant)
+    return identifiants
+
+
+def construire_prompt_groupe(prompts_par_id):
+    """Assemble les prompts individuels en un seul message utilisateur."""
+
+    blocs = [f"### Produit {identifiant}\n{prompt}" for identifiant, prompt in prompts_par_id.items()]
+    return CONSIGNE_GROUPE + "\n\n" + "\n\n".join(blocs)
+
+
+def analyser_reponse_groupe(contenu, identifiants):
+    """
+    Extrait les valeurs valides d'une réponse JSON groupée.
+    Returns:
+        dict: `{identifiant: valeur}` pour les identifiants attendus dont la valeur est un texte non vide.
+    """
+    try:
+        donnees = json.loads(contenu)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(donnees, dict):
+        return {}
+    valeurs = {}
+    for identifiant in identifiants:
+        valeur = donnees.get(identifiant)
+        if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+            valeur = str(valeur)
+        if isinstance(valeur, str) and valeur.strip():
+            valeurs[identifiant] = valeur.strip()
+    return valeurs
+
+
+def completions_groupees(openai_client, model, prompt_systeme, prompts_par_id, cache=None):
+    """
+    Obtient une réponse par prompt en une requête groupée, avec repli unitaire.
+    Args:
+        openai_client (OpenAI): Client OpenAI synchrone.
+        model (str): Modèle OpenAI.
+        prompt_systeme (str): Prompt système commun à tout le groupe.
+        prompts_par_id (dict): `{identifiant: prompt utilisateur rendu}`.
+        cache (PromptCache, optionnel): Cache des réponses, consulté et alimenté prompt par prompt.
+    Returns:
+        tuple: `(valeurs, erreurs)` — `{identifiant: texte}` et `{identifiant: exception}`.
+    """
+    valeurs = {}
+    erreurs = {}
+    a_traiter = {}
+    for identifiant, prompt in prompts_par_id.items():
+        reponse = cache.get(model, prompt_systeme, prompt) if cache is not None else None
+        if reponse is not None:
+            valeurs[identifiant] = reponse
+        else:
+            a_traiter[identifiant] = prompt
+
+    if len(a_traiter) > 1:
+        try:
+            response = openai_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": prompt_systeme},
+                    {"role": "user", "content": construire_prompt_groupe(a_traiter)}
+                ],
+                response_format={"type": "json_object"}
+            )
+            enregistrer_appel_llm(model, getattr(response, "usage", None))
+            obtenues = analyser_reponse_groupe(response.choices[0].message.content, a_traiter)
+        except Exception as e:
+            print(f"Erreur OpenAI pour la requête groupée ({len(a_traiter)} produits) : {e}")
+            obtenues = {}
+        for identifiant, valeur in obtenues.items():
+            valeurs[identifiant] = valeur
+            if cache is not None:
+                cache.set(model, prompt_systeme, a_traiter.pop(identifiant), valeur)
+            else:
+                a_traiter.pop(identifiant)
+
+    # Repli : un appel par produit absent ou invalide dans la réponse groupée
+    for identifiant, prompt in a_traiter.items():
+        try:
+            valeurs[identifiant] = completion_cachee(openai_client, model, prompt_systeme, prompt, cache)
+        except Exception as e:
+            erreurs[identifiant] = e
+    return valeurs, erreurs
@@ -0,0 +1,239 @@
+"""Exécution des jobs d'enrichissement en arrière-plan.
+
+`JobRunner` reçoit les jobs soumis par l'interface et les exécute dans un pool de
+threads qui lui est propre : le script Streamlit rend la main immédiatement et
+plusieurs jobs peuvent tourner en parallèle (les appels OpenAI et Algolia sont
+des entrées/sorties). La progression est lue dans le `JobJournal` de chaque job,
+d'où sont déduits le débit et le temps restant estimé. Chaque job est instrumenté
+par un `MetriquesRun` (latences par étape, tokens, coût estimé, reprises), exposé
+dans son état et, à la fin du job, ajouté au journal `metriques.jsonl`.
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.POST.buffer import WriteBackBuffer, noter_ecriture_index
+from backend.POST.staging import StagingStore
+from backend.agent.batch_api import enrichir_champ_batch_api
+from backend.agent.empreintes import IndexEmpreintes
+from backend.agent.moteur_async import enrichir_champ_batch_concurrent
+from backend.metriques import MetriquesRun, format_prometheus
+
+MAX_JOBS_DEFAUT = int(os.getenv("ENRICHISSEMENT_MAX_JOBS", "2"))
+# METRIQUES_JSON=0 désactive le journal JSON des métriques de fin de job
+JOURNAL_METRIQUES = os.getenv("METRIQUES_JSON", "1") != "0"
+
+
+def executer_enrichissement(index_name, mode="temps_reel", journal=None, ignorer_inchanges=False, simulation=False, **kwargs):
+    """
+    Job d'enrichissement d'un index Algolia : ouvre un tampon d'écriture puis lance le moteur choisi.
+    Args:
+        index_name (str): Index Algolia cible.
+        mode (str): "temps_reel" (`enrichir_champ_batch_concurrent`) ou "batch" (`enrichir_champ_batch_api`).
+        journal (JobJournal, optionnel): Journal du job (reprise et progression).
+        ignorer_inchanges (bool): Ignore les produits dont les entrées (prompt rendu, instructions)
+            n'ont pas changé depuis leur dernier enrichissement (`IndexEmpreintes`).
+        simulation (bool): Génère et juge sans rien écrire dans Algolia : les valeurs sont conservées
+            dans un `StagingStore` (identifiant : celui du journal) pour le rapport de différences
+            et une validation ultérieure.
+        **kwargs: Arguments du moteur (produits, champ_cible, prompt_user, openai_client...).
+    Returns:
+        dict: Nombre de produits enrichis (mis en staging en simulation), de produits inchangés ignorés,
+            compteurs du juge et, en simulation, identifiant, index et compteurs du staging
+            (`total`, `modifies`, `inchanges`, `ecrits`).
+    """
+    def apres_ecriture(object_ids):
+        if journal is not None:
+            journal.marquer_ecrits(object_ids)
+        noter_ecriture_index(index_name, kwargs["champ_cible"], object_ids)
+
+    empreintes = IndexEmpreintes(index_name, kwargs["champ_cible"]) if ignorer_inchanges else None
+    staging = None
+    if simulation:
+        run_id = journal.job_id if journal is not None else time.strftime("simulation-%Y%m%d-%H%M%S")
+        staging = StagingStore(run_id, index_name, empreintes=empreintes)
+        kwargs["produits"] = staging.suivre_produits(kwargs["produits"], kwargs["champ_cible"])
+    try:
+        with staging or WriteBackBuffer(index_name, apres_ecriture=apres_ecriture) as tampon:
+            if mode == "batch":
+                nb = enrichir_champ_batch_api(index_name=index_name, tampon=tampon, journal=journal, empreintes=empreintes, **kwargs)
+            else:
+                nb = enrichir_champ_batch_concurrent(index_name=index_name, tampon=tampon, journal=journal, empreintes=empreintes, **kwargs)
+        resume_simulation = None
+        if staging is not None:
+            rapport = staging.rapport(limite=0)
+            del rapport["lignes"]
+            resume_simulation = {"run_id": staging.run_id, "index_name": index_name, **rapport}
+    finally:
+        if empreintes is not None:
+            empreintes.close()
+        if staging is not None:
+            staging.close()
+    politique_juge = kwargs.get("politique_juge")
+    return {
+        "nb_enrichis": nb,
+        "nb_inchanges": empreintes.nb_ignores if empreintes is not None else 0,
+        "juge": politique_juge.stats.as_dict() if politique_juge is not None else None,
+        "simulation": resume_simulation,
+    }
+
+
+class _Job:
+    def __init__(self, job_id, journal, total, description):
+        self.job_id = job_id
+        self.journal = journal
+        self.total = total
+        self.description = description
+        self.soumis_le = time.time()
+        self.debut = None
+        self.fin = None
+        self.traites_initial = 0
+        self.future = None
+        self.metriques = MetriquesRun(job_id)
+
+
+class JobRunner:
+    """
+    File de jobs d'enrichissement exécutés en arrière-plan.
+    Args:
+        max_jobs (int, optionnel): Nombre de jobs exécutés simultanément (les suivants attendent).
+            Par défaut la variable d'environnement `ENRICHISSEMENT_MAX_JOBS`, sinon 2.
+    """
+
+    def __init__(self, max_jobs=None):
+        self.max_jobs = max_jobs or MAX_JOBS_DEFAUT
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="enrichissement")
+        self._jobs = {}
+        self._verrou = threading.Lock()
+        self._compteur = itertools.count(1)
+
+    def soumettre(self, fonction, journal, total, description="", **kwargs):
+        """
+        Met un job en file d'attente.
+        Args:
+            fonction (callable): Fonction du job, appelée avec `**kwargs` et `journal` (par exemple `executer_enrichissement`).
+            journal (JobJournal): Journal du job, transmis au moteur et utilisé pour suivre la progression.
+            total (int): Nombre de produits du job (pour la progression et l'ETA).
+            description (str): Libellé affiché dans l'interface.
+            **kwargs: Arguments du moteur.
+        Returns:
+            str: Identifiant d'exécution du job.
+        """
+        job_id = f"{journal.job_id}-{next(self._compteur)}"
+        job = _Job(job_id, journal, total, description)
+        job.future = self._executor.submit(self._executer, job, fonction, kwargs)
+        with self._verrou:
+            self._jobs[job_id] = job
+        return job_id
+
+    def _executer(self, job, fonction, kwargs):
+        job.debut = time.time()
+        job.traites_initial = self._traites(job)
+        statut = "erreur"
+        try:
+            with job.metriques.activer():
+                resultat = fonction(**kwargs, journal=job.journal)
+            statut = "termine"
+        except Exception:
+            job.journal.terminer("erreur")
+            raise
+        finally:
+            job.fin = time.time()
+            if JOURNAL_METRIQUES:
+                try:
+                    job.metriques.journaliser(job_id=job.job_id, description=job.description, statut=statut)
+                except OSError as e:
+                    print(f"Erreur lors de l'écriture des métriques du job {job.job_id} : {e}")
+        job.journal.terminer()
+        return resultat
+
+    @staticmethod
+    def _traites(job, progression=None):
+        progression = progression or job.journal.progression()
+        return progression["judged"] + progression["written"]
+
+    def etat(self, job_id):
+        """
+        Retourne l'état d'un job : statut, progression, débit (produits/s) et temps restant estimé (s).
+        Returns:
+            dict | None: None si le job est inconnu.
+        """
+        with self._verrou:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job.future
+        if future.cancelled():
+            statut = "annule"
+        elif future.done():
+            statut = "erreur" if future.exception() is not None else "termine"
+        elif job.debut is None:
+            statut = "en_attente"
+        else:
+            statut = "en_cours"
+
+        progression = job.journal.progression()
+        traites = self._traites(job, progression)
+        if job.total:
+            traites = min(traites, job.total)
+        debit = None
+        eta = None
+        if job.debut is not None:
+            duree = (job.fin or time.time()) - job.debut
+            if duree > 0 and traites > job.traites_initial:
+                debit = (traites - job.traites_initial) / duree
+                if statut == "en_cours" and job.total:
+                    eta = max(0.0, (job.total - traites) / debit)
+        return {
+            "job_id": job_id,
+            "description": job.description,
+            "statut": statut,
+            "total": job.total,
+            "traites": traites,
+            "ecrits": progression["written"],
+            "progression": traites / job.total if job.total else (1.0 if statut == "termine" else 0.0),
+            "debit": debit,
+            "eta": eta,
+            "resultat": future.result() if statut == "termine" else None,
+            "erreur": str(future.exception()) if statut == "erreur" else None,
+            "metriques": job.metriques.resume(),
+        }
+
+    def jobs(self):
+        """Retourne l'état de tous les jobs connus, du plus récent au plus ancien."""
+
+        with self._verrou:
+            job_ids = sorted(self._jobs, key=lambda j: self._jobs[j].soumis_le, reverse=True)
+        return [self.etat(job_id) for job_id in job_ids]
+
+    def prometheus(self):
+        """Métriques de tous les jobs connus, au format texte Prometheus (label `run` = identifiant du job)."""
+
+        with self._verrou:
+            jobs = list(self._jobs.values())
+        return format_prometheus(job.metriques for job in jobs)
+
+    def annuler(self, job_id):
+        """Annule un job encore en file d'attente. Retourne False s'il a déjà démarré."""
+
+        with self._verrou:
+            job = self._jobs.get(job_id)
+        return job is not None and job.future.cancel()
+
+    def oublier(self, job_id):
+        """Retire un job terminé de la liste et ferme son journal."""
+
+        with self._verrou:
+            job = self._jobs.get(job_id)
+            if job is None or not job.future.done():
+                return False
+            del self._jobs[job_id]
+        job.journal.close()
+        return True
+
+    def arreter(self, attendre=True):
+        self._executor.shutdown(wait=attendre, cancel_futures=True)
@@ -0,0 +1,258 @@
+"""Ordonnanceur des appels OpenAI : quotas, concurrence adaptative et reprises.
+
+`OpenAIScheduler` enveloppe un client OpenAI synchrone et s'utilise à sa place
+(`openai_client=OpenAIScheduler(OpenAI(...))`) dans toutes les fonctions de l'agent.
+Il suit les requêtes/minute et tokens/minute à partir des en-têtes
+`x-ratelimit-*` renvoyés par l'API, réduit la concurrence sur les 429 et
+rejoue les erreurs transitoires avec un backoff exponentiel et du jitter, au
+lieu de laisser l'agent écrire une valeur vide.
+"""
+
+import random
+import re
+import threading
+import time
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.metriques import compter
+
+CODES_TRANSITOIRES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def _duree_reset(valeur):
+    """Convertit une durée d'en-tête OpenAI ("1s", "6m0s", "20ms") en secondes."""
+
+    if not valeur:
+        return None
+    total = 0.0
+    for nombre, unite in re.findall(r"([\d.]+)(ms|h|m|s)", str(valeur)):
+        total += float(nombre) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unite]
+    return total
+
+
+def _entier(valeur):
+    try:
+        return int(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+def est_transitoire(erreur):
+    """Indique si une erreur OpenAI mérite d'être rejouée (quota, surcharge, réseau)."""
+
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(erreur, APIConnectionError):
+        return True
+    if isinstance(erreur, APIStatusError):
+        return erreur.status_code in CODES_TRANSITOIRES
+    return getattr(erreur, "status_code", None) in CODES_TRANSITOIRES
+
+
+class _Seau:
+    """Seau à jetons rechargé linéairement sur une minute."""
+
+    def __init__(self, capacite_par_minute=None):
+        self.capacite = capacite_par_minute
+        self.disponible = capacite_par_minute or 0
+        self._maj = time.monotonic()
+
+    def recharger(self):
+        maintenant = time.monotonic()
+        if self.capacite:
+            self.disponible = min(self.capacite, self.disponible + (maintenant - self._maj) * self.capacite / 60)
+        self._maj = maintenant
+
+    def attente(self, quantite):
+        """Secondes à attendre avant de pouvoir consommer `quantite` (0 si immédiat)."""
+
+        if not self.capacite:
+            return 0.0
+        self.recharger()
+        manque = min(quantite, self.capacite) - self.disponible
+        return max(0.0, manque * 60 / self.capacite)
+
+
+class SchedulerStats:
+    def __init__(self):
+        self.requetes = 0
+        self.reprises = 0
+        self.erreurs_quota = 0
+        self.echecs = 0
+        self.tokens = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class OpenAIScheduler:
+    """
+    Enveloppe de client OpenAI avec budget requêtes/tokens par minute et reprises.
+    Args:
+        openai_client (OpenAI): Client OpenAI synchrone (idéalement créé avec `max_retries=0`).
+        max_concurrence (int): Nombre maximal de requêtes simultanées.
+        rpm (int, optionnel): Requêtes par minute autorisées. Lu dans les en-têtes si None.
+        tpm (int, optionnel): Tokens par minute autorisés. Lu dans les en-têtes si None.
+        max_retries (int): Nombre de reprises d'une erreur transitoire avant abandon.
+        backoff_base (float): Délai de base du backoff exponentiel, en secondes.
+        backoff_max (float): Délai maximal entre deux tentatives, en secondes.
+        tokens_sortie_estimes (int): Tokens de réponse réservés quand `max_tokens` n'est pas précisé.
+    """
+
+    def __init__(self, openai_client, max_concurrence=16, rpm=None, tpm=None, max_retries=6, backoff_base=1.0, backoff_max=60.0, tokens_sortie_estimes=300):
+        self._client = openai_client
+        self.max_concurrence = max(1, max_concurrence)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tokens_sortie_estimes = tokens_sortie_estimes
+        self.stats = SchedulerStats()
+        self._limite = float(self.max_concurrence)
+        self._en_cours = 0
+        self._condition = threading.Condition()
+        self._requetes = _Seau(rpm)
+        self._tokens = _Seau(tpm)
+        self._pause_jusqua = 0.0
+        self.chat = _Chat(self)
+
+    def __getattr__(self, nom):
+        # files, batches, etc. sont délégués tels quels au client sous-jacent
+        if nom.startswith("_"):
+            raise AttributeError(nom)
+        return getattr(self._client, nom)
+
+    @property
+    def concurrence(self):
+        """Concurrence courante, ajustée selon les erreurs de quota."""
+
+        return int(self._limite)
+
+    def _estimer_tokens(self, kwargs):
+        caracteres = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+        return caracteres // 4 + (kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or self.tokens_sortie_estimes)
+
+    def _acquerir(self, tokens):
+        """Attend une place et le budget nécessaire. Retourne les tokens réservés (0 si la limite est inconnue)."""
+
+        with self._condition:
+            while True:
+                attente = max(
+                    self._pause_jusqua - time.monotonic(),
+                    self._requetes.attente(1),
+                    self._tokens.attente(tokens),
+                )
+                if self._en_cours < int(self._limite) and attente <= 0:
+                    self._en_cours += 1
+                    if self._requetes.capacite:
+                        self._requetes.disponible -= 1
+                    if not self._tokens.capacite:
+                        return 0
+                    self._tokens.disponible -= tokens
+                    return tokens
+                self._condition.wait(timeout=attente if attente > 0 else None)
+
+    def _liberer(self, succes, quota=False):
+        with self._condition:
+            self._en_cours -= 1
+            if succes:
+                self.stats.requetes += 1
+            if quota:
+                self.stats.erreurs_quota += 1
+                # Décroissance multiplicative sur 429, croissance additive sinon (AIMD)
+                self._limite = max(1.0, self._limite / 2)
+            elif succes:
+                self._limite = min(float(self.max_concurrence), self._limite + 1 / self._limite)
+            self._condition.notify_all()
+
+    def _lire_entetes(self, entetes):
+        if not entetes:
+            return
+        with self._condition:
+            for seau, suffixe in ((self._requetes, "requests"), (self._tokens, "tokens")):
+                limite = _entier(entetes.get(f"x-ratelimit-limit-{suffixe}"))
+                restant = _entier(entetes.get(f"x-ratelimit-remaining-{suffixe}"))
+                decouverte = bool(limite) and not seau.capacite
+                if limite and seau.capacite != limite:
+                    seau.capacite = limite
+                if not seau.capacite:
+                    continue
+                seau.recharger()
+                if decouverte:
+                    # Première limite connue : le seau, vide à sa création, prend le restant annoncé par l'API
+                    seau.disponible = restant if restant is not None else limite
+                elif restant is not None:
+                    seau.disponible = min(seau.disponible, restant)
+                if restant == 0:
+                    reset = _duree_reset(entetes.get(f"x-ratelimit-reset-{suffixe}")) or 1.0
+                    self._pause_jusqua = max(self._pause_jusqua, time.monotonic() + reset)
+
+    def _delai_reprise(self, tentative, erreur):
+        reponse = getattr(erreur, "response", None)
+        entetes = getattr(reponse, "headers", None) or {}
+        retry_after = entetes.get("retry-after-ms")
+        if retry_after:
+            return float(retry_after) / 1000
+        retry_after = entetes.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Backoff exponentiel avec "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentative))
+
+    def create(self, **kwargs):
+        """Équivalent de `chat.completions.create`, avec quotas et reprises."""
+
+        tokens = self._estimer_tokens(kwargs)
+        completions = self._client.chat.completions
+        brut = getattr(completions, "with_raw_response", None)
+        for tentative in range(self.max_retries + 1):
+            reserves = self._acquerir(tokens)
+            try:
+                if brut is not None:
+                    reponse_brute = brut.create(**kwargs)
+                    self._lire_entetes(reponse_brute.headers)
+                    response = reponse_brute.parse()
+                else:
+                    response = completions.create(**kwargs)
+            except Exception as e:
+                quota = getattr(e, "status_code", None) == 429
+                self._liberer(False, quota=quota)
+                if quota:
+                    self._lire_entetes(getattr(getattr(e, "response", None), "headers", None))
+                if not est_transitoire(e) or tentative == self.max_retries:
+                    with self._condition:
+                        self.stats.echecs += 1
+                    raise
+                with self._condition:
+                    self.stats.reprises += 1
+                compter("reprises")
+                if quota:
+                    compter("erreurs_quota")
+                time.sleep(self._delai_reprise(tentative, e))
+                continue
+            self._liberer(True)
+            usage = getattr(response, "usage", None)
+            total = getattr(usage, "total_tokens", None)
+            if total:
+                with self._condition:
+                    self.stats.tokens += total
+                    # Ajuste le budget réservé à l'usage réel
+                    if reserves:
+                        self._tokens.disponible += reserves - total
+            return response
+
+
+class _Completions:
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+
+    def create(self, **kwargs):
+        return self._scheduler.create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, scheduler):
+        self.completions = _Completions(scheduler)
@@ -0,0 +1,59 @@
+"""Prompt utilisateur compilé : substitution des @champs en une seule passe.
+
+Le prompt est découpé une fois en segments (texte littéral / champ). Le rendu
+d'un produit n'est plus une série de `str.replace` (un par champ, sur tout le
+prompt) : chaque segment est produit une fois, et un champ ne peut plus en
+écraser un autre dont le nom commence pareil (`@name` / `@name_fr`).
+"""
+
+import re
+from functools import lru_cache
+
+MOTIF_CHAMP = re.compile(r"@([a-zA-Z0-9_]+)")
+
+
+class PromptTemplate:
+    """
+    Prompt utilisateur avec des @champs, compilé en segments.
+    Args:
+        source (str): Prompt utilisateur, ex. "Décris @name de la marque @brand".
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._segments = []
+        position = 0
+        for correspondance in MOTIF_CHAMP.finditer(source):
+            if correspondance.start() > position:
+                self._segments.append((False, source[position:correspondance.start()]))
+            self._segments.append((True, correspondance.group(1)))
+            position = correspondance.end()
+        if position < len(source):
+            self._segments.append((False, source[position:]))
+        # Champs dans l'ordre de première apparition
+        self.champs = tuple(dict.fromkeys(nom for est_champ, nom in self._segments if est_champ))
+
+    def __str__(self):
+        return self.source
+
+    def __repr__(self):
+        return f"PromptTemplate({self.source!r})"
+
+    def rendre(self, prod_dict):
+        """Retourne le prompt où chaque @champ est remplacé par la valeur du produit ("" si absente)."""
+
+        morceaux = []
+        for est_champ, texte in self._segments:
+            if est_champ:
+                valeur = prod_dict.get(texte)
+                morceaux.append("" if valeur is None else str(valeur))
+            else:
+                morceaux.append(texte)
+        return "".join(morceaux)
+
+
+@lru_cache(maxsize=128)
+def compiler_prompt(source):
+    """Retourne le `PromptTemplate` de `source` (compilé une seule fois par prompt distinct)."""
+
+    return PromptTemplate(source)
@@ -0,0 +1,74 @@
+"""Cache mémoire clé/valeur avec expiration et éviction LRU, partagé par les modules du backend."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache clé/valeur avec expiration (TTL) et éviction LRU, utilisable depuis plusieurs threads.
+    Args:
+        ttl (float): Durée de vie d'une entrée, en secondes.
+        max_entries (int): Nombre maximal d'entrées avant éviction de la moins récemment utilisée.
+    """
+
+    def __init__(self, ttl=300, max_entries=512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cle):
+        """Retourne `(True, valeur)` si la clé est présente et non expirée, `(False, None)` sinon."""
+
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] > time.monotonic():
+                self._entrees.move_to_end(cle)
+                self.hits += 1
+                return True, entree[1]
+            if entree is not None:
+                del self._entrees[cle]
+            self.misses += 1
+            return False, None
+
+    def set(self, cle, valeur, ttl=None):
+        with self._verrou:
+            self._entrees[cle] = (time.monotonic() + (self.ttl if ttl is None else ttl), valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.max_entries:
+                self._entrees.popitem(last=False)
+
+    def get_or_load(self, cle, charger):
+        """Retourne la valeur en cache ou l'obtient via `charger()` et la met en cache."""
+
+        trouve, valeur = self.get(cle)
+        if trouve:
+            return valeur
+        valeur = charger()
+        self.set(cle, valeur)
+        return valeur
+
+    def invalidate(self, predicat=None):
+        """Supprime les entrées dont la clé vérifie `predicat` (toutes si None). Retourne leur nombre."""
+
+        with self._verrou:
+            cles = [cle for cle in self._entrees if predicat is None or predicat(cle)]
+            for cle in cles:
+                del self._entrees[cle]
+            return len(cles)
+
+    def stats(self):
+        """Compteurs du cache : hits, misses, taux de hit et nombre d'entrées."""
+
+        with self._verrou:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entrees),
+            }
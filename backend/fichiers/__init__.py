@@ -0,0 +1 @@
+from .main import FichierImporte, importer_fichier, exporter_fichier, nettoyer_exports
@@ -0,0 +1,343 @@
+"""Import des fichiers produits (Excel/CSV) par morceaux, stockés en Parquet sur disque.
+
+Le fichier importé n'est jamais chargé en entier : il est lu par blocs de
+`TAILLE_CHUNK` lignes (CSV par `chunksize`, XLSX via openpyxl en lecture seule)
+et écrit dans un fichier Parquet du répertoire de données, un groupe de lignes
+par bloc. Les lectures suivantes (aperçu paginé, enrichissement) ne chargent que
+les lignes et les colonnes nécessaires.
+
+Les valeurs sont conservées sous forme de texte, telles qu'elles apparaissent
+dans le fichier (références à zéros initiaux, codes EAN...).
+
+pandas et pyarrow ne sont importés qu'à la première lecture ou écriture de fichier.
+"""
+
+import csv
+import hashlib
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from backend.stockage import chemin_donnees
+
+TAILLE_CHUNK = 10_000
+COLONNES_IDENTIFIANT = ("objectID", "objectId", "_objectID", "_objectId", "object_id")
+FORMATS_EXPORT = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Âge (secondes) au-delà duquel un export est considéré comme abandonné (session terminée)
+AGE_MAX_EXPORTS = 24 * 3600
+
+
+def empreinte_fichier(fichier):
+    """Empreinte SHA-256 du contenu d'un fichier ouvert en binaire (lu par blocs)."""
+
+    empreinte = hashlib.sha256()
+    fichier.seek(0)
+    for bloc in iter(lambda: fichier.read(1024 * 1024), b""):
+        empreinte.update(bloc)
+    fichier.seek(0)
+    return empreinte.hexdigest()
+
+
+def _noms_colonnes(entete):
+    """Noms de colonnes à la manière de pandas : cellules vides nommées, doublons suffixés."""
+
+    noms = []
+    vus = {}
+    for i, nom in enumerate(entete):
+        nom = str(nom) if nom not in (None, "") else f"Unnamed: {i}"
+        if nom in vus:
+            vus[nom] += 1
+            nom = f"{nom}.{vus[nom]}"
+        else:
+            vus[nom] = 0
+        noms.append(nom)
+    return noms
+
+
+def _en_texte(valeur):
+    if valeur is None:
+        return None
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return str(valeur)
+
+
+def _lire_csv(fichier, taille_chunk):
+    import pandas as pd
+
+    for morceau in pd.read_csv(fichier, chunksize=taille_chunk, dtype=str, keep_default_na=False):
+        yield morceau
+
+
+def _lire_xlsx(fichier, taille_chunk):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    classeur = load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        lignes = classeur.active.iter_rows(values_only=True)
+        entete = next(lignes, None)
+        if entete is None:
+            return
+        colonnes = _noms_colonnes(entete)
+        bloc = []
+        for ligne in lignes:
+            if all(valeur is None for valeur in ligne):
+                continue
+            bloc.append([_en_texte(valeur) for valeur in ligne[:len(colonnes)]])
+            if len(bloc) >= taille_chunk:
+                yield pd.DataFrame(bloc, columns=colonnes)
+                bloc = []
+        if bloc:
+            yield pd.DataFrame(bloc, columns=colonnes)
+    finally:
+        classeur.close()
+
+
+def _lire_xls(fichier, taille_chunk):
+    import pandas as pd
+
+    # Pas de lecteur en flux pour l'ancien format .xls : lecture complète puis découpage
+    df = pd.read_excel(fichier, dtype=str)
+    for debut in range(0, len(df), taille_chunk):
+        yield df.iloc[debut:debut + taille_chunk]
+
+
+def importer_fichier(fichier, nom=None, taille_chunk=TAILLE_CHUNK):
+    """
+    Convertit un fichier produits (xlsx, xls ou csv) en Parquet dans le répertoire de données.
+    Un fichier déjà importé (même contenu) n'est pas relu.
+    Args:
+        fichier: Fichier ouvert en binaire (ex. `UploadedFile` Streamlit).
+        nom (str, optionnel): Nom d'origine, utilisé pour déterminer le format. Par défaut `fichier.name`.
+        taille_chunk (int): Nombre de lignes lues et écrites à la fois.
+    Returns:
+        FichierImporte: Accès au fichier importé.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    nom = nom or getattr(fichier, "name", "")
+    chemin = chemin_donnees("imports", f"{empreinte_fichier(fichier)}.parquet")
+    if os.path.exists(chemin):
+        return FichierImporte(chemin, nom)
+
+    extension = nom.lower().rsplit(".", 1)[-1]
+    lecteur = {"csv": _lire_csv, "xls": _lire_xls}.get(extension, _lire_xlsx)
+    temporaire = f"{chemin}.tmp"
+    ecrivain = None
+    try:
+        for morceau in lecteur(fichier, taille_chunk):
+            if ecrivain is None:
+                schema = pa.schema([(str(colonne), pa.string()) for colonne in morceau.columns])
+                ecrivain = pq.ParquetWriter(temporaire, schema)
+            morceau = morceau.astype(object).where(morceau.notna(), None)
+            morceau.columns = schema.names
+            ecrivain.write_table(pa.Table.from_pandas(morceau, schema=schema, preserve_index=False))
+        if ecrivain is None:
+            raise ValueError("Le fichier ne contient aucune ligne.")
+    finally:
+        if ecrivain is not None:
+            ecrivain.close()
+    os.replace(temporaire, chemin)
+    return FichierImporte(chemin, nom)
+
+
+class FichierImporte:
+    """
+    Fichier produits importé, stocké en Parquet, lu par morceaux.
+
+    Les colonnes créées ou enrichies dans l'application sont gardées à part
+    (valeur par défaut ou liste de valeurs) sans réécrire le fichier Parquet.
+    Args:
+        chemin (str): Fichier Parquet.
+        nom (str): Nom du fichier d'origine.
+    """
+
+    def __init__(self, chemin, nom=""):
+        self.chemin = chemin
+        import pyarrow.parquet as pq
+
+        self.nom = nom
+        metadonnees = pq.read_metadata(chemin)
+        self.nb_lignes = metadonnees.num_rows
+        self.colonnes_fichier = list(metadonnees.schema.to_arrow_schema().names)
+        self._tailles_groupes = [metadonnees.row_group(i).num_rows for i in range(metadonnees.num_row_groups)]
+        self._colonnes_ajoutees = {}
+        # Incrémentée à chaque modification de colonne (pour savoir si un export est à jour)
+        self.version = 0
+
+    def __len__(self):
+        return self.nb_lignes
+
+    @property
+    def colonnes(self):
+        return self.colonnes_fichier + [c for c in self._colonnes_ajoutees if c not in self.colonnes_fichier]
+
+    def ajouter_colonne(self, nom, valeur_defaut=""):
+        """Ajoute une colonne remplie avec `valeur_defaut`. Retourne False si elle existe déjà."""
+
+        if nom in self.colonnes:
+            return False
+        self._colonnes_ajoutees[nom] = valeur_defaut
+        self.version += 1
+        return True
+
+    def remplacer_colonne(self, nom, valeurs):
+        """Remplace (ou crée) une colonne avec une valeur par ligne."""
+
+        valeurs = list(valeurs)
+        if len(valeurs) != self.nb_lignes:
+            raise ValueError(f"{len(valeurs)} valeurs pour {self.nb_lignes} lignes.")
+        self._colonnes_ajoutees[nom] = valeurs
+        self.version += 1
+
+    def colonnes_utiles(self, champs):
+        """Colonnes existantes parmi `champs` (ex. @champs du prompt et champ cible), plus l'identifiant produit."""
+
+        utiles = set(champs) | set(COLONNES_IDENTIFIANT)
+        return [c for c in self.colonnes if c in utiles]
+
+    def iter_lots(self, colonnes=None, debut=0, fin=None):
+        """
+        Parcourt les lignes `[debut, fin)` par groupe de lignes Parquet.
+        Args:
+            colonnes (list, optionnel): Colonnes à lire (par défaut toutes).
+        Yields:
+            DataFrame: Un bloc de lignes (index = numéro de ligne dans le fichier).
+        """
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        fin = self.nb_lignes if fin is None else min(fin, self.nb_lignes)
+        colonnes = self.colonnes if colonnes is None else list(colonnes)
+        a_lire = [c for c in colonnes if c in self.colonnes_fichier and not isinstance(self._colonnes_ajoutees.get(c), list)]
+        parquet = pq.ParquetFile(self.chemin)
+        try:
+            decalage = 0
+            for groupe, taille in enumerate(self._tailles_groupes):
+                if decalage + taille <= debut:
+                    decalage += taille
+                    continue
+                if decalage >= fin:
+                    break
+                premiere, derniere = max(debut, decalage), min(fin, decalage + taille)
+                if a_lire:
+                    df = parquet.read_row_group(groupe, columns=a_lire).to_pandas()
+                    df = df.iloc[premiere - decalage:derniere - decalage].copy()
+                else:
+                    df = pd.DataFrame(index=range(derniere - premiere))
+                df.index = range(premiere, derniere)
+                for colonne in colonnes:
+                    if colonne not in a_lire:
+                        valeur = self._colonnes_ajoutees[colonne]
+                        df[colonne] = valeur[premiere:derniere] if isinstance(valeur, list) else valeur
+                yield df[colonnes]
+                decalage += taille
+        finally:
+            parquet.close()
+
+    def lire(self, colonnes=None, debut=0, fin=None):
+        """Retourne les lignes `[debut, fin)` dans un DataFrame."""
+
+        import pandas as pd
+
+        lots = list(self.iter_lots(colonnes, debut, fin))
+        if not lots:
+            return pd.DataFrame(columns=self.colonnes if colonnes is None else list(colonnes))
+        return pd.concat(lots)
+
+    def page(self, numero, taille=50):
+        """Retourne la page `numero` (à partir de 0) de `taille` lignes, pour l'aperçu."""
+
+        return self.lire(debut=numero * taille, fin=(numero + 1) * taille)
+
+    def produits(self, colonnes=None):
+        """Retourne les lignes sous forme de dicts (valeurs manquantes remplacées par "")."""
+
+        produits = []
+        for lot in self.iter_lots(colonnes):
+            produits.extend(lot.astype(object).where(lot.notna(), "").to_dict(orient="records"))
+        return produits
+
+
+def exporter_fichier(fichier, format_export="xlsx", chemin=None):
+    """
+    Écrit le fichier importé (colonnes ajoutées et enrichies comprises) sur disque, bloc par bloc.
+
+    Seul un groupe de lignes est en mémoire à la fois : le classeur XLSX est écrit
+    par xlsxwriter en mode `constant_memory`, le CSV et le Parquet par ajouts successifs.
+    Args:
+        fichier (FichierImporte): Fichier à exporter.
+        format_export (str): "xlsx", "csv" ou "parquet".
+        chemin (str, optionnel): Destination. Par défaut un fichier du dossier `exports/` du répertoire de données.
+    Returns:
+        str: Chemin du fichier écrit.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if format_export not in FORMATS_EXPORT:
+        raise ValueError(f"Format d'export inconnu : {format_export}")
+    if chemin is None:
+        base = os.path.splitext(os.path.basename(fichier.nom))[0] or "produits"
+        descripteur, chemin = tempfile.mkstemp(
+            prefix=f"{base}_enrichi_", suffix=f".{format_export}", dir=os.path.dirname(chemin_donnees("exports", base))
+        )
+        os.close(descripteur)
+    colonnes = fichier.colonnes
+
+    if format_export == "xlsx":
+        import xlsxwriter
+
+        classeur = xlsxwriter.Workbook(chemin, {"constant_memory": True})
+        try:
+            feuille = classeur.add_worksheet()
+            feuille.write_row(0, 0, colonnes)
+            ligne = 1
+            for lot in fichier.iter_lots(colonnes):
+                for valeurs in lot.itertuples(index=False, name=None):
+                    feuille.write_row(ligne, 0, ["" if pd.isna(v) else v for v in valeurs])
+                    ligne += 1
+        finally:
+            classeur.close()
+    elif format_export == "csv":
+        with open(chemin, "w", encoding="utf-8-sig", newline="") as sortie:
+            ecrivain = csv.writer(sortie)
+            ecrivain.writerow(colonnes)
+            for lot in fichier.iter_lots(colonnes):
+                ecrivain.writerows(lot.astype(object).where(lot.notna(), "").itertuples(index=False, name=None))
+    else:
+        schema = pa.schema([(colonne, pa.string()) for colonne in colonnes])
+        with pq.ParquetWriter(chemin, schema) as ecrivain:
+            for lot in fichier.iter_lots(colonnes):
+                lot = lot.astype(object).where(lot.notna(), None).map(_en_texte)
+                ecrivain.write_table(pa.Table.from_pandas(lot, schema=schema, preserve_index=False))
+    return chemin
+
+
+def nettoyer_exports(age_max=AGE_MAX_EXPORTS):
+    """
+    Supprime les exports du répertoire de données plus anciens que `age_max` secondes.
+    Returns:
+        int: Nombre de fichiers supprimés.
+    """
+    limite = time.time() - age_max
+    nb = 0
+    for racine, _, noms in os.walk(os.path.dirname(chemin_donnees("exports", "_"))):
+        for nom in noms:
+            chemin = os.path.join(racine, nom)
+            try:
+                if os.path.getmtime(chemin) < limite:
+                    os.remove(chemin)
+                    nb += 1
+            except OSError as e:
+                print(f"Impossible de supprimer l'export {chemin} : {e}")
+    return nb
@@ -0,0 +1,333 @@
+"""Instrumentation des enrichissements : latences par étape, tokens, coût, reprises et erreurs.
+
+Un `MetriquesRun` est activé pour la durée d'un enrichissement (`with metriques.activer():`).
+Les étapes instrumentées — lecture Algolia, génération, juge, écriture — l'alimentent
+sans qu'il soit passé en argument : la mesure courante est portée par une variable de
+contexte, propagée aux threads de `asyncio.to_thread` et aux tâches asyncio. Hors
+d'un run actif, les fonctions d'enregistrement ne font rien.
+
+Les métriques se lisent sous forme de résumé (`resume()`), de texte au format
+Prometheus (`prometheus()`, éventuellement servi en HTTP par `servir_prometheus`) ou
+d'une ligne JSON ajoutée au journal `metriques.jsonl` (`journaliser()`).
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.stockage import chemin_donnees
+
+ETAPES = ("lecture", "generation", "juge", "ecriture")
+BORNES_LATENCE = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prix indicatifs en dollars par million de tokens (entrée, sortie)
+PRIX_MODELES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+REMISE_API_BATCH = 0.5
+# Adresse d'écoute de `servir_prometheus` : locale par défaut, le point d'accès n'étant pas authentifié
+HOTE_PROMETHEUS = os.getenv("METRIQUES_HOTE", "127.0.0.1")
+# Type et description (# TYPE / # HELP) des familles de métriques Prometheus
+FAMILLES_PROMETHEUS = {
+    "enrichissement_etape_duree_secondes": ("histogram", "Durée des étapes d'enrichissement, en secondes."),
+    "enrichissement_erreurs_total": ("counter", "Erreurs par étape d'enrichissement."),
+    "enrichissement_tokens_total": ("counter", "Tokens consommés par modèle, étape et type."),
+    "enrichissement_cout_estime_dollars": ("gauge", "Coût estimé du run, en dollars."),
+}
+
+_courantes = ContextVar("metriques_run", default=None)
+_etape_courante = ContextVar("metriques_etape", default=None)
+
+
+class Histogramme:
+    """
+    Histogramme cumulatif à bornes fixes (format Prometheus).
+    Args:
+        bornes (tuple): Bornes supérieures des classes, croissantes (la classe +Inf est implicite).
+    """
+
+    def __init__(self, bornes=BORNES_LATENCE):
+        self.bornes = tuple(bornes)
+        self.comptes = [0] * (len(self.bornes) + 1)
+        self.nombre = 0
+        self.somme = 0.0
+
+    def observer(self, valeur):
+        self.comptes[bisect.bisect_left(self.bornes, valeur)] += 1
+        self.nombre += 1
+        self.somme += valeur
+
+    def quantile(self, q):
+        """Estimation du quantile `q` (borne supérieure de la classe qui le contient), None si vide."""
+
+        if not self.nombre:
+            return None
+        rang = q * self.nombre
+        cumul = 0
+        for borne, compte in zip(self.bornes + (float("inf"),), self.comptes):
+            cumul += compte
+            if cumul >= rang:
+                return borne
+        return float("inf")
+
+    def cumuls(self):
+        """Comptes cumulés `[(borne, compte)]`, la dernière borne étant +Inf."""
+
+        resultat = []
+        cumul = 0
+        for borne, compte in zip(self.bornes + (float("inf"),), self.comptes):
+            cumul += compte
+            resultat.append((borne, cumul))
+        return resultat
+
+
+def cout_estime(model, tokens_entree, tokens_sortie, remise=1.0):
+    """Coût estimé en dollars d'un nombre de tokens (0.0 si le modèle n'a pas de prix connu)."""
+
+    prix = PRIX_MODELES.get(model)
+    if prix is None:
+        # Versions datées (ex. "gpt-4o-mini-2024-07-18") : prix du modèle de base le plus long qui correspond
+        bases = [nom for nom in PRIX_MODELES if str(model).startswith(nom)]
+        prix = PRIX_MODELES[max(bases, key=len)] if bases else (0.0, 0.0)
+    return (tokens_entree * prix[0] + tokens_sortie * prix[1]) / 1_000_000 * remise
+
+
+class MetriquesRun:
+    """
+    Métriques d'un enrichissement.
+    Args:
+        run_id (str, optionnel): Identifiant du run (label `run` des métriques Prometheus).
+    """
+
+    def __init__(self, run_id=""):
+        self.run_id = run_id
+        self.debut = time.time()
+        self.fin = None
+        self._latences = {}
+        self._erreurs = {}
+        self._compteurs = {}
+        self._tokens = {}
+        self.cout = 0.0
+        self._verrou = threading.Lock()
+
+    @contextmanager
+    def activer(self):
+        """Rend ce run courant pour le bloc (et les threads/tâches qui en sont lancés)."""
+
+        jeton = _courantes.set(self)
+        try:
+            yield self
+        finally:
+            _courantes.reset(jeton)
+            self.fin = time.time()
+
+    def observer(self, etape, duree):
+        with self._verrou:
+            self._latences.setdefault(etape, Histogramme()).observer(duree)
+
+    def erreur(self, etape, nombre=1):
+        if nombre:
+            with self._verrou:
+                self._erreurs[etape] = self._erreurs.get(etape, 0) + nombre
+
+    def compter(self, nom, nombre=1):
+        with self._verrou:
+            self._compteurs[nom] = self._compteurs.get(nom, 0) + nombre
+
+    def tokens(self, model, etape, tokens_entree, tokens_sortie, remise=1.0):
+        with self._verrou:
+            entree, sortie = self._tokens.get((model, etape), (0, 0))
+            self._tokens[(model, etape)] = (entree + tokens_entree, sortie + tokens_sortie)
+            self.cout += cout_estime(model, tokens_entree, tokens_sortie, remise)
+
+    def resume(self):
+        """
+        Résumé du run.
+        Returns:
+            dict: `duree`, `etapes` ({etape: nombre, duree_totale, p50, p95, erreurs}), `tokens_entree`,
+                `tokens_sortie`, `cout_estime`, `appels_llm`, `reprises` et autres compteurs.
+        """
+        with self._verrou:
+            etapes = {}
+            for etape in sorted(set(self._latences) | set(self._erreurs), key=lambda e: (e not in ETAPES, ETAPES.index(e) if e in ETAPES else e)):
+                histogramme = self._latences.get(etape, Histogramme())
+                etapes[etape] = {
+                    "nombre": histogramme.nombre,
+                    "duree_totale": histogramme.somme,
+                    "p50": histogramme.quantile(0.5),
+                    "p95": histogramme.quantile(0.95),
+                    "erreurs": self._erreurs.get(etape, 0),
+                }
+            return {
+                "run_id": self.run_id,
+                "duree": (self.fin or time.time()) - self.debut,
+                "etapes": etapes,
+                "tokens_entree": sum(entree for entree, _ in self._tokens.values()),
+                "tokens_sortie": sum(sortie for _, sortie in self._tokens.values()),
+                "cout_estime": self.cout,
+                "appels_llm": self._compteurs.get("appels_llm", 0),
+                "reprises": self._compteurs.get("reprises", 0),
+                "compteurs": dict(self._compteurs),
+            }
+
+    def series_prometheus(self):
+        """Séries du run, en couples `(famille, ligne)` au format texte Prometheus."""
+
+        label_run = f'run="{self.run_id}"'
+        series = []
+        with self._verrou:
+            famille = "enrichissement_etape_duree_secondes"
+            for etape, histogramme in sorted(self._latences.items()):
+                labels = f'{label_run},etape="{etape}"'
+                for borne, cumul in histogramme.cumuls():
+                    le = "+Inf" if borne == float("inf") else repr(borne)
+                    series.append((famille, f'{famille}_bucket{{{labels},le="{le}"}} {cumul}'))
+                series.append((famille, f"{famille}_sum{{{labels}}} {histogramme.somme}"))
+                series.append((famille, f"{famille}_count{{{labels}}} {histogramme.nombre}"))
+            for etape, nombre in sorted(self._erreurs.items()):
+                series.append(("enrichissement_erreurs_total", f'enrichissement_erreurs_total{{{label_run},etape="{etape}"}} {nombre}'))
+            for (model, etape), (entree, sortie) in sorted(self._tokens.items()):
+                labels = f'{label_run},modele="{model}",etape="{etape}"'
+                series.append(("enrichissement_tokens_total", f'enrichissement_tokens_total{{{labels},type="entree"}} {entree}'))
+                series.append(("enrichissement_tokens_total", f'enrichissement_tokens_total{{{labels},type="sortie"}} {sortie}'))
+            for nom, nombre in sorted(self._compteurs.items()):
+                series.append((f"enrichissement_{nom}_total", f"enrichissement_{nom}_total{{{label_run}}} {nombre}"))
+            series.append(("enrichissement_cout_estime_dollars", f"enrichissement_cout_estime_dollars{{{label_run}}} {self.cout}"))
+        return series
+
+    def prometheus(self):
+        """Métriques du run au format texte Prometheus."""
+
+        return format_prometheus([self])
+
+    def journaliser(self, chemin=None, **contexte):
+        """Ajoute le résumé du run (et `contexte`) en une ligne JSON au journal `metriques.jsonl`."""
+
+        ligne = {"horodatage": time.time(), **contexte, **self.resume()}
+        with open(chemin or chemin_donnees("metriques.jsonl"), "a", encoding="utf-8") as sortie:
+            sortie.write(json.dumps(ligne, ensure_ascii=False, default=str) + "\n")
+
+
+def format_prometheus(runs):
+    """
+    Regroupe les séries de plusieurs `MetriquesRun` par famille, chacune précédée une seule fois
+    de ses lignes `# HELP` et `# TYPE`.
+    Returns:
+        str: Texte au format d'exposition Prometheus.
+    """
+    familles = {}
+    for run in runs:
+        for famille, ligne in run.series_prometheus():
+            familles.setdefault(famille, []).append(ligne)
+    lignes = []
+    for famille, series in familles.items():
+        type_metrique, description = FAMILLES_PROMETHEUS.get(
+            famille, ("counter", f"Compteur {famille[len('enrichissement_'):-len('_total')]} du run.")
+        )
+        lignes.append(f"# HELP {famille} {description}")
+        lignes.append(f"# TYPE {famille} {type_metrique}")
+        lignes.extend(series)
+    return "\n".join(lignes) + "\n" if lignes else ""
+
+
+def metriques_courantes():
+    """Run actif dans le contexte courant, ou None."""
+
+    return _courantes.get()
+
+
+@contextmanager
+def etape(nom):
+    """
+    Mesure la durée du bloc dans l'étape `nom` du run courant et compte une erreur s'il lève.
+    Les appels LLM faits dans le bloc sont attribués à cette étape.
+    """
+    metriques = _courantes.get()
+    if metriques is None:
+        yield
+        return
+    jeton = _etape_courante.set(nom)
+    debut = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metriques.erreur(nom)
+        raise
+    finally:
+        metriques.observer(nom, time.perf_counter() - debut)
+        _etape_courante.reset(jeton)
+
+
+def compter_erreurs(nom_etape, nombre=1):
+    metriques = _courantes.get()
+    if metriques is not None:
+        metriques.erreur(nom_etape, nombre)
+
+
+def compter(nom, nombre=1):
+    metriques = _courantes.get()
+    if metriques is not None:
+        metriques.compter(nom, nombre)
+
+
+def enregistrer_appel_llm(model, usage, remise=1.0):
+    """
+    Enregistre un appel LLM (réponse ou corps de réponse batch) dans le run courant.
+    Args:
+        model (str): Modèle appelé.
+        usage: `response.usage` (objet ou dict avec prompt_tokens / completion_tokens), peut être None.
+        remise (float): Coefficient appliqué au coût (ex. `REMISE_API_BATCH`).
+    """
+    metriques = _courantes.get()
+    if metriques is None:
+        return
+    metriques.compter("appels_llm")
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        entree, sortie = usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    else:
+        entree, sortie = getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+    metriques.tokens(model, _etape_courante.get() or "autre", entree, sortie, remise)
+
+
+def servir_prometheus(fournir_texte, port, hote=None):
+    """
+    Sert `fournir_texte()` en HTTP (`GET /metrics`) dans un thread d'arrière-plan.
+    Args:
+        fournir_texte (callable): Retourne le texte Prometheus à servir.
+        port (int): Port d'écoute.
+        hote (str, optionnel): Adresse d'écoute, `HOTE_PROMETHEUS` (`METRIQUES_HOTE`, 127.0.0.1) par défaut.
+            Le point d'accès n'est pas authentifié : ne l'ouvrir (`0.0.0.0`) que sur un réseau de confiance.
+    Returns:
+        ThreadingHTTPServer: Serveur démarré (`shutdown()` pour l'arrêter).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Gestionnaire(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            corps = fournir_texte().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+        def log_message(self, *args):
+            pass
+
+    serveur = ThreadingHTTPServer((hote or HOTE_PROMETHEUS, port), _Gestionnaire)
+    threading.Thread(target=serveur.serve_forever, name="metriques-prometheus", daemon=True).start()
+    return serveur
@@ -0,0 +1,18 @@
+"""Emplacement des données locales de l'application (caches, journaux, index)."""
+
+import os
+
+REPERTOIRE_DEFAUT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.enrichissement'))
+
+
+def chemin_donnees(*parties):
+    """
+    Retourne un chemin dans le répertoire de données locales et crée ses dossiers parents.
+
+    Le répertoire est défini par la variable d'environnement ENRICHISSEMENT_DATA_DIR
+    (par défaut `.enrichissement/` à la racine du dépôt).
+    """
+    racine = os.getenv("ENRICHISSEMENT_DATA_DIR", REPERTOIRE_DEFAUT)
+    chemin = os.path.join(racine, *parties)
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    return chemin
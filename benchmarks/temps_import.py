@@ -0,0 +1,107 @@
+"""Mesure du temps d'import des dépendances de `frontend/app.py`.
+
+Chaque module importé en tête de l'application (modules backend et bibliothèques
+tierces) est importé dans un interpréteur neuf, plusieurs fois ; la médiane est
+retenue. Les résultats peuvent être enregistrés en JSON puis comparés à une
+référence pour repérer une régression du temps de démarrage :
+
+    python benchmarks/temps_import.py --json reference.json
+    python benchmarks/temps_import.py --reference reference.json --seuil 0.2
+"""
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RACINE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+APPLICATION = os.path.join(RACINE, 'frontend', 'app.py')
+MODULES_STDLIB = set(getattr(sys, 'stdlib_module_names', ()))
+
+_MESURE = (
+    "import sys, time; sys.path.insert(0, {racine!r}); "
+    "debut = time.perf_counter(); import {module}; print(time.perf_counter() - debut)"
+)
+
+
+def modules_application(chemin=APPLICATION):
+    """Modules importés au niveau du module par l'application (bibliothèque standard exclue)."""
+
+    with open(chemin, encoding='utf-8') as source:
+        arbre = ast.parse(source.read())
+    modules = []
+    for noeud in arbre.body:
+        if isinstance(noeud, ast.Import):
+            noms = [alias.name for alias in noeud.names]
+        elif isinstance(noeud, ast.ImportFrom) and noeud.module and not noeud.level:
+            noms = [noeud.module]
+        else:
+            continue
+        for nom in noms:
+            if nom.split('.')[0] not in MODULES_STDLIB and nom not in modules:
+                modules.append(nom)
+    return modules
+
+
+def mesurer(module, repetitions=5):
+    """
+    Temps d'import (s) d'un module dans un interpréteur neuf.
+    Returns:
+        float | None: Médiane des mesures, None si l'import échoue.
+    """
+    durees = []
+    for _ in range(repetitions):
+        resultat = subprocess.run(
+            [sys.executable, '-c', _MESURE.format(racine=RACINE, module=module)],
+            capture_output=True, text=True, cwd=RACINE,
+        )
+        if resultat.returncode != 0:
+            print(f"Import impossible de {module} : {resultat.stderr.strip().splitlines()[-1:]}")
+            return None
+        durees.append(float(resultat.stdout.strip().splitlines()[-1]))
+    return statistics.median(durees)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=5, help="Imports mesurés par module (médiane).")
+    parser.add_argument('--json', help="Enregistre les mesures dans ce fichier.")
+    parser.add_argument('--reference', help="Compare aux mesures d'un fichier JSON précédent.")
+    parser.add_argument('--seuil', type=float, default=0.2, help="Hausse relative tolérée par rapport à la référence.")
+    args = parser.parse_args()
+
+    reference = {}
+    if args.reference:
+        with open(args.reference, encoding='utf-8') as entree:
+            reference = json.load(entree)
+
+    mesures = {}
+    regressions = []
+    for module in modules_application():
+        duree = mesurer(module, args.repetitions)
+        mesures[module] = duree
+        if duree is None:
+            continue
+        ligne = f"{module:<40} {duree * 1000:8.1f} ms"
+        avant = reference.get(module)
+        if avant:
+            ecart = (duree - avant) / avant
+            ligne += f"   ({ecart:+.0%} / référence)"
+            # Les hausses de quelques millisecondes relèvent du bruit de mesure
+            if ecart > args.seuil and duree - avant > 0.005:
+                regressions.append(module)
+        print(ligne)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as sortie:
+            json.dump(mesures, sortie, indent=2)
+    if regressions:
+        print(f"Régression du temps d'import : {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
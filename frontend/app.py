@@ -3,10 +3,10 @@
 import streamlit as st
 import sys
 import os
+import functools
 import json
+import re
 import time
-import pandas as pd
-import io
 
 st.set_page_config(
     page_title="Enrichissement Algolia",
@@ -21,22 +21,34 @@ st.set_page_config(
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.GET.main import (
-    get_algolia_indexes_name,
-    get_categories_lvl0_name,
-    get_categories_lvl1_name,
-    get_categories_lvl2_name,
+    ATTRIBUTS_AFFICHAGE,
+    attributs_projection,
     get_product_by_id,
     get_products_by_category_lvl2,
-    get_algolia_fields,
+    iter_products_by_category,
 )
+from backend.GET.schema import construction_en_cours, get_schema
+from backend.GET.cache import (
+    get_indexes_name_cached,
+    get_category_tree_cached,
+    invalidate_categories,
+)
+from backend.GET.categories import CategoryTree, complement_en_cours
 from backend.POST.main import post_new_field_to_products
-from backend.agent.main import enrichir_champ_batch, enrichir_champ_batch_excel
+from backend.agent.main import enrichir_champ_batch_excel_parallele, extraire_champs_sources
+from backend.fichiers.main import FORMATS_EXPORT, empreinte_fichier, exporter_fichier, importer_fichier, nettoyer_exports
+from backend.agent.cache import PromptCache
+from backend.agent.connaissance import charger_index_connaissance
+from backend.agent.juge import EXPRESSIONS_INTERDITES_DEFAUT, JudgePolicy
+from backend.agent.scheduler import OpenAIScheduler
+from backend.agent.journal import ouvrir_journal
+from backend.agent.runner import JobRunner, executer_enrichissement
+from backend.metriques import servir_prometheus
+from backend.POST.staging import StagingStore
 from backend.SupaBase.main import (
     get_nom_instructions_categories_lvl0,
-    get_instruction_by_nom,
-    get_instruction_juge_by_nom,
+    get_instruction_complete_by_nom,
 )
-from openai import OpenAI
 
 # -------------------------------------------------
 # Session state & authentification
@@ -46,8 +58,13 @@ if "products" not in st.session_state:
     st.session_state.products = None
 if "custom_fields" not in st.session_state:
     st.session_state.custom_fields = set()
+if "selection_produits" not in st.session_state:
+    st.session_state.selection_produits = None
 
 SESSION_TIMEOUT = 30 * 60  # 30 minutes (en secondes)
+TAILLE_PAGE_APERCU = 50  # lignes par page de l'aperçu du fichier importé
+TAILLE_RAPPORT_SIMULATION = 200  # lignes détaillées du rapport de différences d'une simulation
+MODELE_ENRICHISSEMENT = "gpt-4o-mini"
 
 
 def check_password():
@@ -99,14 +116,92 @@ def clean_category_name(category: str | None):
     return parts[-1] if len(parts) > 1 else category
 
 
-def get_full_category_path(category_name: str, all_categories: list[str]):
-    return next((cat for cat in all_categories if clean_category_name(cat) == category_name), None)
+@st.cache_resource
+def get_prompt_cache(bypass=False):
+    """Cache SQLite des réponses LLM partagé par toutes les sessions (`bypass` : enregistré mais jamais lu)."""
+
+    return PromptCache(bypass=bypass)
+
+
+@st.cache_resource
+def get_openai_client():
+    """Client OpenAI partagé : les quotas et la concurrence sont suivis pour toutes les sessions."""
+
+    from openai import OpenAI
+
+    # Les reprises sont gérées par l'ordonnanceur, pas par le SDK
+    return OpenAIScheduler(OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0))
+
+
+@st.cache_resource
+def get_job_runner():
+    """File des jobs d'enrichissement, partagée par toutes les sessions et indépendante des reruns."""
+
+    runner = JobRunner()
+    # Avec METRIQUES_PORT, les métriques des jobs sont exposées en HTTP (GET /metrics) pour Prometheus
+    port = os.getenv("METRIQUES_PORT")
+    if port:
+        try:
+            servir_prometheus(runner.prometheus, int(port))
+        except (OSError, ValueError) as e:
+            print(f"Impossible d'exposer les métriques sur le port {port} : {e}")
+    return runner
+
+
+def export_pret(fichier, format_export):
+    """
+    Retourne le fichier d'export de la session s'il est à jour (même fichier, version et format), sinon None.
+    Un export périmé (fichier enrichi depuis, autre format) est supprimé du disque.
+    """
+    cle = (fichier.chemin, fichier.version, format_export)
+    export = st.session_state.get("export")
+    if export is None:
+        return None
+    if export[0] == cle and os.path.exists(export[1]):
+        return export[1]
+    if os.path.exists(export[1]):
+        os.remove(export[1])
+    st.session_state.export = None
+    return None
+
+
+def preparer_export(fichier, format_export):
+    """Écrit l'export de la session sur disque et supprime les exports abandonnés par les sessions terminées."""
 
+    nettoyer_exports()
+    chemin = exporter_fichier(fichier, format_export)
+    st.session_state.export = ((fichier.chemin, fichier.version, format_export), chemin)
+    return chemin
 
-def filter_categories_by_parent(categories: list[str], parent_category: str | None):
-    if not parent_category:
-        return []
-    return [cat for cat in categories if cat.startswith(parent_category)]
+
+def lire_export(chemin):
+    with open(chemin, "rb") as export:
+        return export.read()
+
+
+def format_duree(secondes):
+    if secondes is None:
+        return "—"
+    minutes, secondes = divmod(int(secondes), 60)
+    heures, minutes = divmod(minutes, 60)
+    return f"{heures} h {minutes:02d} min" if heures else f"{minutes} min {secondes:02d} s"
+
+
+def format_metriques(metriques):
+    """Résumé d'une ligne des métriques d'un job : tokens, coût estimé, p95 des appels LLM et reprises."""
+
+    if not metriques or not metriques["appels_llm"]:
+        return None
+    morceaux = [
+        f"{metriques['tokens_entree'] + metriques['tokens_sortie']:,} tokens".replace(",", " "),
+        f"coût estimé : {metriques['cout_estime']:.4f} $",
+    ]
+    for nom_etape, libelle in (("generation", "génération"), ("juge", "juge")):
+        p95 = metriques["etapes"].get(nom_etape, {}).get("p95")
+        if p95 is not None:
+            morceaux.append(f"p95 {libelle} : ≤ {p95:g} s")
+    morceaux.append(f"{metriques['reprises']} reprise(s)")
+    return " · ".join(morceaux)
 
 
 def extract_object_id(prod):
@@ -148,11 +243,19 @@ st.markdown(
 with st.sidebar:
     st.header("Recherche de produit")
 
-    indexes_name = get_algolia_indexes_name()
+    indexes_name = get_indexes_name_cached()
     index_name = st.selectbox("Index Algolia", indexes_name)
 
+    if st.button("Rafraîchir les catégories"):
+        invalidate_categories()
+
+    # --- Arbre des catégories (toute la hiérarchie est lue en une requête) ---
+    arbre_categories = get_category_tree_cached(index_name) if index_name else CategoryTree({})
+    if index_name and complement_en_cours(index_name):
+        st.caption("Index volumineux : chargement de toutes les catégories en cours, la liste sera complétée.")
+
     # --- Catégorie niveau 0 ---
-    category_lvl0_name = get_categories_lvl0_name(index_name)
+    category_lvl0_name = arbre_categories.children(None)
     category_lvl0 = st.selectbox(
         "Catégorie niveau 0",
         [clean_category_name(c) for c in category_lvl0_name],
@@ -160,44 +263,45 @@ with st.sidebar:
 
     # --- Catégorie niveau 1 ---
     if category_lvl0:
-        cat_lvl0_full = get_full_category_path(category_lvl0, category_lvl0_name)
-        category_lvl1_name = filter_categories_by_parent(
-            get_categories_lvl1_name(index_name, cat_lvl0_full), cat_lvl0_full
-        )
+        cat_lvl0_full = arbre_categories.full_path(category_lvl0)
+        category_lvl1_name = arbre_categories.children(cat_lvl0_full)
         category_lvl1 = st.selectbox(
             "Catégorie niveau 1",
             [clean_category_name(c) for c in category_lvl1_name],
         )
     else:
-        category_lvl1, category_lvl1_name = None, []
+        category_lvl1, cat_lvl0_full = None, None
 
     # --- Catégorie niveau 2 ---
     if category_lvl1:
-        cat_lvl1_full = get_full_category_path(category_lvl1, category_lvl1_name)
-        category_lvl2_name = filter_categories_by_parent(
-            get_categories_lvl2_name(index_name, cat_lvl1_full), cat_lvl1_full
-        )
+        cat_lvl1_full = arbre_categories.full_path(category_lvl1, cat_lvl0_full)
+        category_lvl2_name = arbre_categories.children(cat_lvl1_full)
         category_lvl2 = st.selectbox(
             "Catégorie niveau 2",
             [clean_category_name(c) for c in category_lvl2_name],
         )
     else:
-        category_lvl2, category_lvl2_name = None, []
+        category_lvl2, cat_lvl1_full = None, None
 
     # --- Recherche directe par ID ---
     product_id = st.text_input("ID du produit", placeholder="Entrez l'ID du produit…")
 
+    # Seuls les attributs de la carte produit sont récupérés pour l'affichage ;
+    # la sélection est mémorisée pour relire, à l'enrichissement, les champs du prompt.
     if st.button("Lancer la recherche"):
         if product_id:
-            st.session_state.products = get_product_by_id(index_name, product_id)
+            st.session_state.products = get_product_by_id(index_name, product_id, ATTRIBUTS_AFFICHAGE)
+            st.session_state.selection_produits = (index_name, "produit", product_id)
         elif category_lvl2:
-            cat_lvl2_full = get_full_category_path(category_lvl2, category_lvl2_name)
-            st.session_state.products = get_products_by_category_lvl2(index_name, cat_lvl2_full)
+            cat_lvl2_full = arbre_categories.full_path(category_lvl2, cat_lvl1_full)
+            st.session_state.products = get_products_by_category_lvl2(index_name, cat_lvl2_full, ATTRIBUTS_AFFICHAGE)
+            st.session_state.selection_produits = (index_name, "categorie", cat_lvl2_full)
         else:
             st.warning("Veuillez sélectionner une catégorie ou entrer un ID de produit")
             st.session_state.products = None
+            st.session_state.selection_produits = None
 
-    # --- Import Excel/CSV de produits (affecte excel_products_df dans la session) ---
+    # --- Import Excel/CSV de produits (affecte fichier_importe dans la session) ---
     st.markdown("---")
     st.subheader("Importer un fichier Excel ou CSV de produits")
     excel_file_import = st.file_uploader(
@@ -206,15 +310,16 @@ with st.sidebar:
         key="excel_import_produits",
     )
     if excel_file_import is not None:
-        try:
-            if excel_file_import.name.lower().endswith(".csv"):
-                df_excel = pd.read_csv(excel_file_import)
-            else:
-                df_excel = pd.read_excel(excel_file_import)
-            st.session_state.excel_products_df = df_excel
-            st.success(f"{len(df_excel)} ligne(s) importée(s).")
-        except Exception as e:
-            st.error(f"Erreur lors de la lecture du fichier : {e}")
+        # Le fichier n'est converti qu'une fois : les reruns réutilisent l'import existant
+        if st.session_state.get("fichier_importe_id") != excel_file_import.file_id:
+            try:
+                with st.spinner("Import du fichier…"):
+                    st.session_state.fichier_importe = importer_fichier(excel_file_import)
+                st.session_state.fichier_importe_id = excel_file_import.file_id
+            except Exception as e:
+                st.error(f"Erreur lors de la lecture du fichier : {e}")
+        if "fichier_importe" in st.session_state:
+            st.success(f"{len(st.session_state.fichier_importe)} ligne(s) importée(s).")
 
 # -------------------------------------------------
 # Colonnes principales (produits & IA)
@@ -250,15 +355,12 @@ with col_prod:
         st.divider()
 
     # Aperçu des produits importés via Excel (si présent)
-    if hasattr(st.session_state, "excel_products_df"):
+    if "fichier_importe" in st.session_state:
         st.subheader("Produits importés depuis Excel")
-        df_excel = st.session_state.excel_products_df
-        for idx, row in df_excel.iterrows():
-            champs = list(row.index)
-            st.markdown(f"**Produit {idx + 1}**")
-            for ch in champs[:3]:
-                st.write(f"{ch}: {row[ch]}")
-            st.divider()
+        fichier = st.session_state.fichier_importe
+        nb_pages = max(1, -(-len(fichier) // TAILLE_PAGE_APERCU))
+        page = st.number_input(f"Page (sur {nb_pages})", min_value=1, max_value=nb_pages, value=1) - 1
+        st.dataframe(fichier.page(page, TAILLE_PAGE_APERCU), use_container_width=True)
 
     # Produits issus de la recherche Algolia
     if st.session_state.products is not None:
@@ -268,7 +370,7 @@ with col_prod:
                 show_product_card(p)
         else:
             show_product_card(st.session_state.products)
-    elif not hasattr(st.session_state, "excel_products_df"):
+    elif "fichier_importe" not in st.session_state:
         st.info("Aucun produit sélectionné ou importé.")
 
 # --------- Colonne de droite : assistant IA ---------
@@ -286,21 +388,12 @@ with col_ia:
 
         if create_click:
             # --- Cas 1 : Excel importé -------------------------------------
-            if new_field and hasattr(st.session_state, "excel_products_df"):
-                df_excel = st.session_state.excel_products_df
-                if new_field not in df_excel.columns:
-                    df_excel[new_field] = default_value
-                    # On stocke le DataFrame enrichi dans une variable de session dédiée
-                    st.session_state.excel_products_df_enriched = df_excel.copy()
-                    st.session_state.excel_products_df = df_excel
-
-                    # Export pour téléchargement
-                    tmp_output = io.BytesIO()
-                    df_excel.to_excel(tmp_output, index=False, engine="xlsxwriter")
-                    tmp_output.seek(0)
-
+            if new_field and "fichier_importe" in st.session_state:
+                fichier = st.session_state.fichier_importe
+                if fichier.ajouter_colonne(new_field, default_value):
                     st.success(f"✅ Le champ '{new_field}' a été ajouté au fichier importé.")
-                    st.session_state.tmp_excel_enrichi = tmp_output
+                    # Le fichier (avec le nouveau champ) devient téléchargeable
+                    st.session_state.export_disponible = True
                 else:
                     st.warning(f"⚠️ Le champ '{new_field}' existe déjà dans le fichier importé.")
 
@@ -341,16 +434,41 @@ with col_ia:
 
     with st.form("form_enrichissement"):
         # --- Détermination des champs disponibles ------------------------
-        # Utiliser le DataFrame enrichi s'il existe, sinon celui de base
-        if hasattr(st.session_state, "excel_products_df_enriched"):
-            all_fields = list(st.session_state.excel_products_df_enriched.columns)
-        elif hasattr(st.session_state, "excel_products_df"):
-            all_fields = list(st.session_state.excel_products_df.columns)
+        # Colonnes du fichier importé (y compris les champs ajoutés), sinon champs Algolia
+        # (schéma de l'index : construit en arrière-plan et enregistré localement)
+        schema = None
+        if "fichier_importe" in st.session_state:
+            all_fields = st.session_state.fichier_importe.colonnes
         else:
-            available_fields = get_algolia_fields(index_name) if index_name else []
+            schema = get_schema(index_name) if index_name else None
+            available_fields = schema.champs() if schema is not None else []
             all_fields = sorted(set(available_fields + list(st.session_state.custom_fields)))
 
-        target_field = st.selectbox("Champ à enrichir", options=all_fields)
+        def libelle_champ(champ):
+            if schema is None or champ not in schema:
+                return champ
+            return f"{champ} ({schema.taux_remplissage(champ):.0%} renseigné)"
+
+        target_field = st.selectbox("Champ à enrichir", options=all_fields, format_func=libelle_champ)
+        if index_name and "fichier_importe" not in st.session_state:
+            if construction_en_cours(index_name):
+                nb_analyses = schema.nb_produits if schema is not None else 0
+                st.caption(f"Analyse des champs de l'index en cours ({nb_analyses} produit(s) parcouru(s))…")
+            if schema is not None:
+                with st.expander("Champs de l'index"):
+                    st.dataframe(
+                        [
+                            {
+                                "Champ": ligne["champ"],
+                                "Type": ligne["types"],
+                                "Renseigné": f"{ligne['taux_remplissage']:.0%}",
+                                "Exemples": " | ".join(ligne["exemples"]),
+                            }
+                            for ligne in schema.couverture()
+                        ],
+                        use_container_width=True,
+                        hide_index=True,
+                    )
 
         instructions_lvl0 = st.selectbox(
             "Instruction catégorie 0",
@@ -358,8 +476,8 @@ with col_ia:
         )
 
         # Index de destination (uniquement si pas d'Excel importé)
-        if not hasattr(st.session_state, "excel_products_df"):
-            target_index = st.selectbox("Index de destination", options=get_algolia_indexes_name())
+        if "fichier_importe" not in st.session_state:
+            target_index = st.selectbox("Index de destination", options=get_indexes_name_cached())
         else:
             target_index = index_name  # pas utilisé mais requis dans l'appel de l'agent
 
@@ -374,59 +492,129 @@ with col_ia:
         st.markdown("**Prompt**")
         source_fields = st.text_area("Prompt", "")
 
+        utiliser_cache = st.checkbox(
+            "Utiliser le cache des réponses LLM",
+            value=True,
+            help="Réutilise la réponse d'un prompt identique déjà envoyé (doublons, relances). "
+                 "Décoché, les nouvelles réponses sont tout de même enregistrées.",
+        )
+
+        taille_groupe = st.number_input(
+            "Produits par requête LLM",
+            min_value=1,
+            max_value=50,
+            value=1,
+            help="Regroupe plusieurs produits dans une même requête (réponse JSON par objectID).",
+        )
+
+        mode_juge = st.selectbox(
+            "Politique du juge",
+            options=["toujours", "echantillon", "heuristique"],
+            help="« heuristique » : le juge n'est appelé que si la génération est vide, hors longueur ou contient une expression interdite. "
+                 "« echantillon » : en plus, une part aléatoire des autres générations.",
+        )
+        taux_echantillon = st.slider("Part échantillonnée (mode echantillon)", 0, 100, 10, step=5) / 100
+        with st.expander("Contrôles des modes echantillon et heuristique"):
+            longueur_min = st.number_input("Longueur minimale (caractères)", min_value=0, value=1)
+            longueur_max = st.number_input("Longueur maximale (caractères, 0 = aucune)", min_value=0, value=0)
+            format_attendu = st.text_input(
+                "Format attendu (expression régulière, optionnel)",
+                help="La génération entière doit respecter ce format, sinon elle est jugée.",
+            )
+            expressions_interdites = st.text_area(
+                "Expressions interdites (une par ligne)",
+                "\n".join(EXPRESSIONS_INTERDITES_DEFAUT),
+            )
+
+        mode_execution = st.radio(
+            "Mode d'exécution",
+            options=["Temps réel", "API Batch OpenAI"],
+            horizontal=True,
+            help="L'API Batch est moins chère pour les gros volumes mais peut prendre jusqu'à 24 h (produits Algolia uniquement).",
+        )
+
+        reprendre_job = st.checkbox(
+            "Reprendre le job interrompu",
+            value=True,
+            help="Si un job identique (index, champ, prompt, instructions, modèle, fichier de connaissance, "
+                 "sélection) a été interrompu, les produits déjà écrits sont ignorés et les valeurs déjà "
+                 "générées sont réutilisées. Un job terminé est toujours relancé en entier.",
+        )
+
+        ignorer_inchanges = st.checkbox(
+            "Ignorer les produits inchangés",
+            value=True,
+            help="Un produit déjà enrichi dont les champs du prompt et les instructions n'ont pas changé "
+                 "depuis n'est pas régénéré (index Algolia uniquement).",
+        )
+
+        simulation = st.checkbox(
+            "Simulation (aucune écriture dans Algolia)",
+            value=False,
+            help="Génère et juge les valeurs sans les écrire : un rapport compare valeurs actuelles et nouvelles, "
+                 "puis seules les valeurs modifiées sont envoyées lors de la validation.",
+        )
+
         envoyer = st.form_submit_button("Enrichir")
 
         # ------------------ Traitement de l'enrichissement --------------
         if envoyer and target_field and source_fields:
-            # On supprime l'ancien buffer de téléchargement avant de lancer l'enrichissement
-            if hasattr(st.session_state, "tmp_excel_enrichi"):
-                del st.session_state.tmp_excel_enrichi
-
-            # Récupération des instructions système & juge
-            instruction_systeme = get_instruction_by_nom(instructions_lvl0)
-            instruction_juge = get_instruction_juge_by_nom(instructions_lvl0)
-
-            # Récupération des produits à enrichir
-            if hasattr(st.session_state, "excel_products_df_enriched"):
-                df_excel = st.session_state.excel_products_df_enriched
-            elif hasattr(st.session_state, "excel_products_df"):
-                df_excel = st.session_state.excel_products_df
-            else:
-                df_excel = None
-            if df_excel is not None:
-                produits = df_excel.to_dict(orient="records")
+            # On masque l'ancien téléchargement avant de lancer l'enrichissement
+            st.session_state.export_disponible = False
+
+            # Récupération des instructions système & juge (une seule ligne lue, via le cache)
+            instruction = get_instruction_complete_by_nom(instructions_lvl0) or {}
+            instruction_systeme = instruction.get("Instruction")
+            instruction_juge = instruction.get("Instruction_juge")
+
+            # Récupération des produits à enrichir : seuls les champs du prompt et le champ cible
+            # sont lus (colonnes du fichier importé, attributs Algolia de la sélection)
+            fichier = st.session_state.get("fichier_importe")
+            champs_prompt = extraire_champs_sources(source_fields)
+            selection = st.session_state.get("selection_produits")
+            if fichier is not None:
+                produits = fichier.produits(fichier.colonnes_utiles(champs_prompt | {target_field}))
+            elif selection is not None and st.session_state.products is not None:
+                index_selection, type_selection, valeur_selection = selection
+                projection = attributs_projection(sorted(champs_prompt), target_field)
+                if type_selection == "produit":
+                    produits = [p for p in [get_product_by_id(index_selection, valeur_selection, projection)] if p]
+                else:
+                    # La catégorie est relue en flux par le moteur (pages browse), sans être chargée en liste
+                    produits = iter_products_by_category(index_selection, valeur_selection, attributes_to_retrieve=projection)
             elif isinstance(st.session_state.products, list):
                 produits = st.session_state.products
             elif st.session_state.products is not None:
                 produits = [st.session_state.products]
             else:
                 produits = []
+            # Une catégorie lue en flux compte autant de produits que la sélection affichée
+            nb_produits = len(produits) if isinstance(produits, list) else len(st.session_state.products)
 
             # Client OpenAI
-            openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            openai_client = get_openai_client()
+            prompt_cache = get_prompt_cache(bypass=not utiliser_cache)
 
             # Lecture du fichier de connaissance (optionnel)
+            # Le fichier est indexé (BM25) : seules les lignes pertinentes accompagnent chaque produit
             knowledge_data = None
             if excel_knowledge_file is not None:
                 try:
-                    if excel_knowledge_file.name.lower().endswith(".csv"):
-                        knowledge_data = pd.read_csv(excel_knowledge_file)
-                    else:
-                        knowledge_data = pd.read_excel(excel_knowledge_file)
+                    knowledge_data = charger_index_connaissance(excel_knowledge_file)
                 except Exception as exc:
                     st.error(f"Erreur lors de la lecture du fichier de connaissance : {exc}")
                     knowledge_data = None
 
             # Appel de l'agent (mode Excel ou Algolia)
             try:
-                if df_excel is not None:
-                    # Enrichissement du DataFrame Excel enrichi ou de base ----------
+                if fichier is not None:
+                    # Enrichissement du fichier importé ------------------------------
                     produits_excel = produits
                     nb = len(produits_excel)
                     progress_bar = st.progress(0)
-                    def update_progress(value):
-                        progress_bar.progress(value)
-                    produits_enrichis = enrichir_champ_batch_excel(
+                    def update_progress(value, lignes_par_seconde):
+                        progress_bar.progress(min(value, 1.0), text=f"{round(value * nb)}/{nb} lignes · {lignes_par_seconde:.1f} lignes/s")
+                    produits_enrichis = enrichir_champ_batch_excel_parallele(
                         produits=produits_excel,
                         champ_cible=target_field,
                         prompt_user=source_fields,
@@ -434,37 +622,180 @@ with col_ia:
                         system_instruction=instruction_systeme,
                         judge_instruction=instruction_juge,
                         excel_knowledge=knowledge_data,
-                        progress_callback=update_progress
+                        progress_callback=update_progress,
+                        cache=prompt_cache,
+                        taille_groupe=taille_groupe
                     )
                     progress_bar.empty()
                     st.success(f"{nb} ligne(s) enrichie(s) dans le fichier ⚡️")
-                    # Générer le fichier Excel enrichi et bouton de téléchargement
-                    df_enrichi = pd.DataFrame(produits_enrichis)
-                    tmp_output = io.BytesIO()
-                    df_enrichi.to_excel(tmp_output, index=False, engine="xlsxwriter")
-                    tmp_output.seek(0)
-                    st.session_state.tmp_excel_enrichi = tmp_output
+                    # Les valeurs enrichies rejoignent le fichier importé (enrichissements successifs)
+                    fichier.remplacer_colonne(target_field, [prod.get(target_field, "") for prod in produits_enrichis])
+                    st.session_state.export_disponible = True
                 else:
                     # Enrichissement des produits Algolia ----------------------------
-                    nb = enrichir_champ_batch(
+                    try:
+                        politique_juge = JudgePolicy(
+                            mode=mode_juge,
+                            taux_echantillon=taux_echantillon,
+                            longueur_min=longueur_min,
+                            longueur_max=longueur_max or None,
+                            format_attendu=format_attendu.strip() or None,
+                            expressions_interdites=[e.strip() for e in expressions_interdites.splitlines() if e.strip()],
+                        )
+                    except re.error as e:
+                        st.error(f"Format attendu invalide : {e}")
+                        st.stop()
+                    parametres_agent = dict(
                         index_name=target_index,
                         produits=produits,
                         champ_cible=target_field,
                         prompt_user=source_fields,
                         openai_client=openai_client,
+                        model=MODELE_ENRICHISSEMENT,
                         system_instruction=instruction_systeme,
                         judge_instruction=instruction_juge,
-                        excel_knowledge=knowledge_data
+                        excel_knowledge=knowledge_data,
+                        cache=prompt_cache,
+                        politique_juge=politique_juge,
+                        ignorer_inchanges=ignorer_inchanges,
+                        simulation=simulation
                     )
-                    st.success(f"{nb} produit(s) enrichi(s) avec succès !")
+                    if mode_execution == "API Batch OpenAI":
+                        parametres_agent["mode"] = "batch"
+                    else:
+                        parametres_agent["taille_groupe"] = taille_groupe
+                    parametres_job = dict(
+                        index_name=target_index,
+                        champ_cible=target_field,
+                        prompt_user=source_fields,
+                        system_instruction=instruction_systeme,
+                        judge_instruction=instruction_juge,
+                        model=MODELE_ENRICHISSEMENT,
+                        connaissance=empreinte_fichier(excel_knowledge_file) if knowledge_data is not None else None,
+                        selection=selection or sorted(str(extract_object_id(p)) for p in produits),
+                        simulation=simulation,
+                    )
+                    # Seul un job interrompu est repris : un job terminé repart d'un nouveau journal
+                    journal = ouvrir_journal(parametres_job, reprendre=reprendre_job)
+                    deja_ecrits = journal.progression()["written"]
+                    if deja_ecrits:
+                        st.info(f"Reprise du job {journal.job_id} : {deja_ecrits} produit(s) déjà écrit(s) ignoré(s).")
+                    # Le job s'exécute en arrière-plan : le script rend la main immédiatement
+                    get_job_runner().soumettre(
+                        executer_enrichissement,
+                        journal,
+                        total=nb_produits,
+                        description=f"{target_index} · {target_field} ({nb_produits} produits)",
+                        **parametres_agent
+                    )
+                    st.success("Enrichissement lancé en arrière-plan, suivez sa progression ci-dessous.")
             except Exception as exc:
                 st.error(f"Erreur durant l'enrichissement : {exc}")
 
     # Affichage du bouton de téléchargement juste sous le formulaire d'enrichissement
-    if hasattr(st.session_state, "tmp_excel_enrichi"):
-        st.download_button(
-            "Télécharger le fichier enrichi",
-            data=st.session_state.tmp_excel_enrichi,
-            file_name="produits_enrichis.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    if st.session_state.get("export_disponible") and "fichier_importe" in st.session_state:
+        format_export = st.radio("Format du fichier enrichi", options=list(FORMATS_EXPORT), horizontal=True)
+        chemin_export = export_pret(st.session_state.fichier_importe, format_export)
+        if chemin_export is None and st.button("Préparer le fichier enrichi"):
+            with st.spinner("Écriture du fichier enrichi…"):
+                chemin_export = preparer_export(st.session_state.fichier_importe, format_export)
+        if chemin_export is not None:
+            # Le fichier n'est lu qu'au clic, et non à chaque rerun
+            st.download_button(
+                "Télécharger le fichier enrichi",
+                data=functools.partial(lire_export, chemin_export),
+                file_name=f"produits_enrichis.{format_export}",
+                mime=FORMATS_EXPORT[format_export],
+            )
+
+
+# -------------------------------------------------
+# Suivi des jobs d'enrichissement en arrière-plan
+# -------------------------------------------------
+
+def afficher_simulation(resume, job_id):
+    """Rapport de différences d'une simulation et validation des seules valeurs modifiées."""
+
+    cle_validation = f"simulation_validee_{job_id}"
+    st.caption(
+        f"Simulation : {resume['modifies']} valeur(s) modifiée(s), {resume['inchanges']} inchangée(s) "
+        f"sur {resume['total']}."
+    )
+    if st.toggle("Voir les différences", key=f"rapport_{job_id}"):
+        staging = StagingStore(resume["run_id"], resume["index_name"])
+        try:
+            rapport = staging.rapport(limite=TAILLE_RAPPORT_SIMULATION)
+        finally:
+            staging.close()
+        st.dataframe(
+            [
+                {
+                    "objectID": ligne["objectID"],
+                    "Valeur actuelle": ligne["ancienne"],
+                    "Nouvelle valeur": ligne["nouvelle"],
+                    "Modifiée": ligne["modifie"],
+                    "Statut": ligne["statut"],
+                }
+                for ligne in rapport["lignes"]
+            ],
+            use_container_width=True,
+            hide_index=True,
         )
+    if cle_validation in st.session_state:
+        st.success(f"✅ {st.session_state[cle_validation]} valeur(s) modifiée(s) écrite(s) dans {resume['index_name']}.")
+    elif resume["modifies"] and st.button(
+        f"Valider les {resume['modifies']} modification(s)", key=f"valider_{job_id}"
+    ):
+        staging = StagingStore(resume["run_id"], resume["index_name"])
+        try:
+            with st.spinner("Écriture des valeurs modifiées…"):
+                st.session_state[cle_validation] = staging.valider()
+        finally:
+            staging.close()
+        st.rerun(scope="fragment")
+
+
+@st.fragment(run_every=2)
+def afficher_jobs():
+    runner = get_job_runner()
+    jobs = runner.jobs()
+    if not jobs:
+        return
+    st.subheader("Jobs d'enrichissement")
+    for job in jobs:
+        with st.container(border=True):
+            st.markdown(f"**{job['description']}** — {job['statut'].replace('_', ' ')}")
+            st.progress(min(job["progression"], 1.0))
+            debit = f"{job['debit']:.1f} produits/s" if job["debit"] else "—"
+            st.caption(
+                f"{job['traites']}/{job['total']} traité(s), {job['ecrits']} écrit(s) · "
+                f"débit : {debit} · temps restant : {format_duree(job['eta'])}"
+            )
+            ligne_metriques = format_metriques(job["metriques"])
+            if ligne_metriques:
+                st.caption(ligne_metriques)
+            if job["statut"] == "termine":
+                resultat = job["resultat"]
+                if resultat.get("simulation"):
+                    st.success(f"Simulation terminée : {resultat['nb_enrichis']} valeur(s) générée(s), rien n'a été écrit.")
+                else:
+                    st.success(f"{resultat['nb_enrichis']} produit(s) enrichi(s) avec succès !")
+                if resultat.get("nb_inchanges"):
+                    st.caption(f"{resultat['nb_inchanges']} produit(s) inchangé(s) ignoré(s).")
+                if resultat.get("simulation"):
+                    afficher_simulation(resultat["simulation"], job["job_id"])
+                stats_juge = resultat["juge"]
+                if stats_juge and stats_juge["ignorees"]:
+                    motifs = ", ".join(f"{motif} : {nb}" for motif, nb in stats_juge["motifs"].items())
+                    st.caption(f"Juge : {stats_juge['jugees']} appel(s), {stats_juge['ignorees']} évité(s)."
+                               + (f" Signalements : {motifs}." if motifs else ""))
+            elif job["statut"] == "erreur":
+                st.error(f"Erreur durant l'enrichissement : {job['erreur']}")
+            if job["statut"] == "en_attente" and st.button("Annuler", key=f"annuler_{job['job_id']}"):
+                runner.annuler(job["job_id"])
+            elif job["statut"] in ("termine", "erreur", "annule") and st.button("Retirer", key=f"retirer_{job['job_id']}"):
+                runner.oublier(job["job_id"])
+
+
+if st.session_state.get("logged_in"):
+    afficher_jobs()
@@ -51,10 +51,19 @@ def check_password():
 check_password()
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from backend.SupaBase.main import get_all_instructions_categories_lvl0, update_instruction_category_lvl0, post_instruction_category_lvl0
+from backend.SupaBase.main import (
+    depot_instructions,
+    get_all_instructions_categories_lvl0,
+    update_instruction_category_lvl0,
+    post_instruction_category_lvl0,
+)
 
 st.title("🔧 Administration des instructions")
 
+# Les instructions sont servies depuis un cache ; on peut forcer la relecture (modifications faites ailleurs)
+if st.button("🔄 Recharger les instructions"):
+    depot_instructions.invalider()
+
 # Récupération des instructions
 categories = get_all_instructions_categories_lvl0()
 
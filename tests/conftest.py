@@ -0,0 +1,57 @@
+"""Fixtures communes : répertoire de données temporaire et client Algolia factice."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.GET.clients import close_algolia_clients, register_algolia_client
+from backend.agent.journal import ouvrir_journal
+from backend.agent.runner import executer_enrichissement
+from fakes import FakeAlgoliaClient
+
+INDEX = "produits"
+
+
+@pytest.fixture(autouse=True)
+def donnees(tmp_path, monkeypatch):
+    """Caches, journaux, empreintes et staging dans un répertoire propre à chaque test."""
+
+    monkeypatch.setenv("ENRICHISSEMENT_DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def algolia():
+    """Client Algolia factice (10 produits) enregistré à la place du client réel."""
+
+    client = FakeAlgoliaClient({
+        INDEX: {str(i): {"objectID": str(i), "name": f"produit {i}"} for i in range(10)}
+    })
+    register_algolia_client(client)
+    yield client
+    close_algolia_clients()
+
+
+def produits(client, index_name=INDEX):
+    """Copie des produits d'un index du client factice."""
+
+    return [dict(obj) for obj in client.objets[index_name].values()]
+
+
+def lancer(algolia, openai_client, parametres=None, reprendre=True, terminer=True, **kwargs):
+    """Exécute un job comme l'interface : journal ouvert pour ces paramètres puis `executer_enrichissement`."""
+
+    journal = ouvrir_journal(parametres or {"index_name": INDEX}, reprendre=reprendre)
+    try:
+        resultat = executer_enrichissement(
+            INDEX, journal=journal, produits=kwargs.pop("produits", None) or produits(algolia),
+            champ_cible="description", prompt_user="Décris @name", openai_client=openai_client, **kwargs
+        )
+        if terminer:
+            journal.terminer()
+    finally:
+        journal.close()
+    return resultat
@@ -0,0 +1,321 @@
+"""Doublures locales d'OpenAI et d'Algolia pour exécuter l'agent hors ligne.
+
+Elles reproduisent uniquement la surface d'API utilisée par le backend et
+enregistrent les appels reçus, ce qui permet de vérifier un enrichissement
+sans réseau ni clé d'API.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+def _reponse_chat(contenu, prompt_tokens=0, completion_tokens=0):
+    """Construit un objet ayant la forme d'une réponse `chat.completions.create`."""
+
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=contenu))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+def _repondre_prompt(prompt):
+    if "réponds uniquement par «OK»" in prompt:
+        return "OK"
+    return f"valeur générée pour : {prompt[:50]}"
+
+
+def repondre_par_defaut(model, messages):
+    """
+    Réponse par défaut : le juge valide, la génération renvoie un texte dérivé du prompt.
+    Les requêtes groupées (`### Produit <id>`) reçoivent un objet JSON indexé par identifiant.
+    """
+    prompt = messages[-1]["content"]
+    blocs = re.findall(r"^### Produit (\S+)\n(.*?)(?=\n\n### Produit |\Z)", prompt, flags=re.S | re.M)
+    if blocs:
+        return json.dumps({identifiant: _repondre_prompt(contenu) for identifiant, contenu in blocs}, ensure_ascii=False)
+    return _repondre_prompt(prompt)
+
+
+class ErreurAPIFactice(Exception):
+    """Erreur ayant la forme d'une `openai.APIStatusError` : code HTTP et en-têtes de la réponse."""
+
+    def __init__(self, status_code, entetes=None):
+        super().__init__(f"Erreur HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=dict(entetes or {}))
+
+
+class _FakeRawCompletions:
+    """Équivalent de `chat.completions.with_raw_response` : la réponse porte les en-têtes `x-ratelimit-*`."""
+
+    def __init__(self, parent):
+        self._parent = parent
+
+    def create(self, model, messages, **kwargs):
+        response = self._parent._repondre(model, messages, kwargs)
+        entetes = self._parent.entetes
+        return SimpleNamespace(headers=entetes() if callable(entetes) else dict(entetes), parse=lambda: response)
+
+
+class _FakeCompletions:
+    def __init__(self, parent):
+        self._parent = parent
+        if parent.entetes is not None:
+            self.with_raw_response = _FakeRawCompletions(parent)
+
+    def create(self, model, messages, **kwargs):
+        return self._parent._repondre(model, messages, kwargs)
+
+
+class _FakeAsyncCompletions:
+    def __init__(self, parent):
+        self._parent = parent
+
+    async def create(self, model, messages, **kwargs):
+        if self._parent.latence:
+            await asyncio.sleep(self._parent.latence)
+        return self._parent._repondre(model, messages, kwargs, attendre=False)
+
+
+class _FakeFiles:
+    def __init__(self, parent):
+        self._parent = parent
+        self._fichiers = {}
+
+    def create(self, file, purpose, **kwargs):
+        contenu = file.read()
+        file_id = f"file-{len(self._fichiers) + 1}"
+        self._fichiers[file_id] = contenu.decode("utf-8") if isinstance(contenu, bytes) else contenu
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def content(self, file_id, **kwargs):
+        return SimpleNamespace(text=self._fichiers[file_id])
+
+
+class _FakeBatches:
+    """Endpoint Batch factice : le batch passe à "completed" après `nb_polls` interrogations."""
+
+    def __init__(self, parent, nb_polls=1):
+        self._parent = parent
+        self.nb_polls = nb_polls
+        self._batches = {}
+
+    def create(self, input_file_id, endpoint, completion_window, **kwargs):
+        batch_id = f"batch-{len(self._batches) + 1}"
+        self._batches[batch_id] = {"input_file_id": input_file_id, "polls": 0, "output_file_id": None}
+        return SimpleNamespace(id=batch_id, status="validating", output_file_id=None)
+
+    def retrieve(self, batch_id, **kwargs):
+        batch = self._batches[batch_id]
+        batch["polls"] += 1
+        if batch["polls"] < self.nb_polls:
+            return SimpleNamespace(id=batch_id, status="in_progress", output_file_id=None)
+        if batch["output_file_id"] is None:
+            batch["output_file_id"] = self._executer(batch["input_file_id"])
+        return SimpleNamespace(id=batch_id, status="completed", output_file_id=batch["output_file_id"])
+
+    def _executer(self, input_file_id):
+        fichiers = self._parent.files
+        lignes = []
+        for ligne in fichiers.content(input_file_id).text.splitlines():
+            requete = json.loads(ligne)
+            body = requete["body"]
+            try:
+                reponse = self._parent._repondre(body["model"], body["messages"], {}, attendre=False)
+            except Exception as e:
+                # Requête en échec : ligne d'erreur dans la sortie, comme l'API Batch
+                lignes.append(json.dumps({"custom_id": requete["custom_id"], "response": None, "error": {"message": str(e)}}))
+                continue
+            lignes.append(json.dumps({
+                "custom_id": requete["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "model": body["model"],
+                        "choices": [{"message": {"content": reponse.choices[0].message.content}}],
+                        "usage": vars(reponse.usage),
+                    },
+                },
+                "error": None,
+            }, ensure_ascii=False))
+        output_file_id = f"file-{len(fichiers._fichiers) + 1}"
+        fichiers._fichiers[output_file_id] = "\n".join(lignes)
+        return output_file_id
+
+
+class FakeOpenAI:
+    """
+    Client OpenAI synchrone factice (chat completions, fichiers et batchs).
+    Args:
+        repondre (callable, optionnel): Fonction `(model, messages) -> str` produisant le contenu.
+        latence (float): Délai simulé par appel, en secondes.
+        nb_polls_batch (int): Nombre d'interrogations avant qu'un batch soit terminé.
+        entetes (dict | callable, optionnel): En-têtes des réponses réussies (ou fonction les produisant),
+            exposés via `chat.completions.with_raw_response` comme le SDK.
+    """
+
+    def __init__(self, repondre=None, latence=0.0, nb_polls_batch=1, entetes=None):
+        self.repondre = repondre or repondre_par_defaut
+        self.latence = latence
+        self.entetes = entetes
+        self.appels = []
+        self._verrou = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self.files = _FakeFiles(self)
+        self.batches = _FakeBatches(self, nb_polls_batch)
+
+    def _repondre(self, model, messages, kwargs, attendre=True):
+        if attendre and self.latence:
+            time.sleep(self.latence)
+        with self._verrou:
+            self.appels.append({"model": model, "messages": messages, **kwargs})
+        contenu = self.repondre(model, messages)
+        nb_tokens_prompt = sum(len(m["content"].split()) for m in messages)
+        return _reponse_chat(contenu, nb_tokens_prompt, len(contenu.split()))
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """Variante asynchrone de `FakeOpenAI` (même interface que `openai.AsyncOpenAI`)."""
+
+    def __init__(self, repondre=None, latence=0.0):
+        super().__init__(repondre, latence)
+        self.chat = SimpleNamespace(completions=_FakeAsyncCompletions(self))
+
+
+class FakeAlgoliaClient:
+    """
+    Client Algolia factice stockant les objets en mémoire, index par index.
+    Args:
+        objets (dict, optionnel): `{index_name: {objectID: dict}}` initial.
+    """
+
+    def __init__(self, objets=None):
+        self.objets = objets or {}
+        self.appels = []
+        self._verrou = threading.Lock()
+        self._task_id = 0
+        self._curseurs = {}
+        # Date `updatedAt` de chaque index, avancée à chaque écriture
+        self.maj_le = {}
+
+    def _nouvelle_tache(self, nom_appel, index_name):
+        with self._verrou:
+            self._task_id += 1
+            self.appels.append((nom_appel, index_name))
+            self.maj_le[index_name] = f"maj-{self._task_id}"
+            return self._task_id
+
+    def list_indices(self, **kwargs):
+        with self._verrou:
+            self.appels.append(("list_indices", None))
+            return SimpleNamespace(items=[
+                SimpleNamespace(name=index_name, entries=len(objets), updated_at=self.maj_le.get(index_name, "maj-0"))
+                for index_name, objets in self.objets.items()
+            ])
+
+    def partial_update_object(self, index_name, object_id, attributes_to_update, create_if_not_exists=True, **kwargs):
+        task_id = self._nouvelle_tache("partial_update_object", index_name)
+        with self._verrou:
+            index = self.objets.setdefault(index_name, {})
+            if object_id in index or create_if_not_exists:
+                index.setdefault(object_id, {"objectID": object_id}).update(attributes_to_update)
+        return {"taskID": task_id, "objectID": object_id}
+
+    def partial_update_objects(self, index_name, objects, create_if_not_exists=False, wait_for_tasks=False, **kwargs):
+        task_id = self._nouvelle_tache("partial_update_objects", index_name)
+        with self._verrou:
+            index = self.objets.setdefault(index_name, {})
+            for obj in objects:
+                object_id = obj["objectID"]
+                if object_id in index or create_if_not_exists:
+                    index.setdefault(object_id, {"objectID": object_id}).update(obj)
+        return [SimpleNamespace(task_id=task_id, object_ids=[obj["objectID"] for obj in objects])]
+
+    def wait_for_task(self, index_name, task_id, **kwargs):
+        with self._verrou:
+            self.appels.append(("wait_for_task", index_name))
+        return SimpleNamespace(status="published")
+
+    def _filtrer(self, index_name, filters):
+        """Applique un filtre simple `attribut:"valeur"` (attribut pointé, valeur ou liste de valeurs)."""
+
+        objets = list(self.objets.get(index_name, {}).values())
+        if not filters:
+            return objets
+        attribut, valeur = re.match(r'^\s*([\w.]+):"?(.*?)"?\s*$', filters).groups()
+        valeur = valeur.replace('\\"', '"')
+        resultat = []
+        for obj in objets:
+            courant = obj
+            for cle in attribut.split("."):
+                courant = courant.get(cle) if isinstance(courant, dict) else None
+            if courant == valeur or (isinstance(courant, list) and valeur in courant):
+                resultat.append(obj)
+        return resultat
+
+    def _projeter(self, obj, attributs):
+        if not attributs or "*" in attributs:
+            return dict(obj)
+        return {cle: obj[cle] for cle in attributs if cle in obj} | {"objectID": obj["objectID"]}
+
+    def get_objects(self, get_objects_params, **kwargs):
+        """Lecture d'objets par objectID (None pour un objet absent), avec projection."""
+
+        requetes = get_objects_params["requests"]
+        with self._verrou:
+            self.appels.append(("get_objects", requetes[0]["indexName"] if requetes else None))
+            resultats = []
+            for requete in requetes:
+                obj = self.objets.get(requete["indexName"], {}).get(requete["objectID"])
+                resultats.append(None if obj is None else self._projeter(obj, requete.get("attributesToRetrieve")))
+        return SimpleNamespace(results=resultats)
+
+    def browse(self, index_name, browse_params=None, **kwargs):
+        """Pagination par curseur : le curseur encode un numéro de parcours et l'offset de la page suivante."""
+
+        params = dict(browse_params or {})
+        with self._verrou:
+            self.appels.append(("browse", index_name))
+        if "cursor" in params:
+            params = {**self._curseurs[params["cursor"]], "cursor": params["cursor"]}
+        debut = int(params["cursor"].split(":")[1]) if "cursor" in params else 0
+        taille = params.get("hitsPerPage", 1000)
+        objets = self._filtrer(index_name, params.get("filters"))
+        page = objets[debut:debut + taille]
+        cursor = None
+        if debut + taille < len(objets):
+            cursor = f"{len(self._curseurs)}:{debut + taille}"
+            self._curseurs[cursor] = {k: v for k, v in params.items() if k != "cursor"}
+        hits = [self._projeter(obj, params.get("attributesToRetrieve")) for obj in page]
+        return SimpleNamespace(hits=hits, cursor=cursor)
+
+    def search_single_index(self, index_name, search_params=None, **kwargs):
+        """Recherche à requête vide : filtre, facettes (comptages) et pagination simple."""
+
+        params = dict(search_params or {})
+        with self._verrou:
+            self.appels.append(("search_single_index", index_name))
+        objets = self._filtrer(index_name, params.get("filters"))
+        facets = {}
+        for facette in params.get("facets", []):
+            comptes = {}
+            for obj in objets:
+                valeur = obj
+                for cle in facette.split("."):
+                    valeur = valeur.get(cle) if isinstance(valeur, dict) else None
+                for v in (valeur if isinstance(valeur, list) else [valeur]):
+                    if v is not None:
+                        comptes[v] = comptes.get(v, 0) + 1
+            tries = sorted(comptes.items(), key=lambda kv: -kv[1])[:params.get("maxValuesPerFacet", 100)]
+            facets[facette] = dict(tries)
+        hits = objets[:params.get("hitsPerPage", 20)]
+        hits = [self._projeter(obj, params.get("attributesToRetrieve")) for obj in hits]
+        return SimpleNamespace(hits=hits, facets=facets, nb_hits=len(objets))
@@ -0,0 +1,39 @@
+from backend.POST.buffer import WriteBackBuffer
+
+from conftest import INDEX
+
+
+class ClientEnPanne:
+    def partial_update_objects(self, **kwargs):
+        raise ConnectionError("Algolia indisponible")
+
+
+def test_lot_envoye_en_une_requete(algolia):
+    ecrits = []
+    with WriteBackBuffer(INDEX, taille_lot=100, delai_max=None, apres_ecriture=ecrits.extend) as tampon:
+        for i in range(5):
+            tampon.add(str(i), "couleur", f"rouge {i}")
+            tampon.add(str(i), "matiere", "coton")
+    assert tampon.nb_ecrits == 5
+    assert tampon.nb_requetes == 1
+    assert sorted(ecrits) == [str(i) for i in range(5)]
+    assert algolia.objets[INDEX]["3"] == {"objectID": "3", "name": "produit 3", "couleur": "rouge 3", "matiere": "coton"}
+
+
+def test_lot_vide_des_que_la_taille_est_atteinte(algolia):
+    tampon = WriteBackBuffer(INDEX, taille_lot=4, delai_max=None)
+    for i in range(10):
+        tampon.add(str(i), "couleur", "bleu")
+    assert tampon.nb_ecrits == 8 and len(tampon) == 2
+    assert tampon.close() == 10
+
+
+def test_echec_du_lot(algolia):
+    ecrits = []
+    tampon = WriteBackBuffer(INDEX, delai_max=None, client=ClientEnPanne(), apres_ecriture=ecrits.extend)
+    tampon.add("1", "couleur", "vert")
+    tampon.add("2", "couleur", "vert")
+    assert tampon.flush() == 0
+    assert tampon.echecs == ["1", "2"]
+    assert tampon.nb_ecrits == 0
+    assert ecrits == []
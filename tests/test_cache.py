@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from backend.agent import cache as module_cache
+from backend.agent.cache import PromptCache, cle_prompt
+
+
+@pytest.fixture
+def horloge(monkeypatch):
+    """Heure simulée pour le cache (`horloge.t`, en secondes)."""
+
+    class Horloge:
+        t = 1000.0
+
+    monkeypatch.setattr(module_cache.time, "time", lambda: Horloge.t)
+    return Horloge
+
+
+def lu_le(cache, prompt):
+    connexion = sqlite3.connect(cache.chemin)
+    try:
+        return connexion.execute("SELECT lu_le FROM reponses WHERE cle = ?", (cle_prompt("m", "sys", prompt),)).fetchone()[0]
+    finally:
+        connexion.close()
+
+
+def test_expiration(donnees, horloge):
+    cache = PromptCache(ttl=60)
+    cache.set("m", "sys", "p", "r")
+    horloge.t += 59
+    assert cache.get("m", "sys", "p") == "r"
+    horloge.t += 2
+    assert cache.get("m", "sys", "p") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.purge()
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_eviction_des_moins_recemment_lues(donnees, horloge):
+    cache = PromptCache(ttl=None, max_entries=2)
+    for prompt in ("a", "b", "c"):
+        horloge.t += 1
+        cache.set("m", "sys", prompt, prompt.upper())
+    horloge.t += 1
+    # Lecture de "a" en attente d'enregistrement : elle compte quand même pour l'éviction
+    assert cache.get("m", "sys", "a") == "A"
+    cache.purge()
+    assert cache.get("m", "sys", "b") is None
+    assert (cache.get("m", "sys", "a"), cache.get("m", "sys", "c")) == ("A", "C")
+    cache.close()
+
+
+def test_contournement(donnees):
+    contourne = PromptCache(bypass=True)
+    contourne.set("m", "sys", "p", "r")
+    assert contourne.get("m", "sys", "p") is None
+    assert (contourne.hits, contourne.misses) == (0, 0)
+    contourne.close()
+
+    cache = PromptCache()
+    assert cache.get("m", "sys", "p") == "r"
+    cache.close()
+
+
+def test_dates_de_lecture_enregistrees_par_lots(donnees, horloge, monkeypatch):
+    monkeypatch.setattr(module_cache, "TAILLE_LOT_LECTURES", 3)
+    cache = PromptCache()
+    for prompt in ("a", "b", "c"):
+        cache.set("m", "sys", prompt, prompt.upper())
+    cree_le = horloge.t
+
+    horloge.t += 10
+    cache.get("m", "sys", "a")
+    cache.get("m", "sys", "b")
+    assert lu_le(cache, "a") == cree_le
+    cache.get("m", "sys", "c")
+    assert lu_le(cache, "a") == lu_le(cache, "c") == horloge.t
+
+    horloge.t += 10
+    cache.get("m", "sys", "a")
+    cache.close()
+    assert lu_le(cache, "a") == horloge.t
@@ -0,0 +1,73 @@
+import pytest
+
+from backend.GET.cache import get_categories_cached, invalidate_categories
+from backend.GET.categories import fetch_category_facets
+from backend.POST.buffer import noter_ecriture_index
+
+from conftest import INDEX
+
+
+def produit(i, lvl0, lvl1=None):
+    categories = {"lvl0": lvl0}
+    if lvl1:
+        categories["lvl1"] = f"{lvl0} > {lvl1}"
+    return {"objectID": str(i), "name": f"produit {i}", "categories": categories}
+
+
+@pytest.fixture
+def catalogue(algolia):
+    # 150 catégories de niveau 0 : au-delà des 100 valeurs de l'ancienne requête par niveau
+    objets = [produit(i, f"rayon {i:03}") for i in range(150)]
+    objets += [produit(150 + i, "rayon 000", f"sous-rayon {i}") for i in range(3)]
+    algolia.objets[INDEX] = {obj["objectID"]: obj for obj in objets}
+    invalidate_categories()
+    yield algolia
+    invalidate_categories()
+
+
+def test_niveaux_servis_par_l_arbre_sans_troncature(catalogue):
+    assert len(get_categories_cached(INDEX, 0)) == 150
+    assert get_categories_cached(INDEX, 1, "rayon 000 ") == [f"rayon 000 > sous-rayon {i}" for i in range(3)]
+    assert get_categories_cached(INDEX, 2, "rayon 000 > sous-rayon 1") == []
+    # Une seule requête de facettes pour tous les niveaux
+    assert [appel for appel, _ in catalogue.appels] == ["search_single_index"]
+
+
+def test_parent_d_un_autre_niveau(catalogue):
+    assert get_categories_cached(INDEX, 2, "rayon 000") == []
+    with pytest.raises(ValueError):
+        get_categories_cached(INDEX, 3)
+
+
+def test_complement_enregistre_jusqu_au_changement_de_l_index(catalogue):
+    def nb_parcours():
+        return [appel for appel, _ in catalogue.appels].count("browse")
+
+    # Facettes tronquées à 5 valeurs : l'index est parcouru une fois
+    assert len(fetch_category_facets(INDEX, max_values_per_facet=5)[0]) == 150
+    assert nb_parcours() == 1
+    # Index inchangé : les catégories complétées sont relues sans nouveau parcours
+    assert len(fetch_category_facets(INDEX, max_values_per_facet=5)[0]) == 150
+    assert nb_parcours() == 1
+
+    catalogue.maj_le[INDEX] = "modifié ailleurs"
+    fetch_category_facets(INDEX, max_values_per_facet=5)
+    assert nb_parcours() == 2
+
+
+def test_ecritures_de_l_application_hors_categories_sans_reparcours(catalogue):
+    def nb_parcours():
+        return [appel for appel, _ in catalogue.appels].count("browse")
+
+    fetch_category_facets(INDEX, max_values_per_facet=5)
+    ids = ["0", "1"]
+    catalogue.partial_update_objects(INDEX, [{"objectID": i, "description": "texte"} for i in ids])
+    noter_ecriture_index(INDEX, "description", ids)
+    assert len(fetch_category_facets(INDEX, max_values_per_facet=5)[0]) == 150
+    assert nb_parcours() == 1
+
+    # Une écriture dans les catégories invalide les listes complétées
+    catalogue.partial_update_objects(INDEX, [{"objectID": "0", "categories": {"lvl0": "rayon neuf"}}])
+    noter_ecriture_index(INDEX, "categories", ["0"])
+    assert "rayon neuf" in fetch_category_facets(INDEX, max_values_per_facet=5)[0]
+    assert nb_parcours() == 2
@@ -0,0 +1,46 @@
+import io
+import os
+
+import pytest
+
+from backend.agent import connaissance
+from backend.agent.connaissance import charger_index_connaissance
+
+CSV = (
+    "reference,matiere,entretien\n"
+    "T-01,coton bio,lavage 30 degrés\n"
+    "T-02,laine mérinos,lavage à la main\n"
+    "T-03,polyester recyclé,lavage 40 degrés\n"
+).encode("utf-8")
+
+
+@pytest.fixture(autouse=True)
+def cache_vide():
+    connaissance.cache_index.invalidate()
+
+
+def fichier_connaissance():
+    fichier = io.BytesIO(CSV)
+    fichier.name = "connaissance.csv"
+    return fichier
+
+
+def test_lignes_pertinentes_par_produit(donnees):
+    index = charger_index_connaissance(fichier_connaissance())
+    assert len(index) == 3
+    assert index.rechercher("Pull en laine merinos", k=1) == [1]
+    assert index.extrait("t-shirt coton", k=1) == "reference: T-01 | matiere: coton bio | entretien: lavage 30 degrés"
+    assert index.extrait("chaussures") == ""
+
+
+def test_index_enregistre_en_json(donnees):
+    index = charger_index_connaissance(fichier_connaissance())
+    fichiers = os.listdir(donnees / "connaissance")
+    assert len(fichiers) == 1 and fichiers[0].endswith(".json")
+
+    # Nouveau processus : l'index est relu depuis le JSON, avec les mêmes résultats
+    connaissance.cache_index.invalidate()
+    relu = charger_index_connaissance(fichier_connaissance())
+    assert relu is not index
+    for requete in ("laine", "lavage 40", "coton bio"):
+        assert relu.rechercher(requete) == index.rechercher(requete)
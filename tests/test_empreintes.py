@@ -0,0 +1,15 @@
+from fakes import FakeOpenAI
+from conftest import INDEX, lancer
+
+
+def test_produits_inchanges_ignores(algolia):
+    lancer(algolia, FakeOpenAI(), ignorer_inchanges=True)
+    openai_client = FakeOpenAI()
+    resultat = lancer(algolia, openai_client, ignorer_inchanges=True)
+    assert resultat["nb_inchanges"] == 10
+    assert openai_client.appels == []
+
+    algolia.objets[INDEX]["2"]["name"] = "produit 2 renommé"
+    resultat = lancer(algolia, openai_client, ignorer_inchanges=True)
+    assert resultat["nb_inchanges"] == 9
+    assert len(openai_client.appels) == 2
@@ -0,0 +1,25 @@
+from fakes import FakeOpenAI
+from conftest import lancer
+
+
+def test_job_termine_relance_en_entier(algolia):
+    lancer(algolia, FakeOpenAI())
+    openai_client = FakeOpenAI()
+    resultat = lancer(algolia, openai_client)
+    assert resultat["nb_enrichis"] == 10
+    assert len(openai_client.appels) == 20
+
+
+def test_job_interrompu_repris(algolia):
+    def repondre(model, messages):
+        prompt = messages[-1]["content"]
+        if "produit 7" in prompt and "réponds uniquement" not in prompt:
+            raise RuntimeError("coupure réseau")
+        return "OK" if "réponds uniquement" in prompt else "valeur"
+
+    # Premier passage interrompu : le job reste "en_cours", le produit 7 n'est pas écrit
+    lancer(algolia, FakeOpenAI(repondre=repondre), terminer=False)
+    openai_client = FakeOpenAI()
+    resultat = lancer(algolia, openai_client)
+    assert resultat["nb_enrichis"] == 1
+    assert len(openai_client.appels) == 2
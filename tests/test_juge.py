@@ -0,0 +1,64 @@
+import pytest
+
+from backend.agent.juge import JudgePolicy
+
+from fakes import FakeOpenAI
+from conftest import lancer
+
+
+def test_mode_toujours():
+    politique = JudgePolicy()
+    assert all(politique.doit_juger(valeur) for valeur in ("", "une description correcte"))
+    assert politique.stats.as_dict() == {"evaluees": 2, "jugees": 2, "ignorees": 0, "motifs": {}}
+
+
+@pytest.mark.parametrize("valeur, motifs", [
+    ("", ["vide"]),
+    ("abc", ["trop_courte"]),
+    ("x" * 50, ["trop_longue"]),
+    ("Rouge vif", ["format"]),
+    ("Désolé, je ne peux pas répondre", ["format", "expression_interdite"]),
+    ("rouge", []),
+])
+def test_heuristiques(valeur, motifs):
+    politique = JudgePolicy(mode="heuristique", longueur_min=4, longueur_max=40, format_attendu=r"[a-zé ]+")
+    assert politique.signaler(valeur) == motifs
+    assert politique.doit_juger(valeur, "1") == bool(motifs)
+
+
+def test_mode_heuristique_compte_les_motifs():
+    politique = JudgePolicy(mode="heuristique")
+    for valeur in ("", "En tant qu'IA, je ne peux pas", "une description", "  "):
+        politique.doit_juger(valeur)
+    assert politique.stats.as_dict() == {
+        "evaluees": 4, "jugees": 3, "ignorees": 1, "motifs": {"vide": 2, "expression_interdite": 1},
+    }
+
+
+def test_mode_echantillon():
+    cles = [str(i) for i in range(2000)]
+    assert not any(JudgePolicy(mode="echantillon", taux_echantillon=0).doit_juger("ok", cle) for cle in cles)
+    assert all(JudgePolicy(mode="echantillon", taux_echantillon=1).doit_juger("ok", cle) for cle in cles)
+
+    politique = JudgePolicy(mode="echantillon", taux_echantillon=0.25)
+    tirage = [politique.doit_juger("ok", cle) for cle in cles]
+    assert 400 < sum(tirage) < 600
+    # Tirage déterministe par objectID : la reprise d'un job juge les mêmes produits
+    assert tirage == [JudgePolicy(mode="echantillon", taux_echantillon=0.25).doit_juger("ok", cle) for cle in cles]
+    # Une génération signalée est toujours jugée
+    assert JudgePolicy(mode="echantillon", taux_echantillon=0).doit_juger("", "1")
+    assert politique.stats.jugees == sum(tirage)
+
+
+def test_moteur_ne_juge_que_les_generations_signalees(algolia):
+    def repondre(model, messages):
+        prompt = messages[-1]["content"]
+        if "réponds uniquement" in prompt:
+            return "OK"
+        return "Information insuffisante pour ce produit" if "produit 2" in prompt else "une description"
+
+    openai_client = FakeOpenAI(repondre=repondre)
+    resultat = lancer(algolia, openai_client, politique_juge=JudgePolicy(mode="heuristique"))
+    assert resultat["nb_enrichis"] == 10
+    assert len(openai_client.appels) == 11
+    assert resultat["juge"] == {"evaluees": 10, "jugees": 1, "ignorees": 9, "motifs": {"expression_interdite": 1}}
@@ -0,0 +1,49 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from backend.metriques import MetriquesRun, format_prometheus, servir_prometheus
+
+
+def run(run_id):
+    metriques = MetriquesRun(run_id)
+    metriques.observer("generation", 0.3)
+    metriques.erreur("juge")
+    metriques.tokens("gpt-4o-mini", "generation", 100, 20)
+    metriques.compter("reprises", 2)
+    return metriques
+
+
+def test_help_et_type_une_fois_par_famille():
+    texte = format_prometheus([run("a"), run("b")])
+    lignes = texte.splitlines()
+
+    for famille, type_metrique in (
+        ("enrichissement_etape_duree_secondes", "histogram"),
+        ("enrichissement_erreurs_total", "counter"),
+        ("enrichissement_tokens_total", "counter"),
+        ("enrichissement_reprises_total", "counter"),
+        ("enrichissement_cout_estime_dollars", "gauge"),
+    ):
+        assert lignes.count(f"# TYPE {famille} {type_metrique}") == 1
+        assert sum(ligne.startswith(f"# HELP {famille} ") for ligne in lignes) == 1
+        # Les séries des deux runs suivent l'en-tête de leur famille
+        debut = lignes.index(f"# TYPE {famille} {type_metrique}")
+        series = [ligne for ligne in lignes[debut + 1:] if ligne.startswith(famille)]
+        assert any('run="a"' in ligne for ligne in series) and any('run="b"' in ligne for ligne in series)
+    assert format_prometheus([]) == ""
+
+
+def test_serveur_local_par_defaut():
+    serveur = servir_prometheus(lambda: run("a").prometheus(), 0)
+    try:
+        hote, port = serveur.server_address
+        assert hote == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as reponse:
+            assert "# TYPE enrichissement_erreurs_total counter" in reponse.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/autre")
+    finally:
+        serveur.shutdown()
+        serveur.server_close()
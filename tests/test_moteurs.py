@@ -0,0 +1,48 @@
+import pytest
+
+from backend.POST.buffer import WriteBackBuffer
+from backend.agent.main import enrichir_champ_batch
+from backend.agent.moteur_async import enrichir_champ_batch_concurrent
+
+from fakes import FakeOpenAI
+from conftest import INDEX, lancer, produits
+
+
+def test_moteur_synchrone_ecrit_chaque_produit(algolia):
+    openai_client = FakeOpenAI()
+    nb = enrichir_champ_batch(INDEX, produits(algolia), "description", "Décris @name", openai_client)
+    assert nb == 10
+    assert len(openai_client.appels) == 20  # génération + juge
+    assert algolia.objets[INDEX]["4"]["description"].startswith("valeur générée pour")
+
+
+@pytest.mark.parametrize("taille_groupe", [1, 3])
+def test_moteur_concurrent_avec_tampon(algolia, taille_groupe):
+    openai_client = FakeOpenAI()
+    with WriteBackBuffer(INDEX, delai_max=None) as tampon:
+        nb = enrichir_champ_batch_concurrent(
+            INDEX, iter(produits(algolia)), "description", "Décris @name", openai_client,
+            tampon=tampon, taille_groupe=taille_groupe, concurrence=4,
+        )
+    assert nb == 10
+    assert all("description" in obj for obj in algolia.objets[INDEX].values())
+
+
+@pytest.mark.parametrize("mode", ["temps_reel", "batch"])
+def test_moteurs_du_runner_partagent_la_pipeline(algolia, mode):
+    def repondre(model, messages):
+        prompt = messages[-1]["content"]
+        if "réponds uniquement" in prompt:
+            # Le juge réécrit la valeur du produit 3 et valide les autres
+            return "valeur corrigée" if "produit 3" in prompt else "OK"
+        if "produit 5" in prompt:
+            raise RuntimeError("refus du modèle")
+        return "valeur"
+
+    kwargs = {"intervalle": 0} if mode == "batch" else {}
+    resultat = lancer(algolia, FakeOpenAI(repondre=repondre), {"index_name": INDEX, "mode": mode}, mode=mode, **kwargs)
+    assert resultat["nb_enrichis"] == 9
+    assert algolia.objets[INDEX]["3"]["description"] == "valeur corrigée"
+    assert algolia.objets[INDEX]["4"]["description"] == "valeur"
+    assert "description" not in algolia.objets[INDEX]["5"]
+    assert resultat["juge"] is None
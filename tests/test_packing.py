@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from backend.agent.packing import completions_groupees
+
+from fakes import FakeOpenAI
+
+PROMPTS = {"1": "Décris produit 1", "2": "Décris produit 2", "3": "Décris produit 3"}
+
+
+def groupee(messages):
+    return "### Produit" in messages[-1]["content"]
+
+
+@pytest.mark.parametrize("reponse_groupee, replis", [
+    ("pas du JSON", ["1", "2", "3"]),
+    (json.dumps(["valeur 1", "valeur 2", "valeur 3"]), ["1", "2", "3"]),
+    # Clé manquante, valeur vide et valeur non textuelle : seuls ces produits sont redemandés
+    (json.dumps({"1": "valeur 1", "2": "  ", "3": {"texte": "valeur 3"}}), ["2", "3"]),
+])
+def test_repli_produit_par_produit(reponse_groupee, replis):
+    def repondre(model, messages):
+        if groupee(messages):
+            return reponse_groupee
+        return "valeur " + messages[-1]["content"][-1]
+
+    openai_client = FakeOpenAI(repondre=repondre)
+    valeurs, erreurs = completions_groupees(openai_client, "m", "sys", PROMPTS)
+    assert valeurs == {"1": "valeur 1", "2": "valeur 2", "3": "valeur 3"}
+    assert erreurs == {}
+    unitaires = [appel["messages"][-1]["content"] for appel in openai_client.appels if not groupee(appel["messages"])]
+    assert unitaires == [PROMPTS[ident] for ident in replis]
+
+
+def test_requete_groupee_en_echec():
+    def repondre(model, messages):
+        if groupee(messages):
+            raise RuntimeError("délai dépassé")
+        if messages[-1]["content"].endswith("2"):
+            raise RuntimeError("refus du modèle")
+        return "ok"
+
+    valeurs, erreurs = completions_groupees(FakeOpenAI(repondre=repondre), "m", "sys", PROMPTS)
+    assert valeurs == {"1": "ok", "3": "ok"}
+    assert list(erreurs) == ["2"]
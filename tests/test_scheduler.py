@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+from backend.agent import scheduler as module_scheduler
+from backend.agent.scheduler import OpenAIScheduler, _duree_reset
+
+from fakes import ErreurAPIFactice, FakeOpenAI
+
+MESSAGES = [{"role": "user", "content": "Décris produit 1"}]
+
+
+@pytest.fixture
+def pauses(monkeypatch):
+    """Délais de reprise demandés par l'ordonnanceur (sans attente réelle)."""
+
+    delais = []
+    monkeypatch.setattr(module_scheduler.time, "sleep", delais.append)
+    return delais
+
+
+def entetes_quota(restant_requetes, restant_tokens=900_000, reset="1s"):
+    return {
+        "x-ratelimit-limit-requests": "1000",
+        "x-ratelimit-remaining-requests": str(restant_requetes),
+        "x-ratelimit-reset-requests": reset,
+        "x-ratelimit-limit-tokens": "1000000",
+        "x-ratelimit-remaining-tokens": str(restant_tokens),
+    }
+
+
+def reponses(*sequence):
+    """`repondre` qui lève ou retourne successivement les éléments de `sequence`."""
+
+    restantes = list(sequence)
+
+    def repondre(model, messages):
+        element = restantes.pop(0) if restantes else "ok"
+        if isinstance(element, Exception):
+            raise element
+        return element
+    return repondre
+
+
+def test_quota_appris_des_entetes():
+    restants = iter([900, 10])
+    scheduler = OpenAIScheduler(FakeOpenAI(entetes=lambda: entetes_quota(next(restants))))
+    scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    # Limite découverte : le budget est le restant annoncé, pas le seau vide de départ
+    assert scheduler._requetes.capacite == 1000
+    assert scheduler._requetes.disponible == pytest.approx(900, abs=1)
+    assert scheduler._tokens.disponible == pytest.approx(900_000, abs=100)
+
+    debut = time.monotonic()
+    scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert time.monotonic() - debut < 0.5
+    # Limite déjà connue : le restant annoncé plafonne le budget
+    assert scheduler._requetes.disponible == pytest.approx(10, abs=1)
+
+
+def test_quota_epuise_met_en_pause():
+    scheduler = OpenAIScheduler(FakeOpenAI(entetes=entetes_quota(0, reset="6m0s")))
+    scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert scheduler._pause_jusqua - time.monotonic() == pytest.approx(360, abs=1)
+
+
+def test_429_rejoue_apres_retry_after_ms(pauses):
+    erreur = ErreurAPIFactice(429, {"retry-after-ms": "250", **entetes_quota(0, reset="20ms")})
+    openai_client = FakeOpenAI(repondre=reponses(erreur, erreur, "valeur"))
+    scheduler = OpenAIScheduler(openai_client, max_concurrence=8)
+    response = scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert response.choices[0].message.content == "valeur"
+    assert pauses == [0.25, 0.25]
+    stats = scheduler.stats.as_dict()
+    assert (stats["requetes"], stats["reprises"], stats["erreurs_quota"], stats["echecs"]) == (1, 2, 2, 0)
+    # AIMD : 8 -> 4 -> 2 sur les 429, puis +1/2 sur le succès
+    assert scheduler.concurrence == 2
+    # Les en-têtes de la réponse 429 ont fait connaître la limite de requêtes
+    assert scheduler._requetes.capacite == 1000
+
+
+def test_retry_after_en_secondes_puis_backoff(pauses):
+    openai_client = FakeOpenAI(repondre=reponses(ErreurAPIFactice(503, {"retry-after": "3"}), ErreurAPIFactice(500), "valeur"))
+    scheduler = OpenAIScheduler(openai_client, backoff_base=2.0)
+    scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert pauses[0] == 3.0
+    # Sans retry-after : backoff exponentiel avec jitter (tentative 1 : au plus 2 * 2 ** 1 s)
+    assert 0 <= pauses[1] <= 4.0
+    assert scheduler.stats.erreurs_quota == 0
+    assert scheduler.concurrence == 16
+
+
+def test_erreur_definitive_ou_reprises_epuisees(pauses):
+    scheduler = OpenAIScheduler(FakeOpenAI(repondre=reponses(ErreurAPIFactice(400))))
+    with pytest.raises(ErreurAPIFactice):
+        scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert (scheduler.stats.echecs, scheduler.stats.reprises, pauses) == (1, 0, [])
+
+    erreur = ErreurAPIFactice(429, {"retry-after-ms": "1"})
+    scheduler = OpenAIScheduler(FakeOpenAI(repondre=reponses(*[erreur] * 3)), max_retries=2)
+    with pytest.raises(ErreurAPIFactice):
+        scheduler.chat.completions.create(model="m", messages=MESSAGES)
+    assert (scheduler.stats.echecs, scheduler.stats.reprises, scheduler.concurrence) == (1, 2, 2)
+
+
+@pytest.mark.parametrize("valeur, secondes", [("1s", 1), ("6m0s", 360), ("20ms", 0.02), ("1h2m3.5s", 3723.5)])
+def test_duree_reset(valeur, secondes):
+    assert _duree_reset(valeur) == pytest.approx(secondes)
+    assert _duree_reset("") is None
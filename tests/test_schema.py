@@ -0,0 +1,53 @@
+import pytest
+
+from backend.GET import schema as module_schema
+from backend.GET.schema import construire_schema, get_schema, rafraichir_schema
+from backend.GET.main import date_maj_index
+
+from conftest import INDEX, lancer
+from fakes import FakeOpenAI
+
+
+@pytest.fixture
+def schema(algolia):
+    """Schéma complet de l'index factice, avec un état du module propre au test."""
+
+    for etat in (module_schema._schemas, module_schema._constructions, module_schema._verifications, module_schema._ecritures):
+        etat.clear()
+    yield construire_schema(INDEX, date_maj_index(INDEX))
+    for etat in (module_schema._schemas, module_schema._verifications, module_schema._ecritures):
+        etat.clear()
+
+
+def nb_parcours(algolia):
+    return [appel for appel, _ in algolia.appels].count("browse")
+
+
+def verifier():
+    # Ignore le délai entre deux lectures de la date de l'index
+    module_schema._verifications.clear()
+    return rafraichir_schema(INDEX)
+
+
+def test_ecritures_de_l_application_reportees_sans_reparcours(algolia, schema):
+    assert schema.complet and "description" not in schema
+    lancer(algolia, FakeOpenAI())
+
+    assert verifier() is False
+    assert nb_parcours(algolia) == 1
+    courant = get_schema(INDEX, rafraichir=False)
+    assert courant.index_maj_le == date_maj_index(INDEX)
+    assert courant.taux_remplissage("description") == 1.0
+    # Le schéma mis à jour est aussi celui relu sur disque
+    module_schema._schemas.clear()
+    assert "description" in get_schema(INDEX, rafraichir=False)
+
+
+def test_changement_exterieur_reconstruit_le_schema(algolia, schema):
+    algolia.partial_update_objects(INDEX, [{"objectID": "0", "couleur": "rouge"}])
+
+    assert verifier() is True
+    for fil in list(module_schema._constructions.values()):
+        fil.join()
+    assert nb_parcours(algolia) == 2
+    assert "couleur" in get_schema(INDEX, rafraichir=False)
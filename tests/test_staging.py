@@ -0,0 +1,45 @@
+from backend.POST.staging import StagingStore
+
+from fakes import FakeOpenAI
+from conftest import INDEX, lancer
+
+
+def test_simulation_puis_validation(algolia):
+    for i in range(4):
+        algolia.objets[INDEX][str(i)]["description"] = "valeur"
+    openai_client = FakeOpenAI(repondre=lambda model, messages: "OK" if "réponds uniquement" in messages[-1]["content"] else "valeur")
+    resume = lancer(algolia, openai_client, {"index_name": INDEX, "simulation": True}, simulation=True)["simulation"]
+    assert (resume["total"], resume["modifies"], resume["inchanges"], resume["ecrits"]) == (10, 6, 4, 0)
+    assert "description" not in algolia.objets[INDEX]["7"]
+
+    staging = StagingStore(resume["run_id"], INDEX)
+    try:
+        assert staging.valider() == 6
+        rapport = staging.rapport()
+    finally:
+        staging.close()
+    assert rapport["ecrits"] == 6
+    assert algolia.objets[INDEX]["7"]["description"] == "valeur"
+    assert [appel for appel, _ in algolia.appels].count("partial_update_objects") == 1
+
+
+def test_validation_enregistre_les_empreintes(algolia):
+    resume = lancer(
+        algolia, FakeOpenAI(), {"index_name": INDEX, "simulation": True}, simulation=True, ignorer_inchanges=True
+    )["simulation"]
+    staging = StagingStore(resume["run_id"], INDEX)
+    try:
+        staging.valider()
+    finally:
+        staging.close()
+
+    # Le run réel suivant ne régénère pas les valeurs validées
+    openai_client = FakeOpenAI()
+    assert lancer(algolia, openai_client, ignorer_inchanges=True)["nb_inchanges"] == 10
+    assert openai_client.appels == []
+
+    # Une nouvelle simulation compte les produits ignorés parmi les inchangés
+    resume = lancer(
+        algolia, openai_client, {"index_name": INDEX, "simulation": True}, simulation=True, ignorer_inchanges=True
+    )["simulation"]
+    assert (resume["total"], resume["modifies"], resume["inchanges"]) == (10, 0, 10)